@@ -1,10 +1,280 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict, deque
+
 import flask
-from flask import Flask, render_template, flash
+from flask import Flask, Response, render_template, flash, stream_with_context
+
+import byte_drawer
+from byte_drawer import Drawer
+from byte_drawer.budget import Budget, CancellationToken
+from byte_drawer.stats import DrawingStats, RunningStats
+from byte_drawer.incremental import IncrementalParser
+from byte_drawer.streaming import iter_batches
+
+
+class DrawRequest(flask.Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        # uploads go to disk whatever their size, so a batch of them is never held in memory
+        return tempfile.TemporaryFile("wb+")
 
-from byte_drawer import Processor
 
 app = Flask(__name__)
+app.request_class = DrawRequest
 app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
+# admins send this in an X-Admin-Token header, e.g. to profile a request, unset disables them
+app.config["ADMIN_TOKEN"] = os.environ.get("BYTE_DRAWER_ADMIN_TOKEN")
+
+# streams longer than this many characters are drawn progressively over server-sent events
+STREAMING_THRESHOLD = 4096
+STREAM_BATCH_SIZE = 500
+STREAM_MAX_LATENCY = 0.05
+
+# drawings are a pure function of their stream, so rendered results can be cached for long
+CACHE_MAX_AGE = 86400
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+GZIP_ETAG_SUFFIX = "-gzip"
+COMPRESSIBLE_MIMETYPES = {"text/html", "application/json", "text/plain"}
+
+# limits on the work a single request can make a worker do
+DRAW_BUDGET = Budget(
+    max_input_bytes=4 * 1024 * 1024,
+    max_commands=500000,
+    max_segments=1000000,
+    max_seconds=10.0,
+    max_result_bytes=256 * 1024 * 1024,
+)
+
+# drawers are reentrant, so every request thread shares this one
+DRAWER = Drawer(budget=DRAW_BUDGET)
+
+# /api/draw/batch draws on a shared pool, each batch keeps at most BATCH_WINDOW streams in flight
+BATCH_WORKERS = 4
+BATCH_WINDOW = 16
+MAX_BATCH_ITEMS = 10000
+# room for the JSON around a stream on one NDJSON line
+BATCH_LINE_OVERHEAD = 4096
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+# profiled requests run one at a time, so profiling never piles up on a worker
+PROFILE_TOP = 25
+_profile_slot = threading.BoundedSemaphore(1)
+
+# recently edited streams per browser session, least recently used sessions are dropped
+MAX_SESSION_PARSERS = 128
+_session_parsers = OrderedDict()
+_session_parsers_lock = threading.Lock()
+
+
+def _css_color(color):
+    return "rgba({}, {}, {}, {:.3g})".format(color.r, color.g, color.b, color.a / 255)
+
+
+def _line_traces(lines):
+    """
+    Flatten lines into one x/y coordinate array pair per color, with null separators
+    between disconnected runs
+
+    :param lines: [Line]
+    :return: dict: css color -> {"x": [], "y": []}
+    """
+    traces = dict()
+    last_points = dict()
+    css_colors = dict()
+    for line in lines:
+        color = css_colors.get(line.color)
+        if color is None:
+            color = css_colors[line.color] = _css_color(line.color)
+        trace = traces.get(color)
+        if trace is None:
+            trace = traces[color] = {"x": [], "y": []}
+        last_point = last_points.get(color)
+        if (
+            last_point is None
+            or last_point.x != line.start_point.x
+            or last_point.y != line.start_point.y
+        ):
+            if last_point is not None:
+                trace["x"].append(None)
+                trace["y"].append(None)
+            trace["x"].append(line.start_point.x)
+            trace["y"].append(line.start_point.y)
+        trace["x"].append(line.finish_point.x)
+        trace["y"].append(line.finish_point.y)
+        last_points[color] = line.finish_point
+    return traces
+
+
+def _point_arrays(points):
+    return {"x": [point.x for point in points], "y": [point.y for point in points]}
+
+
+def _canvas_range(canvas):
+    return {
+        "min_x": canvas.min_x - 300,
+        "max_x": canvas.max_x + 300,
+        "min_y": canvas.min_y - 300,
+        "max_y": canvas.max_y + 300,
+    }
+
+
+def _fitted_range(stats, canvas):
+    """
+    :param stats: DrawingStats
+    :param canvas: Canvas: framed instead when nothing was drawn
+    :return: dict: plot range tightly framing the drawing
+    """
+    return stats.viewport() or _canvas_range(canvas)
+
+
+def _server_sent_event(event, data):
+    return "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+
+
+def _drawing(bytes, parse=None):
+    """
+    Process a byte stream into everything the views need to show it
+
+    :param bytes: str: raw un-decoded op codes
+    :param parse: callable: str -> parsed Drawer, defaults to the shared DRAWER
+    :return: dict
+    """
+    if parse is None:
+        drawer = DRAWER.draw(bytes)
+    else:
+        drawer = parse(bytes)
+    stats = DrawingStats.from_drawer(drawer)
+    return {
+        "pen_up_points": _point_arrays(drawer.pen_up_points),
+        "pen_down_points": _point_arrays(drawer.pen_down_points),
+        "traces": _line_traces(drawer.draw_lines),
+        "canvas_range": _fitted_range(stats, drawer.canvas),
+        "commands_ops": drawer.result,
+        "stats": stats.as_dict(),
+    }
+
+
+def _session_parser():
+    """
+    The editor's incremental parser for this browser session, so re-drawing after an edit
+    only decodes what changed
+    """
+    session_id = flask.session.get("parser_id")
+    if session_id is None:
+        session_id = flask.session["parser_id"] = uuid.uuid4().hex
+    with _session_parsers_lock:
+        parser = _session_parsers.pop(session_id, None)
+        if parser is None:
+            parser = IncrementalParser(budget=DRAW_BUDGET)
+        _session_parsers[session_id] = parser
+        while len(_session_parsers) > MAX_SESSION_PARSERS:
+            _session_parsers.popitem(last=False)
+    return parser
+
+
+# part of every ETag, bump it whenever a stream renders differently, e.g. _drawing or
+# index.html changes, so HTTP caches drop what they hold. TestApp pins what each value renders.
+RENDER_FORMAT = 1
+
+
+def _render_drawing(bytes, parse=None, cacheable=False):
+    """
+    :param cacheable: bool: the page is shared through public caches, so leave out anything
+        read from the session, e.g. flashed messages
+    """
+    if len(bytes) > STREAMING_THRESHOLD:
+        # large streams render an empty plot that fetches its geometry from /stream
+        return render_template(
+            "index.html",
+            bytes=bytes,
+            show_grid=True,
+            stream=True,
+            canvas_range=_canvas_range(Drawer.default_canvas),
+            cacheable=cacheable,
+        )
+    return render_template(
+        "index.html",
+        bytes=bytes,
+        show_grid=True,
+        cacheable=cacheable,
+        **_drawing(bytes, parse)
+    )
+
+
+def _stream_etag(bytes):
+    """
+    A drawing only depends on its byte stream, the drawer that processed it and how it is
+    rendered
+
+    :param bytes: str: raw un-decoded op codes
+    :return: str: strong entity tag, unquoted
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        "{}/{}".format(byte_drawer.__version__, RENDER_FORMAT).encode("utf-8")
+    )
+    digest.update(b"\0")
+    digest.update(bytes.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _not_modified(etag):
+    """
+    :param etag: str
+    :return: Response: 304 if the client already holds this entity in any encoding, else None
+    """
+    for candidate in (etag, etag + GZIP_ETAG_SUFFIX):
+        if flask.request.if_none_match.contains(candidate):
+            response = Response(status=304)
+            return _cacheable(response, candidate)
+    return None
+
+
+def _cacheable(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age={}".format(CACHE_MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.after_request
+def compress(response):
+    """
+    gzip sizeable text responses for clients that accept it
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        "gzip" not in flask.request.headers.get("Accept-Encoding", "").lower()
+        or not 200 <= response.status_code < 300
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag:
+        # a strong etag names one representation, so the compressed one gets its own
+        response.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+    return response
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -15,26 +285,7 @@ def index():
                 "example_bytes"
             )
             if bytes:
-                processor = Processor(draw_input_stream=bytes, display=False)
-                return render_template(
-                    "index.html",
-                    bytes=bytes,
-                    show_grid=True,
-                    pen_up_points=[
-                        point.__dict__ for point in processor.parser.pen_up_points
-                    ],
-                    pen_down_points=[
-                        point.__dict__ for point in processor.parser.pen_down_points
-                    ],
-                    lines=[line.__dict__() for line in processor.parser.draw_lines],
-                    canvas_range={
-                        "min_x": processor.parser.canvas.min_x - 300,
-                        "max_x": processor.parser.canvas.max_x + 300,
-                        "min_y": processor.parser.canvas.min_y - 300,
-                        "max_y": processor.parser.canvas.max_y + 300,
-                    },
-                    commands_ops=processor.parser.result,
-                )
+                return _render_drawing(bytes, parse=_session_parser().parse)
             else:
                 return render_template("index.html", bytes="", show_grid=False)
 
@@ -52,5 +303,335 @@ def index():
         return render_template("index.html", bytes="", show_grid=False)
 
 
+@app.route("/draw", methods=["GET"])
+def draw():
+    """
+    Cacheable render of a byte stream, e.g. for the examples
+    """
+    bytes = flask.request.args.get("bytes")
+    if not bytes:
+        return flask.redirect(flask.url_for("index"))
+
+    etag = _stream_etag(bytes)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        return _cacheable(
+            flask.make_response(_render_drawing(bytes, cacheable=True)), etag
+        )
+    except (ValueError, RuntimeError) as err:
+        flash("Something went wrong! {}".format(err))
+    except Exception:
+        flash("Something unknown went wrong! Were on it!")
+    return render_template("index.html", bytes=bytes, show_grid=False)
+
+
+def _is_admin():
+    token = app.config.get("ADMIN_TOKEN")
+    sent = flask.request.headers.get("X-Admin-Token")
+    return bool(token and sent) and hmac.compare_digest(
+        token.encode("utf-8"), sent.encode("utf-8")
+    )
+
+
+def _profiled_drawing(bytes):
+    """
+    :param bytes: str: raw un-decoded op codes
+    :return: Response: the drawing's JSON along with a profile of drawing it, never cached
+    """
+    from byte_drawer.profiling import SamplingProfiler
+
+    if not _profile_slot.acquire(blocking=False):
+        return flask.jsonify(error="another request is being profiled"), 503
+    try:
+        profiler = SamplingProfiler()
+        drawing = profiler.run(_drawing, bytes)
+    except (ValueError, RuntimeError) as err:
+        return flask.jsonify(error=str(err)), 400
+    except Exception:
+        return flask.jsonify(error="Something unknown went wrong! Were on it!"), 500
+    finally:
+        _profile_slot.release()
+
+    drawing["profile"] = {
+        "samples": profiler.samples,
+        "interval": profiler.interval,
+        "top": [
+            {"function": label, "self": own, "total": total}
+            for label, own, total in profiler.top(PROFILE_TOP)
+        ],
+        "collapsed": profiler.collapsed(),
+    }
+    response = flask.jsonify(**drawing)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/api/draw", methods=["GET"])
+def api_draw():
+    """
+    Cacheable JSON result of a byte stream, admins can add profile=1 to see where drawing it
+    spends its time
+    """
+    bytes = flask.request.args.get("bytes")
+    if not bytes:
+        return flask.jsonify(error="missing bytes parameter"), 400
+    if flask.request.args.get("profile") == "1":
+        if not _is_admin():
+            return flask.jsonify(error="profiling is only available to admins"), 403
+        return _profiled_drawing(bytes)
+
+    etag = _stream_etag(bytes)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        drawing = _drawing(bytes)
+    except (ValueError, RuntimeError) as err:
+        return flask.jsonify(error=str(err)), 400
+    except Exception:
+        return flask.jsonify(error="Something unknown went wrong! Were on it!"), 500
+    return _cacheable(flask.jsonify(**drawing), etag)
+
+
+def _batch_executor():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _batch_pool = ThreadPoolExecutor(
+                max_workers=BATCH_WORKERS, thread_name_prefix="batch"
+            )
+    return _batch_pool
+
+
+def _ndjson_items(stream):
+    """
+    Read batch items one line at a time, a line is either a JSON string of op codes or an
+    object with a bytes string and an optional id
+
+    :param stream: binary file object: request body
+    :return: generator of (id, str, str): item id, its op codes and an error message
+    """
+    limit = DRAW_BUDGET.max_input_bytes + BATCH_LINE_OVERHEAD
+    while True:
+        line = stream.readline(limit + 1)
+        if not line:
+            return
+        if len(line) > limit and not line.endswith(b"\n"):
+            # drop the rest of an oversized line without holding it
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(limit)
+            yield None, None, "item is longer than {} bytes".format(limit)
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None, None, "item is not valid JSON"
+            continue
+        if isinstance(item, str):
+            yield None, item, None
+        elif isinstance(item, dict) and isinstance(item.get("bytes"), str):
+            yield item.get("id"), item["bytes"], None
+        else:
+            yield (
+                item.get("id") if isinstance(item, dict) else None,
+                None,
+                "item must be a string or an object with a bytes string",
+            )
+
+
+def _upload_items(files):
+    """
+    :param files: MultiDict: uploaded files, one stream of op codes each
+    :return: generator of (id, str, str): file name, its op codes and an error message
+    """
+    for name, upload in files.items(multi=True):
+        item_id = upload.filename or name
+        # one byte past the budget is enough for the drawer to reject it
+        data = upload.stream.read(DRAW_BUDGET.max_input_bytes + 1)
+        upload.close()
+        try:
+            yield item_id, data.decode("utf-8").strip(), None
+        except UnicodeDecodeError:
+            yield item_id, None, "file is not UTF-8 text"
+
+
+def _batch_result(bytes, cancel_token):
+    drawer = DRAWER.draw(bytes, cancel_token=cancel_token)
+    return {
+        "commands": drawer.result,
+        "stats": DrawingStats.from_drawer(drawer).as_dict(),
+    }
+
+
+def _batch_line(index, item_id, future, error):
+    line = {"index": index, "id": item_id}
+    if future is not None:
+        try:
+            line.update(future.result())
+        except (ValueError, RuntimeError) as err:
+            error = "Something went wrong! {}".format(err)
+        except Exception:
+            error = "Something unknown went wrong! Were on it!"
+    if error is not None:
+        line["error"] = error
+    return json.dumps(line) + "\n"
+
+
+def _read_items(items, events, window, stopped):
+    """
+    Read batch items on a thread of their own, so results are written while the client is
+    still sending the rest of its batch
+
+    :param items: generator of (id, str, str): see _ndjson_items
+    :param events: queue.Queue: gets ("item", item) for each item, then ("end", None)
+    :param window: threading.Semaphore: acquired per item, released as each result is written
+    :param stopped: threading.Event: set when nothing more will be read
+    """
+    try:
+        for item in items:
+            window.acquire()
+            if stopped.is_set():
+                return
+            events.put(("item", item))
+    except Exception:
+        # the body broke off, e.g. the client went away, answer what was read
+        pass
+    finally:
+        events.put(("end", None))
+
+
+@app.route("/api/draw/batch", methods=["POST"])
+def api_draw_batch():
+    """
+    Draw many byte streams in one request, posted as NDJSON lines or as a multipart upload of
+    files. Results are streamed back as NDJSON in request order, each line as soon as it and
+    every line before it are done.
+    """
+    pool = _batch_executor()
+
+    def generate():
+        # the body is only read from here, as the request is closed, along with any uploaded
+        # files, between the view returning and its response being streamed
+        if flask.request.mimetype == "multipart/form-data":
+            items = _upload_items(flask.request.files)
+        else:
+            items = _ndjson_items(flask.request.stream)
+        # items read, finished drawings and the end of the body, in the order they happen
+        events = queue.Queue()
+        window = threading.Semaphore(BATCH_WINDOW)
+        stopped = threading.Event()
+        threading.Thread(
+            target=_read_items,
+            args=(items, events, window, stopped),
+            name="batch-reader",
+            daemon=True,
+        ).start()
+        # (index, id, future, error, cancel token) of items not yet written, oldest first
+        pending = deque()
+        index = 0
+        reading = True
+        try:
+            while reading or pending:
+                while pending and (pending[0][2] is None or pending[0][2].done()):
+                    yield _batch_line(*pending.popleft()[:4])
+                    window.release()
+                if not (reading or pending):
+                    break
+                event, item = events.get()
+                if event == "end":
+                    reading = False
+                elif event == "item" and reading:
+                    item_id, bytes, error = item
+                    if index == MAX_BATCH_ITEMS:
+                        error = "batch is limited to {} items".format(MAX_BATCH_ITEMS)
+                        pending.append((index, None, None, error, None))
+                        reading = False
+                        stopped.set()
+                        continue
+                    cancel_token = CancellationToken()
+                    future = None
+                    if error is None:
+                        future = pool.submit(_batch_result, bytes, cancel_token)
+                        future.add_done_callback(lambda _: events.put(("done", None)))
+                    pending.append((index, item_id, future, error, cancel_token))
+                    index += 1
+        finally:
+            stopped.set()
+            # let the reader see it is stopped rather than wait on the window
+            window.release()
+            # the client went away, stop drawing what it will never read
+            for _, _, future, _, cancel_token in pending:
+                if future is not None:
+                    future.cancel()
+                    cancel_token.cancel()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/stream", methods=["POST"])
+def stream():
+    """
+    Draw a byte stream incrementally, pushing geometry and command batches as server-sent events
+    """
+    bytes = flask.request.values.get("bytes")
+
+    def generate():
+        # the drawer runs in this generator, between batches, so a client going away closes it
+        # and stops the drawing at the next batch without needing a cancel token
+        try:
+            drawer = Drawer(arg_stream=bytes, budget=DRAW_BUDGET)
+            # batches are drained from the drawer, so reduce them to the stats as they pass
+            running = RunningStats(drawer.canvas)
+            for batch in iter_batches(
+                drawer, batch_size=STREAM_BATCH_SIZE, max_latency=STREAM_MAX_LATENCY
+            ):
+                running.extend(batch.commands)
+                yield _server_sent_event(
+                    "batch",
+                    {
+                        "commands": [command.raw_command for command in batch.commands],
+                        "lines": _line_traces(batch.draw_lines),
+                        "pen_up_points": _point_arrays(batch.pen_up_points),
+                        "pen_down_points": _point_arrays(batch.pen_down_points),
+                    },
+                )
+            stats = running.stats(clipped_segments=drawer.clipped_segments)
+            yield _server_sent_event(
+                "stats",
+                {
+                    "stats": stats.as_dict(),
+                    "canvas_range": _fitted_range(stats, drawer.canvas),
+                },
+            )
+            yield _server_sent_event("done", {})
+        except (ValueError, RuntimeError) as err:
+            yield _server_sent_event(
+                "error", {"message": "Something went wrong! {}".format(err)}
+            )
+        except Exception:
+            yield _server_sent_event(
+                "error", {"message": "Something unknown went wrong! Were on it!"}
+            )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     app.run()
@@ -1,8 +1,47 @@
-import argparse
+import sys
 
-from byte_drawer import TestRunner, Processor
+from byte_drawer import Processor
+
+
+class Arguments(object):
+    """
+    Stand in for argparse's Namespace when the command line is simple enough to read by hand
+    """
+
+    def __init__(self, **kwargs):
+        self.encode = None
+        self.decode = None
+        self.test = False
+        self.draw_stream = None
+        self.draw_file = None
+        self.serve_stdin = False
+        self.animate = None
+        self.fps = 10.0
+        self.commands_per_frame = 1
+        self.stats = False
+        self.optimize_travel = False
+        self.archive = None
+        self.archive_codec = "zlib"
+        self.extract = None
+        self.profile_out = None
+        self.serve_tcp = None
+        self.raw_bytes = False
+        self.__dict__.update(kwargs)
+
+
+# single command invocations we can answer without building the argparse tree,
+# as the cli is commonly called from shell loops
+FAST_OPTIONS = {
+    "--encode": ("encode", 1),
+    "--decode": ("decode", 2),
+    "--draw-stream": ("draw_stream", 1),
+    "--draw-file": ("draw_file", 1),
+}
+
+
+def build_parser():
+    import argparse
 
-if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Draw Some Byte Streams!!")
     parser.add_argument(
         "--encode", help="Encode a integer into a Hexadecimal.", nargs=1
@@ -23,18 +62,122 @@ if __name__ == "__main__":
     parser.add_argument(
         "--draw-file", help="draw from a stream of bytes in a text file.", nargs=1
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--animate",
+        help="export a playback of the drawing, .gif, .png (APNG) or a directory of frames.",
+        nargs=1,
+    )
+    parser.add_argument(
+        "--fps", help="frames per second of --animate.", type=float, default=10.0
+    )
+    parser.add_argument(
+        "--commands-per-frame",
+        help="drawer commands played per frame of --animate.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--stats",
+        help="print statistics of the drawing, e.g. its bounding box and ink length.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--optimize-travel",
+        help="reorder the drawing's strokes to cut pen up travel and print the new byte stream.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--archive",
+        help="pack the byte stream into a compressed, block indexed archive file.",
+        nargs=1,
+    )
+    parser.add_argument(
+        "--archive-codec",
+        help="compression of --archive blocks.",
+        choices=["zlib", "lzma"],
+        default="zlib",
+    )
+    parser.add_argument(
+        "--extract", help="print the byte stream stored in an archive file.", nargs=1
+    )
+    parser.add_argument(
+        "--profile-out",
+        help="profile drawing the stream, write its collapsed stacks (flamegraph.pl/speedscope) to this file and print its slowest functions.",
+        nargs=1,
+    )
+    parser.add_argument(
+        "--serve-tcp",
+        help="draw live streams from TCP connections on [HOST:]PORT, answering each with its commands.",
+        nargs=1,
+    )
+    parser.add_argument(
+        "--raw-bytes",
+        help="--serve-tcp connections send raw op code bytes rather than hexadecimal text.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serve-stdin",
+        help="answer one set of the above arguments per stdin line, each answer ends with a blank line.",
+        action="store_true",
+    )
+    return parser
+
 
+def parse_args(argv):
+    """
+    :param argv: [str]: command line arguments without the program name
+    :return: Arguments or argparse.Namespace
+    """
+    if argv and argv[0] in FAST_OPTIONS:
+        name, nargs = FAST_OPTIONS[argv[0]]
+        values = argv[1:]
+        if len(values) == nargs and not any(value.startswith("--") for value in values):
+            return Arguments(**{name: values})
+    return build_parser().parse_args(argv)
+
+
+def run(args):
     try:
         if args.encode:
             Processor(number=int(args.encode[0]))
         elif args.decode:
             Processor(high_byte=args.decode[0], low_byte=args.decode[1])
-        elif args.draw_stream:
-            Processor(draw_input_stream=args.draw_stream[0])
-        elif args.draw_file:
-            Processor(draw_input_file=args.draw_file[0])
+        elif args.draw_stream or args.draw_file:
+            processor_arguments = dict(
+                draw_input_stream=args.draw_stream[0] if args.draw_stream else None,
+                draw_input_file=args.draw_file[0] if args.draw_file else None,
+            )
+            if args.profile_out:
+                processor = profile(processor_arguments, args)
+            else:
+                processor = Processor(**processor_arguments)
+            if args.stats:
+                from byte_drawer.stats import DrawingStats
+
+                print(DrawingStats.from_drawer(processor.parser))
+            if args.optimize_travel:
+                from byte_drawer.optimizer import TravelOptimizer
+
+                plan = TravelOptimizer().optimize(processor.parser)
+                print(plan)
+                print(plan.op_stream)
+            if args.animate:
+                animate(processor.parser, args)
+            if args.archive:
+                archive(processor.parser, args)
+        elif args.extract:
+            from byte_drawer.archive import ArchiveReader
+
+            with ArchiveReader(args.extract[0]) as reader:
+                print(reader.read_stream())
+        elif args.serve_tcp:
+            from byte_drawer.server import serve
+
+            host, _, port = args.serve_tcp[0].rpartition(":")
+            serve(host=host or "127.0.0.1", port=int(port), binary=args.raw_bytes)
         elif args.test:
+            from byte_drawer import TestRunner
+
             TestRunner()
         else:
             print("run program with --help for insight on how to execute")
@@ -42,3 +185,65 @@ if __name__ == "__main__":
         print("ValueError: {}".format(err))
     except RuntimeError as err:
         print("RuntimeError: {}".format(err))
+
+
+def profile(processor_arguments, args):
+    from byte_drawer.profiling import SamplingProfiler
+
+    profiler = SamplingProfiler()
+    processor = profiler.run(Processor, **processor_arguments)
+    profiler.write(args.profile_out[0])
+    print(profiler.table())
+    print("collapsed stacks -> {}".format(args.profile_out[0]))
+    return processor
+
+
+def animate(drawer, args):
+    from byte_drawer.animation import PlaybackExporter
+
+    exporter = PlaybackExporter(
+        drawer, fps=args.fps, commands_per_frame=args.commands_per_frame
+    )
+    frames = exporter.export(args.animate[0])
+    print("animated {} frames -> {}".format(frames, args.animate[0]))
+
+
+def archive(drawer, args):
+    from byte_drawer.archive import write_archive
+
+    blocks = write_archive(
+        drawer.input_steam, args.archive[0], codec=args.archive_codec
+    )
+    print("archived {} blocks -> {}".format(blocks, args.archive[0]))
+
+
+def serve_stdin():
+    """
+    Persistent mode, answer requests line by line from one interpreter
+    """
+    import shlex
+
+    for line in sys.stdin:
+        try:
+            args = parse_args(shlex.split(line))
+        except SystemExit:
+            # argparse already reported the bad request
+            args = None
+        except ValueError as err:
+            print("ValueError: {}".format(err))
+            args = None
+        if args is not None and not args.serve_stdin:
+            try:
+                run(args)
+            except Exception as err:
+                # one bad request must not end the session for every later one
+                print("{}: {}".format(type(err).__name__, err))
+        print("", flush=True)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.serve_stdin:
+        serve_stdin()
+    else:
+        run(args)
@@ -1,5 +1,45 @@
-from .coders import Encoder, Decoder
-from .drawer import Drawer
-from .parser import Parser
-from .processor import Processor
-from .tests import TestRunner
+import importlib
+
+# part of the web app's ETags, so a release also invalidates HTTP caches of its drawings
+__version__ = "1.2.0"
+
+# public names are only imported on first access so `import byte_drawer` stays cheap,
+# e.g. TestRunner pulls in unittest and the geometry pipeline pulls in NumPy
+_lazy_attributes = {
+    "ArchiveReader": ".archive",
+    "ArchiveWriter": ".archive",
+    "Budget": ".budget",
+    "BudgetExceeded": ".budget",
+    "CancellationToken": ".budget",
+    "DrawCancelled": ".budget",
+    "Encoder": ".coders",
+    "Decoder": ".coders",
+    "DrawContext": ".drawer",
+    "Drawer": ".drawer",
+    "DrawingStats": ".stats",
+    "RunningStats": ".stats",
+    "MoveRunCache": ".memo",
+    "AffineTransform": ".geometry",
+    "GeometryPipeline": ".geometry",
+    "Parser": ".parser",
+    "TravelOptimizer": ".optimizer",
+    "DrawServer": ".server",
+    "Processor": ".processor",
+    "SamplingProfiler": ".profiling",
+    "TestRunner": ".tests",
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,436 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from .geometry import Path
+
+
+class Frame:
+    """
+    Abstraction for one encoded step of a playback, the dirty region of the frame buffer
+    """
+
+    def __init__(self, pixels, left, top, delay):
+        """
+        :param pixels: np.ndarray: (height, width) uint8 palette indexes of the region
+        :param left: int: x offset of the region in the frame buffer
+        :param top: int: y offset of the region in the frame buffer
+        :param delay: float: seconds this frame is shown for
+        """
+        self.pixels = pixels
+        self.left = left
+        self.top = top
+        self.delay = delay
+
+
+def _png_chunk(kind, data):
+    """
+    :param kind: bytes: four letter chunk type
+    :param data: bytes
+    """
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    )
+
+
+def _png_image_data(pixels):
+    """
+    zlib compressed scanlines of an indexed image, every line with filter type 0
+
+    :param pixels: np.ndarray: (height, width) uint8
+    """
+    rows = np.zeros((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels
+    return zlib.compress(rows.tobytes(), 6)
+
+
+def _png_palette(palette):
+    return b"".join(bytes(color) for color in palette)
+
+
+def _png_header(width, height):
+    # 8 bit depth, indexed color, deflate, adaptive filtering, no interlace
+    return _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class GifWriter:
+    """
+    Encode frames into an animated GIF as they are produced
+    """
+
+    def __init__(self, file, width, height, palette, frame_count):
+        """
+        :param file: binary file object
+        :param width: int
+        :param height: int
+        :param palette: [(int, int, int)]: at most 256 rgb colors
+        :param frame_count: int: unused, GIF does not need to know it upfront
+        """
+        self.file = file
+        self.bits = max(2, (len(palette) - 1).bit_length())
+        table = list(palette) + [(0, 0, 0)] * ((1 << self.bits) - len(palette))
+
+        self.file.write(b"GIF89a")
+        # logical screen with a global color table
+        self.file.write(
+            struct.pack("<HHBBB", width, height, 0x80 | 0x70 | (self.bits - 1), 0, 0)
+        )
+        self.file.write(b"".join(bytes(color) for color in table))
+        # loop forever
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def add_frame(self, frame):
+        height, width = frame.pixels.shape
+        delay = int(round(frame.delay * 100))
+        # graphic control: keep the previous frame under this one, which makes delta frames work
+        self.file.write(b"\x21\xf9\x04" + struct.pack("<BHBB", 0x04, delay, 0, 0))
+        self.file.write(
+            b"\x2c" + struct.pack("<HHHHB", frame.left, frame.top, width, height, 0)
+        )
+        self.file.write(bytes([self.bits]))
+        data = _lzw_encode(frame.pixels.tobytes(), self.bits)
+        for start in range(0, len(data), 255):
+            block = data[start : start + 255]
+            self.file.write(bytes([len(block)]) + block)
+        self.file.write(b"\x00")
+
+    def close(self):
+        self.file.write(b"\x3b")
+
+
+def _lzw_encode(data, min_code_size):
+    """
+    Variable width LZW as used by GIF image data
+
+    :param data: bytes: palette indexes
+    :param min_code_size: int
+    :return: bytes
+    """
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    output = bytearray()
+    # codes are packed least significant bit first
+    buffer = clear_code
+    buffered_bits = code_size = min_code_size + 1
+    next_code = end_code + 1
+    table = dict()
+    lookup = table.get
+
+    if not data:
+        buffer |= end_code << buffered_bits
+        return (buffer).to_bytes((buffered_bits + code_size + 7) // 8, "little")
+
+    prefix = data[0]
+    for index in data[1:]:
+        key = (prefix << 8) | index
+        code = lookup(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        buffer |= prefix << buffered_bits
+        buffered_bits += code_size
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > (1 << code_size) and code_size < 12:
+                code_size += 1
+        else:
+            buffer |= clear_code << buffered_bits
+            buffered_bits += code_size
+            table.clear()
+            code_size = min_code_size + 1
+            next_code = end_code + 1
+        if buffered_bits >= 64:
+            output += (buffer & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "little")
+            buffer >>= 64
+            buffered_bits -= 64
+        prefix = index
+
+    buffer |= prefix << buffered_bits
+    buffered_bits += code_size
+    buffer |= end_code << buffered_bits
+    buffered_bits += code_size
+    output += buffer.to_bytes((buffered_bits + 7) // 8, "little")
+    return bytes(output)
+
+
+class ApngWriter:
+    """
+    Encode frames into an animated PNG as they are produced
+    """
+
+    def __init__(self, file, width, height, palette, frame_count):
+        """
+        :param file: binary file object
+        :param width: int
+        :param height: int
+        :param palette: [(int, int, int)]: at most 256 rgb colors
+        :param frame_count: int: APNG declares its frame count upfront
+        """
+        self.file = file
+        self.sequence = 0
+        self.frames = 0
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(_png_header(width, height))
+        self.file.write(_png_chunk(b"acTL", struct.pack(">II", frame_count, 0)))
+        self.file.write(_png_chunk(b"PLTE", _png_palette(palette)))
+
+    def add_frame(self, frame):
+        height, width = frame.pixels.shape
+        # delay as a fraction of a second, no disposal and replace the region's pixels
+        self.file.write(
+            _png_chunk(
+                b"fcTL",
+                struct.pack(
+                    ">IIIIIHHBB",
+                    self.sequence,
+                    width,
+                    height,
+                    frame.left,
+                    frame.top,
+                    int(round(frame.delay * 1000)),
+                    1000,
+                    0,
+                    0,
+                ),
+            )
+        )
+        self.sequence += 1
+        data = _png_image_data(frame.pixels)
+        if self.frames == 0:
+            self.file.write(_png_chunk(b"IDAT", data))
+        else:
+            self.file.write(
+                _png_chunk(b"fdAT", struct.pack(">I", self.sequence) + data)
+            )
+            self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        self.file.write(_png_chunk(b"IEND", b""))
+
+
+class PngSequenceWriter:
+    """
+    Write every frame as its own full PNG into a directory
+    """
+
+    def __init__(self, directory, width, height, palette, frame_count):
+        """
+        :param directory: str
+        :param width: int
+        :param height: int
+        :param palette: [(int, int, int)]: at most 256 rgb colors
+        :param frame_count: int
+        """
+        self.directory = directory
+        self.header = _png_header(width, height) + _png_chunk(
+            b"PLTE", _png_palette(palette)
+        )
+        self.name = "frame_{:0%dd}.png" % len(str(max(frame_count - 1, 0)))
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def add_frame(self, frame):
+        path = os.path.join(self.directory, self.name.format(self.frames))
+        with open(path, "wb") as file:
+            file.write(PNG_SIGNATURE)
+            file.write(self.header)
+            file.write(_png_chunk(b"IDAT", _png_image_data(frame.pixels)))
+            file.write(_png_chunk(b"IEND", b""))
+        self.frames += 1
+
+    def close(self):
+        pass
+
+
+class PlaybackExporter:
+    """
+    Export an animation of a parsed Drawer being plotted command by command.
+
+    Frames are drawn onto one persistent frame buffer: every frame step only rasterizes the
+    segments its commands added and only the region they touched is encoded, so export time is
+    linear in segments plus frames.
+    """
+
+    background = (255, 255, 255)
+
+    def __init__(
+        self,
+        drawer,
+        width=512,
+        height=512,
+        fps=10,
+        commands_per_frame=1,
+        max_colors=256,
+        delta=True,
+    ):
+        """
+        :param drawer: Drawer: a drawer that has already been parsed
+        :param width: int: frame width in pixels
+        :param height: int: frame height in pixels
+        :param fps: float: frames per second
+        :param commands_per_frame: int: drawer commands played per frame step
+        :param max_colors: int: quantize the drawing's colors when it uses more than this
+        :param delta: bool: encode only the changed region of every frame
+        """
+        if not 9 <= max_colors <= 256:
+            raise ValueError("max_colors must be between 9 and 256.")
+        self.canvas = drawer.canvas
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.commands_per_frame = max(1, commands_per_frame)
+        self.delta = delta
+        self.command_count = len(drawer.commands)
+
+        path = Path.from_drawer(drawer)
+        ends = path.segment_indexes()
+        self.segments = self._to_pixels(
+            np.hstack([path.points[ends - 1], path.points[ends]])
+        )
+        self.segment_commands = path.command_index[ends]
+        self.palette, color_indexes = self._quantize(path.palette, max_colors)
+        self.segment_colors = color_indexes[path.colors[ends]]
+
+    def __len__(self):
+        """
+        :return: int: number of frames this export produces
+        """
+        return max(1, -(-self.command_count // self.commands_per_frame))
+
+    def _to_pixels(self, segments):
+        """
+        :param segments: np.ndarray: (n, 4) canvas coordinates
+        :return: np.ndarray: (n, 4) pixel coordinates, y growing downwards
+        """
+        scale_x = (self.width - 1) / (self.canvas.max_x - self.canvas.min_x)
+        scale_y = (self.height - 1) / (self.canvas.max_y - self.canvas.min_y)
+        pixels = np.empty_like(segments)
+        pixels[:, 0::2] = (segments[:, 0::2] - self.canvas.min_x) * scale_x
+        pixels[:, 1::2] = (self.canvas.max_y - segments[:, 1::2]) * scale_y
+        return np.clip(
+            np.rint(pixels), 0, [self.width - 1, self.height - 1] * 2
+        ).astype(np.int64)
+
+    def _quantize(self, colors, max_colors):
+        """
+        :param colors: [Color]: the drawing's palette
+        :param max_colors: int
+        :return: ([(int, int, int)], np.ndarray): frame palette with the background first, and
+            the frame palette index of every drawing color
+        """
+        rgb = np.array(
+            [(color.r, color.g, color.b) for color in colors], dtype=np.int64
+        ).reshape(-1, 3)
+        rgb = np.clip(rgb, 0, 255)
+        if len(rgb) + 1 <= max_colors:
+            palette = [self.background] + [tuple(color) for color in rgb.tolist()]
+            return palette, np.arange(1, len(rgb) + 1)
+
+        # uniform cube with as many levels per channel as the palette size allows
+        levels = 2
+        while (levels + 1) ** 3 + 1 <= max_colors:
+            levels += 1
+        steps = np.rint(rgb * (levels - 1) / 255).astype(np.int64)
+        cells = (steps[:, 0] * levels + steps[:, 1]) * levels + steps[:, 2]
+        values = np.linspace(0, 255, levels).round().astype(int).tolist()
+        palette = [self.background] + [
+            (r, g, b) for r in values for g in values for b in values
+        ]
+        return palette, cells + 1
+
+    def _rasterize(self, buffer, segments, colors):
+        """
+        Draw 1 pixel wide lines for all segments at once
+
+        :param buffer: np.ndarray: (height, width) uint8 frame buffer
+        :param segments: np.ndarray: (n, 4) pixel coordinates
+        :param colors: np.ndarray: (n,) palette indexes
+        :return: (int, int, int, int): left, top, right and bottom of the touched region
+        """
+        x0, y0, x1, y1 = segments.T
+        dx = x1 - x0
+        dy = y1 - y0
+        counts = np.maximum(np.abs(dx), np.abs(dy)) + 1
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        steps = np.arange(int(counts.sum())) - starts
+        fraction = steps / np.repeat(np.maximum(counts - 1, 1), counts)
+        xs = np.rint(np.repeat(x0, counts) + fraction * np.repeat(dx, counts)).astype(
+            np.int64
+        )
+        ys = np.rint(np.repeat(y0, counts) + fraction * np.repeat(dy, counts)).astype(
+            np.int64
+        )
+        buffer[ys, xs] = np.repeat(colors, counts)
+        return xs.min(), ys.min(), xs.max(), ys.max()
+
+    def frames(self, delta=None):
+        """
+        :param delta: bool: overrides the exporter's delta setting
+        :return: generator of Frame
+        """
+        if delta is None:
+            delta = self.delta
+        buffer = np.zeros((self.height, self.width), dtype=np.uint8)
+        delay = 1 / self.fps
+        start = 0
+        for frame in range(len(self)):
+            last_command = (frame + 1) * self.commands_per_frame
+            stop = int(np.searchsorted(self.segment_commands, last_command))
+            region = None
+            if stop > start:
+                region = self._rasterize(
+                    buffer, self.segments[start:stop], self.segment_colors[start:stop]
+                )
+            start = stop
+
+            if frame == 0 or not delta:
+                yield Frame(buffer.copy(), 0, 0, delay)
+            elif region is None:
+                # nothing new, a single unchanged pixel keeps the frame's timing
+                yield Frame(buffer[:1, :1].copy(), 0, 0, delay)
+            else:
+                left, top, right, bottom = region
+                pixels = buffer[top : bottom + 1, left : right + 1].copy()
+                yield Frame(pixels, int(left), int(top), delay)
+
+    def export(self, destination):
+        """
+        Encode frames to destination as they are produced, the format follows the name:
+        .gif for GIF, .png or .apng for an animated PNG, anything else is a directory that
+        receives one full PNG per frame.
+
+        :param destination: str
+        :return: int: number of frames written
+        """
+        extension = os.path.splitext(destination)[1].lower()
+        if extension not in (".gif", ".png", ".apng"):
+            # a frame sequence is made of standalone images
+            writer = PngSequenceWriter(destination, *self._writer_arguments())
+            return self._write(writer, self.frames(delta=False))
+
+        writer_class = GifWriter if extension == ".gif" else ApngWriter
+        with open(destination, "wb") as file:
+            writer = writer_class(file, *self._writer_arguments())
+            return self._write(writer, self.frames())
+
+    def _writer_arguments(self):
+        return self.width, self.height, self.palette, len(self)
+
+    def _write(self, writer, frames):
+        count = 0
+        for frame in frames:
+            writer.add_frame(frame)
+            count += 1
+        writer.close()
+        return count
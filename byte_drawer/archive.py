@@ -0,0 +1,498 @@
+import io
+import lzma
+import struct
+import threading
+import zlib
+
+from .canvas import Canvas, Color, Point
+from .drawer import Drawer
+
+MAGIC = b"BDAR"
+VERSION = 1
+
+CODECS = {
+    "zlib": (0, zlib.compress, zlib.decompress),
+    "lzma": (1, lzma.compress, lzma.decompress),
+}
+
+# instruction tags, one instruction is whatever a Drawer handles in one step
+CLEAR = 0
+COLOR = 1
+PEN = 2
+MOVE = 3
+RAW = 4
+
+_HEADER = struct.Struct("<4sBB4d")
+_FOOTER = struct.Struct("<QQQ4s")
+_HEX = ["{:02X}".format(byte) for byte in range(256)]
+_HEX_BYTES = {op_code: byte for byte, op_code in enumerate(_HEX)}
+# coordinate bytes only carry seven bits, anything else has to be stored verbatim
+_PARAMETER_BYTES = {
+    op_code: byte for op_code, byte in _HEX_BYTES.items() if byte < 0x80
+}
+
+
+def _write_varint(out, value):
+    """
+    :param out: bytearray
+    :param value: int: non negative
+    """
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, offset):
+    """
+    :param data: bytes
+    :param offset: int
+    :return: (int, int): the value and the offset just past it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class BlockIndexEntry:
+    """
+    Abstraction for where a block lives in an archive and the drawer state at its first op code,
+    enough to decode the block without any block before it
+    """
+
+    _struct = struct.Struct("<QIIIQQQQQQqqiiiiB")
+
+    def __init__(self, offset, size, raw_size, instructions, snapshot):
+        """
+        :param offset: int: byte offset of the compressed block in the archive
+        :param size: int: compressed size
+        :param raw_size: int: decompressed size
+        :param instructions: int: op code handlings the block is made of
+        :param snapshot: DrawerSnapshot: drawer state before the block's first op code
+        """
+        self.offset = offset
+        self.size = size
+        self.raw_size = raw_size
+        self.instructions = instructions
+        self.op_code_pointer = snapshot.op_code_pointer
+        self.commands = snapshot.commands
+        self.draw_lines = snapshot.draw_lines
+        self.pen_down_points = snapshot.pen_down_points
+        self.pen_up_points = snapshot.pen_up_points
+        self.clipped_segments = snapshot.clipped_segments
+        self.current_point = snapshot.current_point
+        self.color = snapshot.color
+        self.pen_down = snapshot.pen_down
+        self.was_drawing = snapshot.was_drawing
+        self.drawer_out_of_bounds = snapshot.drawer_out_of_bounds
+
+    def pack(self):
+        point = self.current_point
+        flags = (
+            self.pen_down
+            | self.was_drawing << 1
+            | self.drawer_out_of_bounds << 2
+            | (point is not None) << 3
+        )
+        return self._struct.pack(
+            self.offset,
+            self.size,
+            self.raw_size,
+            self.instructions,
+            self.op_code_pointer,
+            self.commands,
+            self.draw_lines,
+            self.pen_down_points,
+            self.pen_up_points,
+            self.clipped_segments,
+            point.x if point is not None else 0,
+            point.y if point is not None else 0,
+            self.color.r,
+            self.color.g,
+            self.color.b,
+            self.color.a,
+            flags,
+        )
+
+    @classmethod
+    def unpack(cls, data, offset):
+        """
+        :param data: bytes
+        :param offset: int
+        :return: (BlockIndexEntry, int): the entry and the offset just past it
+        """
+        values = cls._struct.unpack_from(data, offset)
+        entry = cls.__new__(cls)
+        (
+            entry.offset,
+            entry.size,
+            entry.raw_size,
+            entry.instructions,
+            entry.op_code_pointer,
+            entry.commands,
+            entry.draw_lines,
+            entry.pen_down_points,
+            entry.pen_up_points,
+            entry.clipped_segments,
+        ) = values[:10]
+        x, y, r, g, b, a, flags = values[10:]
+        entry.current_point = Point.intern(x, y) if flags & 8 else None
+        entry.color = Color.intern(r, g, b, a)
+        entry.pen_down = bool(flags & 1)
+        entry.was_drawing = bool(flags & 2)
+        entry.drawer_out_of_bounds = bool(flags & 4)
+        return entry, offset + cls._struct.size
+
+
+def _encode_instruction(op_codes, palette, out):
+    """
+    Append one instruction in its compact form, falling back to its verbatim text whenever the
+    compact form could not give back the exact same op codes
+
+    :param op_codes: [str]: op codes of one drawer step
+    :param palette: dict: color parameter bytes to their index in the palette table
+    :param out: bytearray
+    """
+    head = op_codes[0]
+    parameters = op_codes[1:]
+    if head == "F0" and not parameters:
+        out.append(CLEAR)
+        return
+    if (
+        head == "A0"
+        and len(parameters) == 8
+        and all(op_code in _HEX_BYTES for op_code in parameters)
+    ):
+        key = bytes(_HEX_BYTES[op_code] for op_code in parameters)
+        out.append(COLOR)
+        _write_varint(out, palette.setdefault(key, len(palette)))
+        return
+    if (
+        head == "80"
+        and len(parameters) == 2
+        and all(op_code in _HEX_BYTES for op_code in parameters)
+    ):
+        out.append(PEN)
+        out.extend(_HEX_BYTES[op_code] for op_code in parameters)
+        return
+    if (
+        head == "C0"
+        and len(parameters) % 4 == 0
+        and all(op_code in _PARAMETER_BYTES for op_code in parameters)
+    ):
+        out.append(MOVE)
+        _write_varint(out, len(parameters) // 4)
+        for index in range(0, len(parameters), 2):
+            delta = (
+                (_PARAMETER_BYTES[parameters[index]] << 7)
+                + _PARAMETER_BYTES[parameters[index + 1]]
+                - 8192
+            )
+            _write_varint(out, _zigzag(delta))
+        return
+    text = "".join(op_codes).encode("utf-8")
+    out.append(RAW)
+    _write_varint(out, len(text))
+    out.extend(text)
+
+
+def _decode_instructions(data, palette):
+    """
+    :param data: bytes: a decompressed block
+    :param palette: [bytes]: color parameter bytes
+    :return: str: the block's op codes
+    """
+    parts = list()
+    offset = 0
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag == CLEAR:
+            parts.append("F0")
+        elif tag == COLOR:
+            index, offset = _read_varint(data, offset)
+            parts.append("A0")
+            parts.extend(_HEX[byte] for byte in palette[index])
+        elif tag == PEN:
+            parts.append("80" + _HEX[data[offset]] + _HEX[data[offset + 1]])
+            offset += 2
+        elif tag == MOVE:
+            count, offset = _read_varint(data, offset)
+            parts.append("C0")
+            for _ in range(count * 2):
+                value, offset = _read_varint(data, offset)
+                word = _unzigzag(value) + 8192
+                parts.append(_HEX[word >> 7] + _HEX[word & 0x7F])
+        elif tag == RAW:
+            length, offset = _read_varint(data, offset)
+            parts.append(data[offset : offset + length].decode("utf-8"))
+            offset += length
+        else:
+            raise ValueError("Invalid archive: unknown instruction tag {}.".format(tag))
+    return "".join(parts)
+
+
+class ArchiveWriter:
+    """
+    Abstraction for packing an op code stream into a block indexed archive.
+
+    The stream is stored as the instructions a Drawer steps through: palette indexes for
+    colors and zigzag varint deltas for moves, grouped into independently compressed blocks.
+    The index records the drawer state at the start of every block, so a reader can decode
+    any block on its own.
+    """
+
+    def __init__(self, block_op_codes=65536, codec="zlib", canvas=None):
+        """
+        :param block_op_codes: int: op codes per block, blocks end on the first instruction
+            boundary past it
+        :param codec: str: zlib or lzma
+        :param canvas: Canvas: canvas the block states are recorded on
+        """
+        if codec not in CODECS:
+            raise ValueError(
+                "Unknown archive codec {}, expected one of {}.".format(
+                    codec, ", ".join(sorted(CODECS))
+                )
+            )
+        self.block_op_codes = block_op_codes
+        self.codec = codec
+        self.canvas = canvas or Drawer.default_canvas
+
+    def write(self, stream, destination):
+        """
+        :param stream: str: raw un-decoded op codes
+        :param destination: str or binary file object
+        :return: int: number of blocks written
+        """
+        if isinstance(destination, str):
+            with open(destination, "wb") as file:
+                return self.write(stream, file)
+
+        codec_id, compress, _ = CODECS[self.codec]
+        canvas = self.canvas
+        destination.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                codec_id,
+                canvas.min_x,
+                canvas.max_x,
+                canvas.min_y,
+                canvas.max_y,
+            )
+        )
+        offset = _HEADER.size
+        palette = dict()
+        index = list()
+
+        drawer = Drawer(arg_stream=stream, canvas=canvas)
+        drawer.validate_parameters()
+        raw_op_codes = None
+        snapshot = drawer.snapshot()
+        block = bytearray()
+        instructions = 0
+        start = pointer = 0
+        for next_pointer in drawer.iter_decode():
+            if raw_op_codes is None:
+                raw_op_codes = drawer.raw_op_codes
+            _encode_instruction(raw_op_codes[pointer:next_pointer], palette, block)
+            instructions += 1
+            pointer = next_pointer
+            if pointer - start >= self.block_op_codes or pointer == len(raw_op_codes):
+                data = compress(bytes(block))
+                destination.write(data)
+                index.append(
+                    BlockIndexEntry(
+                        offset, len(data), len(block), instructions, snapshot
+                    )
+                )
+                offset += len(data)
+                snapshot = drawer.snapshot()
+                block = bytearray()
+                instructions = 0
+                start = pointer
+
+        tables = bytearray()
+        _write_varint(tables, len(palette))
+        for key in palette:
+            tables.extend(key)
+        palette_offset = offset
+        index_offset = offset + len(tables)
+        _write_varint(tables, len(index))
+        for entry in index:
+            tables.extend(entry.pack())
+        destination.write(bytes(tables))
+        destination.write(_FOOTER.pack(palette_offset, index_offset, pointer, MAGIC))
+        return len(index)
+
+
+def write_archive(stream, destination, block_op_codes=65536, codec="zlib", canvas=None):
+    """
+    :param stream: str: raw un-decoded op codes
+    :param destination: str or binary file object
+    :return: int: number of blocks written
+    """
+    writer = ArchiveWriter(block_op_codes=block_op_codes, codec=codec, canvas=canvas)
+    return writer.write(stream, destination)
+
+
+class ArchiveReader:
+    """
+    Abstraction for random access to an archive written by ArchiveWriter.
+
+    Only the footer, palette and block index are read up front, blocks are read and
+    decompressed on demand and a range of them can be decoded in parallel.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: str, bytes or seekable binary file object
+        """
+        if isinstance(source, str):
+            self._file = open(source, "rb")
+            self._owns_file = True
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._file = io.BytesIO(source)
+            self._owns_file = False
+        else:
+            self._file = source
+            self._owns_file = False
+        self._lock = threading.Lock()
+
+        magic, version, codec_id, min_x, max_x, min_y, max_y = _HEADER.unpack(
+            self._read(0, _HEADER.size)
+        )
+        if magic != MAGIC:
+            raise ValueError("Invalid archive: bad magic number.")
+        if version != VERSION:
+            raise ValueError("Unsupported archive version {}.".format(version))
+        for name, (known_id, _, decompress) in CODECS.items():
+            if known_id == codec_id:
+                self.codec = name
+                self._decompress = decompress
+                break
+        else:
+            raise ValueError("Invalid archive: unknown codec {}.".format(codec_id))
+        self.canvas = Canvas(
+            *[
+                int(bound) if bound.is_integer() else bound
+                for bound in (min_x, max_x, min_y, max_y)
+            ]
+        )
+
+        self._file.seek(0, io.SEEK_END)
+        end = self._file.tell()
+        palette_offset, index_offset, self.op_codes, magic = _FOOTER.unpack(
+            self._read(end - _FOOTER.size, _FOOTER.size)
+        )
+        if magic != MAGIC:
+            raise ValueError("Invalid archive: bad footer.")
+        tables = self._read(palette_offset, end - _FOOTER.size - palette_offset)
+
+        count, offset = _read_varint(tables, 0)
+        self.palette = [
+            tables[offset + 8 * i : offset + 8 * i + 8] for i in range(count)
+        ]
+        count, offset = _read_varint(tables, index_offset - palette_offset)
+        self.blocks = list()
+        for _ in range(count):
+            entry, offset = BlockIndexEntry.unpack(tables, offset)
+            self.blocks.append(entry)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+
+    def _read(self, offset, size):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def read_block(self, number):
+        """
+        :param number: int: index of the block
+        :return: str: the block's op codes
+        """
+        entry = self.blocks[number]
+        data = self._decompress(self._read(entry.offset, entry.size))
+        if len(data) != entry.raw_size:
+            raise ValueError("Invalid archive: block {} is corrupt.".format(number))
+        return _decode_instructions(data, self.palette)
+
+    def read_block_commands(self, number):
+        """
+        Draw one block on its own, starting from the drawer state recorded in the index
+
+        :param number: int: index of the block
+        :return: [BaseCommand]: commands the block adds to the drawing
+        """
+        entry = self.blocks[number]
+        drawer = Drawer(canvas=self.canvas)
+        context = drawer.context
+        context.raw_op_codes = list(drawer._get_op_codes(self.read_block(number)))
+        context.current_point = entry.current_point
+        context.color = entry.color
+        context.pen_down = entry.pen_down
+        context.was_drawing = entry.was_drawing
+        context.drawer_out_of_bounds = entry.drawer_out_of_bounds
+        context.clipped_segments = entry.clipped_segments
+        while context.current_op_code_pointer < len(context.raw_op_codes):
+            drawer._handle_next_op_code(context)
+        return context.commands
+
+    def _map(self, function, start, stop, max_workers):
+        numbers = range(*slice(start, stop).indices(len(self.blocks)))
+        if max_workers == 1 or len(numbers) < 2:
+            return [function(number) for number in numbers]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(function, numbers))
+
+    def read_stream(self, start=0, stop=None, max_workers=None):
+        """
+        :param start: int: first block
+        :param stop: int: block after the last one, defaults to the end of the archive
+        :param max_workers: int: threads decoding blocks, 1 decodes in the calling thread
+        :return: str: op codes of the block range
+        """
+        return "".join(self._map(self.read_block, start, stop, max_workers))
+
+    def read_commands(self, start=0, stop=None, max_workers=None):
+        """
+        :param start: int: first block
+        :param stop: int: block after the last one, defaults to the end of the archive
+        :param max_workers: int: threads drawing blocks, 1 draws in the calling thread
+        :return: [BaseCommand]: commands of the block range
+        """
+        commands = list()
+        for block_commands in self._map(
+            self.read_block_commands, start, stop, max_workers
+        ):
+            commands.extend(block_commands)
+        return commands
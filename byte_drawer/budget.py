@@ -0,0 +1,181 @@
+import threading
+import time
+
+
+class DrawProgress:
+    """
+    Abstraction for how far a Drawer got before it was stopped
+    """
+
+    def __init__(self, drawer):
+        """
+        :param drawer: Drawer
+        """
+        self.op_code_pointer = getattr(drawer, "current_op_code_pointer", 0)
+        self.op_codes = len(getattr(drawer, "raw_op_codes", ()))
+        self.commands = Budget.commands(drawer)
+        self.segments = Budget.segments(drawer)
+        self.pen_points = Budget.pen_points(drawer)
+        self.result_bytes = Budget.result_bytes(drawer)
+        self.elapsed = time.monotonic() - drawer.started
+
+    def __repr__(self):
+        return "{} of {} op codes, {} commands, {} segments in {:.3f}s".format(
+            self.op_code_pointer,
+            self.op_codes,
+            self.commands,
+            self.segments,
+            self.elapsed,
+        )
+
+
+class DrawInterrupted(RuntimeError):
+    """
+    Raised when a Drawer stops before the end of its stream, carrying its partial progress
+    """
+
+    def __init__(self, message, progress):
+        """
+        :param message: str
+        :param progress: DrawProgress
+        """
+        super(DrawInterrupted, self).__init__(message)
+        self.progress = progress
+
+
+class BudgetExceeded(DrawInterrupted):
+    def __init__(self, limit, progress):
+        """
+        :param limit: str: name of the budget limit that was hit
+        :param progress: DrawProgress
+        """
+        super(BudgetExceeded, self).__init__(
+            "Drawer exceeded its {} budget after {}.".format(limit, progress), progress
+        )
+        self.limit = limit
+
+
+class DrawCancelled(DrawInterrupted):
+    def __init__(self, progress):
+        """
+        :param progress: DrawProgress
+        """
+        super(DrawCancelled, self).__init__(
+            "Drawer was cancelled after {}.".format(progress), progress
+        )
+
+
+class CancellationToken:
+    """
+    Thread safe flag another party, e.g. the web layer, trips to stop a Drawer
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class Budget:
+    """
+    Abstraction for the resources a single Drawer parse may use, None means unlimited.
+
+    Limits are checked every check_interval steps rather than on every one of them, a step
+    being an op code handled or a move point decoded or drawn, so a parse overshoots a limit
+    by about that many steps. Points are counted within a move run, as one run can span the
+    whole stream.
+    """
+
+    # rough resident bytes of one entry in each of a Drawer's result lists
+    COMMAND_BYTES = 200
+    SEGMENT_BYTES = 250
+    POINT_BYTES = 60
+
+    def __init__(
+        self,
+        max_input_bytes=None,
+        max_commands=None,
+        max_segments=None,
+        max_seconds=None,
+        max_result_bytes=None,
+        check_interval=256,
+    ):
+        """
+        :param max_input_bytes: int: length of the raw op code stream
+        :param max_commands: int
+        :param max_segments: int: draw lines, including the canvas borders
+        :param max_seconds: float: wall clock time since the drawer was created
+        :param max_result_bytes: int: approximate resident size of the result lists
+        :param check_interval: int: steps between checks
+        """
+        self.max_input_bytes = max_input_bytes
+        self.max_commands = max_commands
+        self.max_segments = max_segments
+        self.max_seconds = max_seconds
+        self.max_result_bytes = max_result_bytes
+        self.check_interval = check_interval
+
+    @staticmethod
+    def commands(drawer):
+        """
+        :param drawer: Drawer or DrawContext
+        :return: int: commands produced so far, including those drained while streaming as
+            they were produced all the same
+        """
+        return len(drawer.commands) + drawer.drained_commands
+
+    @staticmethod
+    def segments(drawer):
+        return len(drawer.draw_lines) + drawer.drained_draw_lines
+
+    @staticmethod
+    def pen_points(drawer):
+        return (
+            len(drawer.pen_up_points)
+            + len(drawer.pen_down_points)
+            + drawer.drained_pen_points
+        )
+
+    @classmethod
+    def result_bytes(cls, drawer):
+        """
+        :param drawer: Drawer
+        :return: int: approximate size of the results produced so far, were they all kept
+        """
+        return (
+            cls.commands(drawer) * cls.COMMAND_BYTES
+            + cls.segments(drawer) * cls.SEGMENT_BYTES
+            + cls.pen_points(drawer) * cls.POINT_BYTES
+        )
+
+    def check_input(self, drawer, stream):
+        """
+        :param drawer: Drawer
+        :param stream: str: raw un-decoded op codes
+        """
+        if self.max_input_bytes is not None and len(stream) > self.max_input_bytes:
+            raise BudgetExceeded("input bytes", DrawProgress(drawer))
+
+    def check(self, drawer):
+        """
+        :param drawer: Drawer: drawer in the middle of parsing
+        """
+        if self.max_commands is not None and self.commands(drawer) > self.max_commands:
+            raise BudgetExceeded("commands", DrawProgress(drawer))
+        if self.max_segments is not None and self.segments(drawer) > self.max_segments:
+            raise BudgetExceeded("segments", DrawProgress(drawer))
+        if (
+            self.max_seconds is not None
+            and time.monotonic() - drawer.started > self.max_seconds
+        ):
+            raise BudgetExceeded("time", DrawProgress(drawer))
+        if (
+            self.max_result_bytes is not None
+            and Budget.result_bytes(drawer) > self.max_result_bytes
+        ):
+            raise BudgetExceeded("result size", DrawProgress(drawer))
@@ -1,11 +1,22 @@
 class Point:
     """
     Abstraction for holding coordinate values on a Canvas
+
+    Points are immutable so they can be shared, see Point.intern
     """
 
+    __slots__ = ("x", "y")
+
+    # bound on how many distinct points intern will share
+    max_interned = 1024
+    _interned = dict()
+
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, "x", x)
+        object.__setattr__(self, "y", y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Point is immutable")
 
     def __repr__(self):
         return "({}, {})".format(self.x, self.y)
@@ -13,12 +24,37 @@ class Point:
     def __str__(self):
         return "({}, {})".format(self.x, self.y)
 
+    @classmethod
+    def intern(cls, x, y):
+        """
+        Flyweight for frequently repeated points such as canvas corners and the center
+
+        :param x: int
+        :param y: int
+        :return: Point
+        """
+        key = (x, y)
+        point = cls._interned.get(key)
+        if point is None:
+            point = cls(x, y)
+            if len(cls._interned) < cls.max_interned:
+                cls._interned[key] = point
+        return point
+
 
 class Color:
     """
     Abstraction for holding RBGA values for a said color
+
+    Colors are immutable so they can be shared, see Color.intern
     """
 
+    __slots__ = ("r", "g", "b", "a", "_hash")
+
+    # bound on how many distinct colors intern will share
+    max_interned = 4096
+    _interned = dict()
+
     def __init__(self, r, g, b, a):
         """
         :param r: int
@@ -26,10 +62,24 @@ class Color:
         :param b: int
         :param a: int
         """
-        self.r = r
-        self.g = g
-        self.b = b
-        self.a = a
+        object.__setattr__(self, "r", r)
+        object.__setattr__(self, "g", g)
+        object.__setattr__(self, "b", b)
+        object.__setattr__(self, "a", a)
+        object.__setattr__(self, "_hash", hash((r, g, b, a)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Color is immutable")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Color):
+            return NotImplemented
+        return (self.r, self.g, self.b, self.a) == (other.r, other.g, other.b, other.a)
+
+    def __hash__(self):
+        return self._hash
 
     def __repr__(self):
         return "rgba({}, {}, {}, {})".format(self.r, self.g, self.b, self.a)
@@ -37,6 +87,25 @@ class Color:
     def __str__(self):
         return "{} {} {} {}".format(self.r, self.g, self.b, self.a)
 
+    @classmethod
+    def intern(cls, r, g, b, a):
+        """
+        Flyweight so equal colors are usually the same object
+
+        :param r: int
+        :param g: int
+        :param b: int
+        :param a: int
+        :return: Color
+        """
+        key = (r, g, b, a)
+        color = cls._interned.get(key)
+        if color is None:
+            color = cls(r, g, b, a)
+            if len(cls._interned) < cls.max_interned:
+                cls._interned[key] = color
+        return color
+
 
 class Line:
     def __init__(self, start_point, finish_point, color):
@@ -59,19 +128,21 @@ class Line:
 
     def __dict__(self):
         return {
-            "start_point": self.start_point.__dict__,
-            "finish_point": self.finish_point.__dict__,
-            "color": str(self.color.__repr__),
+            "start_point": {"x": self.start_point.x, "y": self.start_point.y},
+            "finish_point": {"x": self.finish_point.x, "y": self.finish_point.y},
+            "color": repr(self.color),
         }
 
 
 class Canvas:
     """
     Abstraction representing what bounds a Drawer Class can draw in
+
+    Canvases are immutable so one can be shared by every Drawer, e.g. Drawer.default_canvas
     """
 
-    center_point = Point(0, 0)
-    default_color = Color(0, 0, 0, 255)
+    center_point = Point.intern(0, 0)
+    default_color = Color.intern(0, 0, 0, 255)
 
     def __init__(self, min_x, max_x, min_y, max_y, default_color=None):
         """
@@ -81,33 +152,34 @@ class Canvas:
         :param min_y: int
         :param max_y: int
         """
-        self.min_x = min_x
-        self.max_x = max_x
-        self.min_y = min_y
-        self.max_y = max_y
-        self.center_point = Canvas.center_point
-        if default_color:
-            self.default_color = default_color
-        else:
-            self.default_color = Canvas.default_color
-        self._set_borders()
-
-    def _set_borders(self):
+        object.__setattr__(self, "min_x", min_x)
+        object.__setattr__(self, "max_x", max_x)
+        object.__setattr__(self, "min_y", min_y)
+        object.__setattr__(self, "max_y", max_y)
+        object.__setattr__(self, "center_point", Canvas.center_point)
+        object.__setattr__(self, "default_color", default_color or Canvas.default_color)
+        object.__setattr__(self, "borders", self._build_borders())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Canvas is immutable")
+
+    def _build_borders(self):
         """
         Make lines out of this instances borders
+
+        :return: (Line): top, right, bottom and left borders
         """
 
-        max_x_max_y = Point(self.max_x, self.max_y)
-        max_x_min_y = Point(self.max_x, self.min_y)
-        min_x_min_y = Point(self.min_x, self.min_y)
-        min_x_max_y = Point(self.min_x, self.max_y)
-        self.borders = list()
-        self.borders.append(Line(min_x_max_y, max_x_max_y, self.default_color))  # Top
-        self.borders.append(Line(max_x_max_y, max_x_min_y, self.default_color))  # Right
-        self.borders.append(
-            Line(max_x_min_y, min_x_min_y, self.default_color)
-        )  # Bottom
-        self.borders.append(Line(min_x_min_y, min_x_max_y, self.default_color))  # Left
+        max_x_max_y = Point.intern(self.max_x, self.max_y)
+        max_x_min_y = Point.intern(self.max_x, self.min_y)
+        min_x_min_y = Point.intern(self.min_x, self.min_y)
+        min_x_max_y = Point.intern(self.min_x, self.max_y)
+        return (
+            Line(min_x_max_y, max_x_max_y, self.default_color),  # Top
+            Line(max_x_max_y, max_x_min_y, self.default_color),  # Right
+            Line(max_x_min_y, min_x_min_y, self.default_color),  # Bottom
+            Line(min_x_min_y, min_x_max_y, self.default_color),  # Left
+        )
 
     def contains_point(self, point):
         """
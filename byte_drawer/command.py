@@ -1,5 +1,5 @@
 from .canvas import Color
-from .coders import Decoder
+from .coders import Encoder, Decoder
 
 
 class BaseCommand(object):
@@ -7,6 +7,8 @@ class BaseCommand(object):
     Abstraction for representing the actions that a Drawer can excute
     """
 
+    _encoded_bytes = dict()
+
     def __init__(self, type, current_point_offset):
         """
         :param type: str
@@ -22,6 +24,15 @@ class BaseCommand(object):
     def _process(self):
         raise NotImplementedError
 
+    def op_codes(self, current_point):
+        """
+        Encode this command back into the op codes it is decoded from
+
+        :param current_point: Point: drawer position before this command, moves are relative to it
+        :return: [str]
+        """
+        raise NotImplementedError
+
     @staticmethod
     def decode_bytes(high_byte, low_byte):
         """
@@ -34,6 +45,25 @@ class BaseCommand(object):
         decoder.parse()
         return decoder.result
 
+    @staticmethod
+    def encode_bytes(number):
+        """
+        Wrapper function to utilize the Encoder Class, the inverse of decode_bytes
+
+        :param number: int
+        :return: [str]: high and low op code bytes
+        """
+        encoded = BaseCommand._encoded_bytes.get(number)
+        if encoded is None:
+            encoder = Encoder(number=number)
+            encoder.validate_parameters()
+            encoder.parse()
+            word = int(encoder.result, base=16)
+            encoded = ("{:02X}".format(word >> 8), "{:02X}".format(word & 0xFF))
+            # bounded by the 16384 encodable numbers
+            BaseCommand._encoded_bytes[number] = encoded
+        return list(encoded)
+
 
 class ClearCommand(BaseCommand):
     def __init__(self):
@@ -42,8 +72,61 @@ class ClearCommand(BaseCommand):
     def _process(self):
         self.raw_command = "CLR;"
 
+    def op_codes(self, current_point):
+        return ["F0"]
+
+
+class Palette(object):
+    """
+    Interning layer mapping the raw CO parameter bytes straight to a shared Color,
+    streams usually cycle through a small palette many times
+    """
+
+    def __init__(self, max_size=4096):
+        """
+        :param max_size: int: bound on distinct parameter bytes remembered
+        """
+        self.max_size = max_size
+        self._colors = dict()
+
+    def __len__(self):
+        return len(self._colors)
+
+    def lookup(self, r_bytes, g_bytes, b_bytes, a_bytes):
+        """
+        :param r_bytes: str
+        :param g_bytes: str
+        :param b_bytes: str
+        :param a_bytes: str
+        :return: (Color, str): the shared color and its raw command
+        """
+        key = (
+            r_bytes[0],
+            r_bytes[1],
+            g_bytes[0],
+            g_bytes[1],
+            b_bytes[0],
+            b_bytes[1],
+            a_bytes[0],
+            a_bytes[1],
+        )
+        entry = self._colors.get(key)
+        if entry is None:
+            color = Color.intern(
+                r=BaseCommand.decode_bytes(high_byte=r_bytes[0], low_byte=r_bytes[1]),
+                g=BaseCommand.decode_bytes(high_byte=g_bytes[0], low_byte=g_bytes[1]),
+                b=BaseCommand.decode_bytes(high_byte=b_bytes[0], low_byte=b_bytes[1]),
+                a=BaseCommand.decode_bytes(high_byte=a_bytes[0], low_byte=a_bytes[1]),
+            )
+            entry = (color, "CO {};".format(color))
+            if len(self._colors) < self.max_size:
+                self._colors[key] = entry
+        return entry
+
 
 class ColorCommand(BaseCommand):
+    palette = Palette()
+
     def __init__(self, r_bytes, g_bytes, b_bytes, a_bytes):
         """
         :param r_bytes: str
@@ -58,25 +141,34 @@ class ColorCommand(BaseCommand):
         self.a_bytes = a_bytes
         super(ColorCommand, self).__init__(type="CO", current_point_offset=9)
 
+    @classmethod
+    def from_color(cls, color):
+        """
+        Build a color command back from an already decoded Color
+
+        :param color: Color
+        :return: ColorCommand
+        """
+        return cls(
+            r_bytes=BaseCommand.encode_bytes(color.r),
+            g_bytes=BaseCommand.encode_bytes(color.g),
+            b_bytes=BaseCommand.encode_bytes(color.b),
+            a_bytes=BaseCommand.encode_bytes(color.a),
+        )
+
     def _process(self):
-        self.color = Color(
-            r=BaseCommand.decode_bytes(
-                high_byte=self.r_bytes[0], low_byte=self.r_bytes[1]
-            ),
-            g=BaseCommand.decode_bytes(
-                high_byte=self.g_bytes[0], low_byte=self.g_bytes[1]
-            ),
-            b=BaseCommand.decode_bytes(
-                high_byte=self.b_bytes[0], low_byte=self.b_bytes[1]
-            ),
-            a=BaseCommand.decode_bytes(
-                high_byte=self.a_bytes[0], low_byte=self.a_bytes[1]
-            ),
+        self.color, self.raw_command = ColorCommand.palette.lookup(
+            self.r_bytes, self.g_bytes, self.b_bytes, self.a_bytes
         )
-        self.raw_command = "CO {};".format(self.color)
+
+    def op_codes(self, current_point):
+        return ["A0"] + list(self.r_bytes + self.g_bytes + self.b_bytes + self.a_bytes)
 
 
 class MoveCommand(BaseCommand):
+    # largest relative step a single move parameter can encode
+    max_step = 8191
+
     def __init__(self, points):
         """
         :param points: [Point]: list of Points this command entails
@@ -87,6 +179,40 @@ class MoveCommand(BaseCommand):
     def _process(self):
         self.raw_command = "MV {};".format(" ".join([str(x) for x in self.points]))
 
+    def op_codes(self, current_point):
+        """
+        Moves longer than max_step are split into evenly spaced steps, rounded to whole units.
+        A Drawer ends a move run on reaching the center, so a new run is started after it.
+        """
+        op_codes = ["C0"]
+        x, y = current_point.x, current_point.y
+        for point in self.points:
+            delta_x, delta_y = point.x - x, point.y - y
+            if (
+                abs(delta_x) <= MoveCommand.max_step
+                and abs(delta_y) <= MoveCommand.max_step
+            ):
+                steps = [(point.x, point.y)]
+            else:
+                count = max(
+                    -(-abs(delta_x) // MoveCommand.max_step),
+                    -(-abs(delta_y) // MoveCommand.max_step),
+                )
+                steps = [
+                    (
+                        x + round(delta_x * step / count),
+                        y + round(delta_y * step / count),
+                    )
+                    for step in range(1, count + 1)
+                ]
+            for step_x, step_y in steps:
+                if x == 0 and y == 0 and op_codes[-1] != "C0":
+                    op_codes.append("C0")
+                op_codes.extend(BaseCommand.encode_bytes(step_x - x))
+                op_codes.extend(BaseCommand.encode_bytes(step_y - y))
+                x, y = step_x, step_y
+        return op_codes
+
 
 class PenCommand(BaseCommand):
     def __init__(self, pen_bytes):
@@ -103,3 +229,35 @@ class PenCommand(BaseCommand):
         else:
             self.raw_command = "PEN DOWN;"
             self.is_down = True
+
+    def op_codes(self, current_point):
+        return ["80"] + list(self.pen_bytes)
+
+
+def encode_commands(commands, center_point):
+    """
+    Encode commands back into a raw op code stream, the inverse of parsing one
+
+    :param commands: [BaseCommand]
+    :param center_point: Point: where the drawer starts and every CLR returns it to
+    :return: str
+    """
+    op_codes = list()
+    current_point = center_point
+    previous = None
+    for command in commands:
+        command_op_codes = command.op_codes(current_point)
+        if (
+            isinstance(command, MoveCommand)
+            and isinstance(previous, MoveCommand)
+            and (current_point.x, current_point.y) != (0, 0)
+        ):
+            # a move run only ends on the next op code or at the center, so continue it
+            command_op_codes = command_op_codes[1:]
+        op_codes.extend(command_op_codes)
+        previous = command
+        if isinstance(command, ClearCommand):
+            current_point = center_point
+        elif isinstance(command, MoveCommand) and command.points:
+            current_point = command.points[-1]
+    return "".join(op_codes)
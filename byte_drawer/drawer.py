@@ -1,56 +1,216 @@
+import sys
+import time
+
 from .canvas import Canvas, Point, Line
 from .command import BaseCommand, PenCommand, MoveCommand, ClearCommand, ColorCommand
+from .memo import MoveRun, MoveRunCache
 from .parser import Parser
 
+# every two digit op code, so a decoded stream holds shared strings rather than one per op code
+_OP_CODES = {
+    code: code
+    for value in range(256)
+    for code in ("{:02X}".format(value), "{:02x}".format(value))
+}
 
-class Drawer(Parser):
+
+class DrawerSnapshot:
     """
-    Abstraction for processing a btye stream and generating draw lines, commands and pen up/down points
-    on a canvas.
+    Abstraction for a Drawer's state at a command boundary, enough to resume decoding from there.
+
+    The result lists only ever grow while parsing, so their lengths stand in for their contents.
     """
 
-    default_canvas = Canvas(-8192, 8191, -8192, 8191)
+    def __init__(self, drawer):
+        """
+        :param drawer: DrawContext: parse state whose op code pointer sits on a command boundary
+        """
+        self.op_code_pointer = drawer.current_op_code_pointer
+        self.current_point = drawer.current_point
+        self.color = drawer.color
+        self.pen_down = drawer.pen_down
+        self.was_drawing = drawer.was_drawing
+        self.drawer_out_of_bounds = drawer.drawer_out_of_bounds
+        self.clipped_segments = drawer.clipped_segments
+        self.commands = len(drawer.commands)
+        self.draw_lines = len(drawer.draw_lines)
+        self.pen_down_points = len(drawer.pen_down_points)
+        self.pen_up_points = len(drawer.pen_up_points)
+
+
+class DrawContext:
+    """
+    Abstraction for the state of a single parse: its position in the op code stream, the pen
+    and everything produced so far.
 
-    def __init__(self, arg_stream=None, draw_file=None, canvas=None):
+    A Drawer only holds configuration that is never mutated while parsing, its canvas and
+    budget, so one Drawer can run many parses at once, each in its own context.
+    """
+
+    def __init__(self, canvas, budget=None, cancel_token=None, borders=False):
         """
-        :param arg_stream: str: raw un-decoded op codes
-        :param draw_file: str: file name to process a byte stream from
-        :param canvas: Canvas: support configurable Canvas
+        :param canvas: Canvas: canvas this parse draws on
+        :param budget: Budget: resource limits for this parse
+        :param cancel_token: CancellationToken: lets another party stop this parse
+        :param borders: bool: start the draw lines with the canvas borders
         """
-        super(Drawer, self).__init__()
+        self.canvas = canvas
+        self.cancel_token = cancel_token
+        self.started = time.monotonic()
+        if budget is not None:
+            self._until_budget_check = budget.check_interval
+        elif cancel_token is not None:
+            self._until_budget_check = Drawer.cancel_check_interval
+        else:
+            self._until_budget_check = sys.maxsize
+        self.raw_op_codes = list()
+        self.current_op_code_pointer = 0
+        # fed input not yet split into op codes, and how far the pending move run is known
+        self.partial_op_code = ""
+        self.move_run_scan = None
         self.commands = list()
-        self.draw_lines = list()
+        self.draw_lines = list(canvas.borders) if borders else list()
         self.pen_down_points = list()
         self.pen_up_points = list()
+        # results already handed out by streaming.drain, the budget still counts them
+        self.drained_commands = 0
+        self.drained_draw_lines = 0
+        self.drained_pen_points = 0
+        self.result = None
         # naive assumptions
         self.current_point = None
         self.was_drawing = False
         self.drawer_out_of_bounds = False
         self.pen_down = False
+        self.color = canvas.default_color
+        # drawn segments cut short at the canvas border
+        self.clipped_segments = 0
 
-        if canvas:
-            self.canvas = canvas
-        else:
-            self.canvas = Drawer.default_canvas
-            for border in self.canvas.borders:
-                self.draw_lines.append(border)
 
-        self.color = self.canvas.default_color
+def _context_attribute(name):
+    """
+    Expose an attribute of a Drawer's own context on the Drawer, for callers written before
+    parse state moved into DrawContext
+    """
+
+    def get(drawer):
+        return getattr(drawer.context, name)
+
+    def set(drawer, value):
+        setattr(drawer.context, name, value)
+
+    return property(get, set)
+
+
+class Drawer(Parser):
+    """
+    Abstraction for processing a btye stream and generating draw lines, commands and pen up/down points
+    on a canvas.
+
+    The drawer's own stream is parsed into its own context by parse(), while draw() parses any
+    stream into a fresh context and is safe to call from many threads at once.
+    """
+
+    default_canvas = Canvas(-8192, 8191, -8192, 8191)
+    # steps, op codes or move points, between cancellation checks when there is no budget
+    cancel_check_interval = 256
+
+    raw_op_codes = _context_attribute("raw_op_codes")
+    current_op_code_pointer = _context_attribute("current_op_code_pointer")
+    commands = _context_attribute("commands")
+    draw_lines = _context_attribute("draw_lines")
+    pen_down_points = _context_attribute("pen_down_points")
+    pen_up_points = _context_attribute("pen_up_points")
+    drained_commands = _context_attribute("drained_commands")
+    drained_draw_lines = _context_attribute("drained_draw_lines")
+    drained_pen_points = _context_attribute("drained_pen_points")
+    current_point = _context_attribute("current_point")
+    was_drawing = _context_attribute("was_drawing")
+    drawer_out_of_bounds = _context_attribute("drawer_out_of_bounds")
+    pen_down = _context_attribute("pen_down")
+    color = _context_attribute("color")
+    clipped_segments = _context_attribute("clipped_segments")
+    started = _context_attribute("started")
+
+    def __init__(
+        self,
+        arg_stream=None,
+        draw_file=None,
+        canvas=None,
+        budget=None,
+        cancel_token=None,
+        move_cache=None,
+    ):
+        """
+        :param arg_stream: str: raw un-decoded op codes
+        :param draw_file: str: file name to process a byte stream from
+        :param canvas: Canvas: support configurable Canvas
+        :param budget: Budget: resource limits for every parse
+        :param cancel_token: CancellationToken: lets another party stop this drawer's own parse
+        :param move_cache: MoveRunCache: decoded move runs shared by every parse, defaults to a
+            new cache of this drawer's own
+        """
+        super(Drawer, self).__init__()
+        self.budget = budget
+        self.move_cache = move_cache if move_cache is not None else MoveRunCache()
+        self.canvas = canvas or Drawer.default_canvas
+        # the default canvas draws its borders along with the drawing
+        self.draw_borders = canvas is None
+        self.context = self.new_context(cancel_token)
 
         if arg_stream:
             self.input_steam = arg_stream
-        else:
+        elif draw_file:
             with open(draw_file, "r") as file:
                 # here would be another place to run validation on the input_file e.g. /n's
-                self.input_steam = file.readline()
+                if budget is not None and budget.max_input_bytes is not None:
+                    # never read more than one byte past the budget
+                    self.input_steam = file.readline(budget.max_input_bytes + 1)
+                else:
+                    self.input_steam = file.readline()
+        else:
+            self.input_steam = None
+
+    def new_context(self, cancel_token=None):
+        """
+        :param cancel_token: CancellationToken
+        :return: DrawContext: empty state for a parse on this drawer's canvas
+        """
+        return DrawContext(
+            self.canvas,
+            budget=self.budget,
+            cancel_token=cancel_token,
+            borders=self.draw_borders,
+        )
 
     def validate_parameters(self):
-        if self.input_steam is None:
+        self._validate_stream(self.context, self.input_steam)
+
+    def _validate_stream(self, context, stream):
+        if stream is None:
             raise RuntimeError("invalid input stream for Drawer")
+        if self.budget is not None:
+            self.budget.check_input(context, stream)
 
     def parse(self):
-        self._decode_input_stream()
-        self.result = [command.raw_command for command in self.commands]
+        self._decode_input_stream(self.context, self.input_steam)
+        self.result = self.context.result = [
+            command.raw_command for command in self.commands
+        ]
+
+    def draw(self, arg_stream, cancel_token=None):
+        """
+        Parse a stream into a fresh context, leaving this drawer untouched
+
+        :param arg_stream: str: raw un-decoded op codes
+        :param cancel_token: CancellationToken: lets another party stop this parse
+        :return: DrawContext: the parsed state with its result set
+        """
+        context = self.new_context(cancel_token)
+        self._validate_stream(context, arg_stream)
+        self._decode_input_stream(context, arg_stream)
+        context.result = [command.raw_command for command in context.commands]
+        return context
 
     def display(self):
         for command in self.result:
@@ -59,36 +219,174 @@ class Drawer(Parser):
     def _out_of_bounds(self, point):
         return not self.canvas.contains_point(point)
 
-    def _decode_input_stream(self):
+    def _decode_input_stream(self, context, stream):
         """
         Start of op code processing.  determind the command code were dealing with then delegate
         """
-        self.raw_op_codes = list(self._get_op_codes())
-        self.current_op_code_pointer = 0
-        while self.current_op_code_pointer < len(self.raw_op_codes):
-            next_op_code = self.raw_op_codes[self.current_op_code_pointer]
-
-            if next_op_code == "F0":
-                self._handle_clear_command()
-            elif next_op_code == "A0":
-                self._handle_color_command()
-            elif next_op_code == "80":
-                self._handle_pen_command()
-            elif next_op_code == "C0":
-                self._handle_move_command()
+        context.raw_op_codes = list(self._get_op_codes(stream))
+        context.current_op_code_pointer = 0
+        while context.current_op_code_pointer < len(context.raw_op_codes):
+            self._handle_next_op_code(context)
+
+    def iter_decode(self):
+        """
+        Incremental version of _decode_input_stream.  Yields after every handled op code so the
+        caller can consume commands, draw lines and pen points as they are produced.
+        """
+        context = self.context
+        context.raw_op_codes = list(self._get_op_codes(self.input_steam))
+        context.current_op_code_pointer = 0
+        while context.current_op_code_pointer < len(context.raw_op_codes):
+            self._handle_next_op_code(context)
+            yield context.current_op_code_pointer
+
+    def feed(self, data, final=False):
+        """
+        Incremental version of parse for a stream arriving in pieces, e.g. from a socket.
+
+        An op code is only handled once everything it takes has arrived, a move run waits for
+        the op code that ends it, so feeding a stream in any number of pieces draws the same as
+        parsing it whole. Handled op codes are dropped, as are the partial results' pointers.
+
+        :param data: str: the next piece of raw un-decoded op codes
+        :param final: bool: nothing follows this piece, handle whatever is left
+        :return: int: number of op codes handled
+        """
+        context = self.context
+        data = context.partial_op_code + data
+        end = len(data) if final else len(data) - len(data) % 2
+        context.partial_op_code = data[end:]
+        context.raw_op_codes.extend(self._get_op_codes(data[:end]))
+
+        while context.current_op_code_pointer < len(context.raw_op_codes) and (
+            final or self._op_code_complete(context)
+        ):
+            self._handle_next_op_code(context)
+        handled = context.current_op_code_pointer
+        del context.raw_op_codes[:handled]
+        context.current_op_code_pointer = 0
+        if context.move_run_scan is not None:
+            # keep how far an unfinished run is known, so the next feed resumes scanning there
+            pointer, scan = context.move_run_scan
+            if pointer < handled:
+                context.move_run_scan = None
             else:
-                # unrecognized command, ignore
-                self.current_op_code_pointer = self.current_op_code_pointer + 1
+                context.move_run_scan = (pointer - handled, scan - handled)
+        return handled
+
+    @staticmethod
+    def _op_code_complete(context):
+        """
+        :return: bool: whether every op code the op code at the pointer takes has arrived
+        """
+        raw_op_codes = context.raw_op_codes
+        pointer = context.current_op_code_pointer
+        op_code = raw_op_codes[pointer]
+        if op_code == "A0":
+            return pointer + 8 < len(raw_op_codes)
+        if op_code == "80":
+            return pointer + 2 < len(raw_op_codes)
+        if op_code == "C0":
+            # a run is only over at the next op code, resume scanning where the last feed left
+            scan = pointer
+            if (
+                context.move_run_scan is not None
+                and context.move_run_scan[0] == pointer
+            ):
+                scan = context.move_run_scan[1]
+            while scan + 1 < len(raw_op_codes) and raw_op_codes[scan + 1] not in (
+                "F0",
+                "A0",
+                "80",
+            ):
+                scan = scan + 4
+            context.move_run_scan = (pointer, scan)
+            return scan + 1 < len(raw_op_codes)
+        return True
+
+    def snapshot(self):
+        """
+        :return: DrawerSnapshot: this drawer's state at its current op code pointer
+        """
+        return DrawerSnapshot(self.context)
+
+    def restore(self, snapshot, source):
+        """
+        Resume from a snapshot taken while source was parsing, skipping every op code before it.
+        This drawer's stream must share source's op codes up to and including the one at the
+        snapshot's pointer, as that is the op code that ended source's previous command.
+
+        :param snapshot: DrawerSnapshot
+        :param source: Drawer: the drawer the snapshot was taken from
+        """
+        context = self.context
+        pointer = snapshot.op_code_pointer
+        context.raw_op_codes = source.raw_op_codes[:pointer]
+        context.raw_op_codes.extend(
+            self.input_steam[index : index + 2]
+            for index in range(pointer * 2, len(self.input_steam), 2)
+        )
+        context.current_op_code_pointer = pointer
+        context.current_point = snapshot.current_point
+        context.color = snapshot.color
+        context.pen_down = snapshot.pen_down
+        context.was_drawing = snapshot.was_drawing
+        context.drawer_out_of_bounds = snapshot.drawer_out_of_bounds
+        context.clipped_segments = snapshot.clipped_segments
+        context.commands = source.commands[: snapshot.commands]
+        context.draw_lines = source.draw_lines[: snapshot.draw_lines]
+        context.pen_down_points = source.pen_down_points[: snapshot.pen_down_points]
+        context.pen_up_points = source.pen_up_points[: snapshot.pen_up_points]
+
+    def _check_budget(self, context):
+        """
+        Stop this parse if it was cancelled or ran out of budget
+        """
+        if context.cancel_token is not None and context.cancel_token.cancelled:
+            from .budget import DrawCancelled, DrawProgress
+
+            raise DrawCancelled(DrawProgress(context))
+        if self.budget is not None:
+            self.budget.check(context)
+            context._until_budget_check = self.budget.check_interval
+        else:
+            context._until_budget_check = Drawer.cancel_check_interval
+
+    def _handle_next_op_code(self, context):
+        """
+        Determine the command code at the op code pointer and delegate
+        """
+        context._until_budget_check -= 1
+        if context._until_budget_check <= 0:
+            self._check_budget(context)
+
+        next_op_code = context.raw_op_codes[context.current_op_code_pointer]
+
+        if next_op_code == "F0":
+            self._handle_clear_command(context)
+        elif next_op_code == "A0":
+            self._handle_color_command(context)
+        elif next_op_code == "80":
+            self._handle_pen_command(context)
+        elif next_op_code == "C0":
+            self._handle_move_command(context)
+        else:
+            # unrecognized command, ignore
+            context.current_op_code_pointer = context.current_op_code_pointer + 1
 
-    def _get_op_codes(self):
+    @staticmethod
+    def _get_op_codes(stream):
         """
         Yield op codes from the given input stream
+
+        :param stream: str: raw un-decoded op codes
         """
-        while self.input_steam:
-            yield self.input_steam[:2]
-            self.input_steam = self.input_steam[2:]
+        op_codes = _OP_CODES
+        for index in range(0, len(stream), 2):
+            op_code = stream[index : index + 2]
+            yield op_codes.get(op_code, op_code)
 
-    def _handle_clear_command(self):
+    def _handle_clear_command(self, context):
         """
         Handle a clear command
 
@@ -97,15 +395,15 @@ class Drawer(Parser):
 
         """
         clear_command = ClearCommand()
-        self.commands.append(clear_command)
-        self.current_op_code_pointer = (
-            self.current_op_code_pointer + clear_command.current_point_offset
+        context.commands.append(clear_command)
+        context.current_op_code_pointer = (
+            context.current_op_code_pointer + clear_command.current_point_offset
         )
-        self.current_color = [0, 0, 0, 225]
-        self.current_point = self.canvas.center_point
-        self.pen_down = False
+        context.current_color = [0, 0, 0, 225]
+        context.current_point = self.canvas.center_point
+        context.pen_down = False
 
-    def _handle_color_command(self):
+    def _handle_color_command(self, context):
         """
         Handle a pen command.
 
@@ -115,30 +413,30 @@ class Drawer(Parser):
 
         """
         r_bytes = [
-            self.raw_op_codes[self.current_op_code_pointer + 1],
-            self.raw_op_codes[self.current_op_code_pointer + 2],
+            context.raw_op_codes[context.current_op_code_pointer + 1],
+            context.raw_op_codes[context.current_op_code_pointer + 2],
         ]
         g_bytes = [
-            self.raw_op_codes[self.current_op_code_pointer + 3],
-            self.raw_op_codes[self.current_op_code_pointer + 4],
+            context.raw_op_codes[context.current_op_code_pointer + 3],
+            context.raw_op_codes[context.current_op_code_pointer + 4],
         ]
         b_bytes = [
-            self.raw_op_codes[self.current_op_code_pointer + 5],
-            self.raw_op_codes[self.current_op_code_pointer + 6],
+            context.raw_op_codes[context.current_op_code_pointer + 5],
+            context.raw_op_codes[context.current_op_code_pointer + 6],
         ]
         a_bytes = [
-            self.raw_op_codes[self.current_op_code_pointer + 7],
-            self.raw_op_codes[self.current_op_code_pointer + 8],
+            context.raw_op_codes[context.current_op_code_pointer + 7],
+            context.raw_op_codes[context.current_op_code_pointer + 8],
         ]
 
         color_command = ColorCommand(r_bytes, g_bytes, b_bytes, a_bytes)
-        self.color = color_command.color
-        self.commands.append(color_command)
-        self.current_op_code_pointer = (
-            self.current_op_code_pointer + color_command.current_point_offset
+        context.color = color_command.color
+        context.commands.append(color_command)
+        context.current_op_code_pointer = (
+            context.current_op_code_pointer + color_command.current_point_offset
         )
 
-    def _handle_pen_command(self):
+    def _handle_pen_command(self, context):
         """
         Handle a pen command.
 
@@ -149,88 +447,203 @@ class Drawer(Parser):
         """
 
         pen_bytes = [
-            self.raw_op_codes[self.current_op_code_pointer + 1],
-            self.raw_op_codes[self.current_op_code_pointer + 2],
+            context.raw_op_codes[context.current_op_code_pointer + 1],
+            context.raw_op_codes[context.current_op_code_pointer + 2],
         ]
         pen_command = PenCommand(pen_bytes)
-        if self.drawer_out_of_bounds and pen_command.is_down:
+        if context.drawer_out_of_bounds and pen_command.is_down:
             raise ValueError(
                 "Invalid Drawer Command: Cannot PEN DOWN while drawer is off the canvas."
             )
-        if not self.current_point and pen_command.is_down:
+        if not context.current_point and pen_command.is_down:
             raise ValueError(
                 "Invalid Drawer Command: Cannot PEN DOWN before setting an initial point."
             )
-        self.commands.append(pen_command)
-        self.current_op_code_pointer = (
-            self.current_op_code_pointer + pen_command.current_point_offset
+        context.commands.append(pen_command)
+        context.current_op_code_pointer = (
+            context.current_op_code_pointer + pen_command.current_point_offset
         )
-        self.pen_down = pen_command.is_down
-        if self.pen_down:
-            self.pen_down_points.append(self.current_point)
+        context.pen_down = pen_command.is_down
+        if context.pen_down:
+            context.pen_down_points.append(context.current_point)
         else:
-            self.pen_up_points.append(self.current_point)
+            context.pen_up_points.append(context.current_point)
 
-    def _handle_move_command(self):
+    def _handle_move_command(self, context):
         """
         Handle a pen command.
 
         - Build a list of move points based off the next 4 op code bytes for each loop
         - Handle cases for termination
-        - run subroutine to update self.commands based off new points list
+        - run subroutine to update context.commands based off new points list
+
+        """
+        if context.current_op_code_pointer + 1 < len(context.raw_op_codes):
+            run, cached = self._cached_move_run(context)
+            if (
+                run is not None
+                and not context.drawer_out_of_bounds
+                and run.inside(self.canvas, context.current_point)
+            ):
+                if cached:
+                    self.move_cache.record(hit=True)
+                self._build_inner_move_command(context, run)
+                return
+            if cached:
+                # the checked path decodes a cached run it can not take like any other
+                self.move_cache.record(hit=False)
+                new_points = self._decode_move_points(context)
+            elif run is not None:
+                # just decoded for the cache, reuse its points
+                new_points = run.translate(context.current_point)
+            else:
+                new_points = self._decode_move_points(context)
 
+            # set pointers for build subroutine
+            context.current_op_code_pointer = (
+                context.current_op_code_pointer + (4 * len(new_points)) + 1
+            )
+            self._build_move_command(context, new_points)
+        else:
+            # a move op code ending the stream has no parameters, ignore it
+            context.current_op_code_pointer = context.current_op_code_pointer + 1
+
+    def _decode_move_points(self, context):
+        """
+        :return: [Point]: points of the move run at the op code pointer
         """
         new_points = list()
-        if self.current_op_code_pointer + 1 < len(self.raw_op_codes):
-
-            # get number of parameters
-            #
-            move_pointer = self.current_op_code_pointer
-            orginal_current_point = self.current_point
-            # determine if we keep processing coordinate bytes based off command ops of endof byte stream
-            next_move_op = self.raw_op_codes[move_pointer + 1]
+        # get number of parameters
+        #
+        move_pointer = context.current_op_code_pointer
+        orginal_current_point = context.current_point
+        # determine if we keep processing coordinate bytes based off command ops of endof byte stream
+        next_move_op = context.raw_op_codes[move_pointer + 1]
+        try:
             while next_move_op not in ["F0", "A0", "80"] and move_pointer + 1 < len(
-                self.raw_op_codes
+                context.raw_op_codes
             ):
+                # a single run can be as long as the stream, keep checking the budget within it
+                context._until_budget_check -= 1
+                if context._until_budget_check <= 0:
+                    self._check_budget(context)
+
                 # decode the coordinate and append to moves in this run
                 x_axis_bytes = [
-                    self.raw_op_codes[move_pointer + 1],
-                    self.raw_op_codes[move_pointer + 2],
+                    context.raw_op_codes[move_pointer + 1],
+                    context.raw_op_codes[move_pointer + 2],
                 ]
                 y_axis_bytes = [
-                    self.raw_op_codes[move_pointer + 3],
-                    self.raw_op_codes[move_pointer + 4],
+                    context.raw_op_codes[move_pointer + 3],
+                    context.raw_op_codes[move_pointer + 4],
                 ]
 
                 new_point = Point(
-                    BaseCommand.decode_bytes(x_axis_bytes[0], x_axis_bytes[1]),
-                    BaseCommand.decode_bytes(y_axis_bytes[0], y_axis_bytes[1]),
+                    int(
+                        BaseCommand.decode_bytes(x_axis_bytes[0], x_axis_bytes[1])
+                        + context.current_point.x
+                    ),
+                    int(
+                        BaseCommand.decode_bytes(y_axis_bytes[0], y_axis_bytes[1])
+                        + context.current_point.y
+                    ),
                 )
-                new_point.x = int(new_point.x + self.current_point.x)
-                new_point.y = int(new_point.y + self.current_point.y)
 
                 new_points.append(new_point)
-                self.current_point = new_point
+                context.current_point = new_point
 
                 # determine if we have a terminating case for this move command or update pointers
                 # Note: this is major assumption not defined, after any move to center is a single parameter move
                 # command.  This is the only way i could get around ignoring bad parameters e.g. Blue Square
-                if move_pointer + 5 == len(self.raw_op_codes) or (
+                if move_pointer + 5 == len(context.raw_op_codes) or (
                     new_point.x == 0 and new_point.y == 0
                 ):
                     break
                 else:
                     move_pointer = move_pointer + 4
-                    next_move_op = self.raw_op_codes[move_pointer + 1]
+                    next_move_op = context.raw_op_codes[move_pointer + 1]
+        finally:
+            # the run is only decoded here, _build_move_command moves the pen
+            context.current_point = orginal_current_point
+        return new_points
+
+    @staticmethod
+    def _move_run_length(raw_op_codes, pointer):
+        """
+        Count the points of the move run at pointer up to the next op code, without decoding them
 
-            # set pointers for build subroutine
-            self.current_point = orginal_current_point
-            self.current_op_code_pointer = (
-                self.current_op_code_pointer + (4 * len(new_points)) + 1
-            )
-            self._build_move_command(new_points)
+        :return: int: number of points, None when the stream ends inside a parameter
+        """
+        count = 0
+        while raw_op_codes[pointer + 1] not in ("F0", "A0", "80"):
+            if pointer + 4 >= len(raw_op_codes):
+                return None
+            count += 1
+            if pointer + 5 == len(raw_op_codes):
+                break
+            pointer = pointer + 4
+        return count
+
+    def _cached_move_run(self, context):
+        """
+        Look the move run at the op code pointer up in the move cache, decoding and caching it
+        on a miss
 
-    def _build_move_command(self, new_points):
+        :return: (MoveRun, bool): the run, None when it can not be taken from the cache, and
+            whether it was found there rather than just decoded. Runs just decoded are counted
+            as misses, the caller counts a found one once it knows whether it can use it.
+        """
+        cache = self.move_cache
+        origin = context.current_point
+        if not cache.max_entries or origin is None:
+            return None, False
+        pointer = context.current_op_code_pointer
+        count = self._move_run_length(context.raw_op_codes, pointer)
+        if not count or count > cache.max_points:
+            return None, False
+
+        key = "".join(context.raw_op_codes[pointer + 1 : pointer + 1 + 4 * count])
+        run = cache.get(key)
+        if run is not None and not run.reaches_center(origin):
+            return run, True
+        cache.record(hit=False)
+        if run is not None:
+            return None, False
+        new_points = self._decode_move_points(context)
+        if len(new_points) != count:
+            # reached the center before the next op code, this run is not reusable as is
+            return None, False
+        run = MoveRun(origin, new_points)
+        cache.put(key, run)
+        return run, False
+
+    def _build_inner_move_command(self, context, run):
+        """
+        Fast path of _build_move_command for a run that never leaves the canvas, which needs
+        no bounds checks. Only valid while the drawer is not marked out of bounds, as
+        _build_move_command treats that differently.
+
+        :param run: MoveRun: run starting from the current point
+        """
+        points = run.translate(context.current_point)
+        if context.pen_down:
+            previous_point = context.current_point
+            for point in points:
+                context._until_budget_check -= 1
+                if context._until_budget_check <= 0:
+                    self._check_budget(context)
+                context.draw_lines.append(Line(previous_point, point, context.color))
+                previous_point = point
+        else:
+            # no lines to bound, a cached run is at most move_cache.max_points long
+            context._until_budget_check -= len(points)
+        context.commands.append(MoveCommand(points=points))
+        context.current_point = points[-1]
+        context.current_op_code_pointer = (
+            context.current_op_code_pointer + (4 * len(points)) + 1
+        )
+
+    def _build_move_command(self, context, new_points):
         """
         Determine if we have to handle out of bound cases and make sub commands where needed.
         We assume if the pen is down that a move command has set this.current_point
@@ -240,54 +653,58 @@ class Drawer(Parser):
 
         valid_moves_points = list()
         for next_point in new_points:
-            if self.pen_down:
+            context._until_budget_check -= 1
+            if context._until_budget_check <= 0:
+                self._check_budget(context)
+            if context.pen_down:
                 # we can assert that the pen will not be down and out of bounds at the same time
-                if not self._out_of_bounds(self.current_point) and self._out_of_bounds(
-                    next_point
-                ):
+                if not self._out_of_bounds(
+                    context.current_point
+                ) and self._out_of_bounds(next_point):
                     # in bounds going out
                     # execute mv points to edge point
                     # execute pen up
                     # mark out of bounds
                     edge_point = self._build_edge_point(
-                        inner_point=self.current_point, outer_point=next_point
+                        inner_point=context.current_point, outer_point=next_point
                     )
                     valid_moves_points.append(edge_point)
 
                     move_command = MoveCommand(points=valid_moves_points)
-                    self.commands.append(move_command)
+                    context.commands.append(move_command)
 
                     pen_up_command = PenCommand(["40", "00"])  # zero for pen down
-                    self.pen_down = False
-                    self.commands.append(pen_up_command)
-
-                    new_line = Line(self.current_point, edge_point, self.color)
-                    self.draw_lines.append(new_line)
-                    self.pen_up_points.append(edge_point)
-                    self.drawer_out_of_bounds = True
-                    self.was_drawing = True
-                    self.current_point = next_point
+                    context.pen_down = False
+                    context.commands.append(pen_up_command)
+
+                    new_line = Line(context.current_point, edge_point, context.color)
+                    context.draw_lines.append(new_line)
+                    context.clipped_segments += 1
+                    context.pen_up_points.append(edge_point)
+                    context.drawer_out_of_bounds = True
+                    context.was_drawing = True
+                    context.current_point = next_point
                     # reset valid_move_points
                     valid_moves_points = list()
 
                 elif not self._out_of_bounds(
-                    self.current_point
+                    context.current_point
                 ) and not self._out_of_bounds(next_point):
                     # normal case make a new line
                     valid_moves_points.append(next_point)
-                    new_line = Line(self.current_point, next_point, self.color)
-                    self.draw_lines.append(new_line)
-                    self.current_point = next_point
+                    new_line = Line(context.current_point, next_point, context.color)
+                    context.draw_lines.append(new_line)
+                    context.current_point = next_point
 
             else:
-                if self.drawer_out_of_bounds:
+                if context.drawer_out_of_bounds:
                     # handle the case where multiple moves out of bounds are being done
                     # meaning we wont update valid moves until we re-enter the canvas boundaries,
                     # but still update the current pointer
                     if (
-                        self._out_of_bounds(self.current_point)
+                        self._out_of_bounds(context.current_point)
                         and not self._out_of_bounds(next_point)
-                        and self.was_drawing
+                        and context.was_drawing
                     ):
                         # out of bounds coming in
                         # execute mv points to this edge point
@@ -295,40 +712,41 @@ class Drawer(Parser):
                         # mark in bounds
                         # move to next point
                         edge_point = self._build_edge_point(
-                            inner_point=next_point, outer_point=self.current_point
+                            inner_point=next_point, outer_point=context.current_point
                         )
                         valid_moves_points.append(edge_point)
                         move_command = MoveCommand(points=valid_moves_points)
-                        self.commands.append(move_command)
+                        context.commands.append(move_command)
                         pen_down_command = PenCommand(
                             ["40", "01"]
                         )  # non-zero for pen down
-                        self.pen_down = True
-                        self.commands.append(pen_down_command)
-
-                        new_line = Line(next_point, edge_point, self.color)
-                        self.draw_lines.append(new_line)
-                        self.pen_down_points.append(edge_point)
-                        self.drawer_out_of_bounds = False
-                        self.was_drawing = False
-                        self.current_point = next_point
+                        context.pen_down = True
+                        context.commands.append(pen_down_command)
+
+                        new_line = Line(next_point, edge_point, context.color)
+                        context.draw_lines.append(new_line)
+                        context.clipped_segments += 1
+                        context.pen_down_points.append(edge_point)
+                        context.drawer_out_of_bounds = False
+                        context.was_drawing = False
+                        context.current_point = next_point
                         # reset valid_move_points
                         valid_moves_points = [next_point]
 
                     elif self._out_of_bounds(
-                        self.current_point
+                        context.current_point
                     ) and self._out_of_bounds(next_point):
                         # still out of bounds move next_point
-                        self.current_point = next_point
+                        context.current_point = next_point
                 else:
                     # normal case make a new line
                     valid_moves_points.append(next_point)
-                    self.current_point = next_point
+                    context.current_point = next_point
 
         # add final move command if any moves
         if valid_moves_points:
             move_command = MoveCommand(points=valid_moves_points)
-            self.commands.append(move_command)
+            context.commands.append(move_command)
 
     def _build_edge_point(self, inner_point, outer_point):
         """
@@ -0,0 +1,422 @@
+import math
+
+import numpy as np
+
+from .canvas import Canvas, Line, Point
+from .command import ClearCommand, ColorCommand, MoveCommand, PenCommand
+from .drawer import Drawer
+
+# a canvas nothing can fall off of, used to decode a stream without the Drawer clipping it
+UNBOUNDED_CANVAS = Canvas(-math.inf, math.inf, -math.inf, math.inf)
+
+
+class AffineTransform:
+    """
+    Abstraction for a 2x3 affine matrix applied to decoded points
+
+        | a b c |   | x |
+        | d e f | * | y |
+                    | 1 |
+    """
+
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=0.0, e=1.0, f=0.0):
+        self.matrix = np.array([[a, b, c], [d, e, f]], dtype=np.float64)
+
+    def __repr__(self):
+        return "AffineTransform({})".format(self.matrix.tolist())
+
+    def __matmul__(self, other):
+        """
+        Compose two transforms, `self @ other` applies other first then self
+
+        :param other: AffineTransform
+        :return: AffineTransform
+        """
+        left = np.vstack([self.matrix, [0.0, 0.0, 1.0]])
+        right = np.vstack([other.matrix, [0.0, 0.0, 1.0]])
+        composed = AffineTransform()
+        composed.matrix = (left @ right)[:2]
+        return composed
+
+    @classmethod
+    def identity(cls):
+        return cls()
+
+    @classmethod
+    def translation(cls, tx, ty):
+        return cls(c=tx, f=ty)
+
+    @classmethod
+    def scaling(cls, sx, sy=None):
+        if sy is None:
+            sy = sx
+        return cls(a=sx, e=sy)
+
+    @classmethod
+    def rotation(cls, radians, origin=None):
+        """
+        :param radians: float: counter clockwise rotation
+        :param origin: Point: pivot of the rotation, defaults to the canvas center
+        """
+        cos, sin = math.cos(radians), math.sin(radians)
+        rotation = cls(a=cos, b=-sin, d=sin, e=cos)
+        if origin is None:
+            return rotation
+        return (
+            cls.translation(origin.x, origin.y)
+            @ rotation
+            @ cls.translation(-origin.x, -origin.y)
+        )
+
+    def apply(self, points):
+        """
+        Transform every point in one NumPy operation
+
+        :param points: np.ndarray: (n, 2) array of x, y values
+        :return: np.ndarray: (n, 2) array of transformed x, y values
+        """
+        return points @ self.matrix[:, :2].T + self.matrix[:, 2]
+
+
+class Path:
+    """
+    Abstraction flattening a parsed Drawer's commands into NumPy arrays
+
+    Every visited point is kept in order along with whether the pen was down while
+    moving to it, making segment i the move from points[i - 1] to points[i].
+    """
+
+    def __init__(self, points, pen_down, colors, command_index, palette):
+        """
+        :param points: np.ndarray: (n, 2) float array of visited points
+        :param pen_down: np.ndarray: (n,) bool, pen state while moving to each point
+        :param colors: np.ndarray: (n,) int index into palette of the color in effect
+        :param command_index: np.ndarray: (n,) int index of the command that visited each point
+        :param palette: [Color]
+        """
+        self.points = points
+        self.pen_down = pen_down
+        self.colors = colors
+        self.command_index = command_index
+        self.palette = palette
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def from_drawer(cls, drawer):
+        """
+        :param drawer: Drawer: a drawer that has already been parsed
+        :return: Path
+        """
+        builder = PathBuilder(drawer.canvas)
+        builder.extend(drawer.commands)
+        return builder.build()
+
+    def transformed(self, transform):
+        """
+        :param transform: AffineTransform
+        :return: Path: copy of this path with the transform applied to all points
+        """
+        return Path(
+            points=transform.apply(self.points),
+            pen_down=self.pen_down,
+            colors=self.colors,
+            command_index=self.command_index,
+            palette=self.palette,
+        )
+
+    def segment_indexes(self, pen_down=True):
+        """
+        :param pen_down: bool: select drawn segments, or pen up travel when False
+        :return: np.ndarray: indexes of the points ending the selected segments
+        """
+        mask = self.pen_down[1:] if pen_down else ~self.pen_down[1:]
+        return np.flatnonzero(mask) + 1
+
+    def segments(self, pen_down=True):
+        """
+        :param pen_down: bool: select drawn segments, or pen up travel when False
+        :return: np.ndarray: (n, 4) array of x0, y0, x1, y1 values
+        """
+        ends = self.segment_indexes(pen_down)
+        return np.hstack([self.points[ends - 1], self.points[ends]])
+
+
+class PathBuilder:
+    """
+    Accumulates a Path from batches of commands, e.g. as they are drained from a streaming
+    Drawer, keeping only the compact NumPy arrays of each batch around
+    """
+
+    def __init__(self, canvas):
+        """
+        :param canvas: Canvas: canvas the commands were drawn on
+        """
+        self.canvas = canvas
+        self.palette = list()
+        self._palette_ids = dict()
+        self._pen = False
+        self._color = self._color_id(canvas.default_color)
+        # number of commands extended so far
+        self.commands = 0
+        self._chunks = list()
+
+    def _color_id(self, color):
+        if color not in self._palette_ids:
+            self._palette_ids[color] = len(self.palette)
+            self.palette.append(color)
+        return self._palette_ids[color]
+
+    def extend(self, commands):
+        """
+        :param commands: [BaseCommand]: the next commands of the drawing, in order
+        """
+        coordinates = list()
+        pen_down = list()
+        colors = list()
+        command_index = list()
+
+        pen = self._pen
+        current_color = self._color
+        for index, command in enumerate(commands, self.commands):
+            if isinstance(command, MoveCommand):
+                for point in command.points:
+                    coordinates.append(point.x)
+                    coordinates.append(point.y)
+                count = len(command.points)
+                pen_down.extend([pen] * count)
+                colors.extend([current_color] * count)
+                command_index.extend([index] * count)
+            elif isinstance(command, PenCommand):
+                pen = command.is_down
+            elif isinstance(command, ColorCommand):
+                current_color = self._color_id(command.color)
+            elif isinstance(command, ClearCommand):
+                # a clear sends the drawer home with the pen up
+                pen = False
+                coordinates.append(self.canvas.center_point.x)
+                coordinates.append(self.canvas.center_point.y)
+                pen_down.append(False)
+                colors.append(current_color)
+                command_index.append(index)
+
+        if pen_down and not self._chunks:
+            # nothing precedes the first point so it can not end a segment
+            pen_down[0] = False
+
+        self._pen = pen
+        self._color = current_color
+        self.commands += len(commands)
+        if pen_down:
+            self._chunks.append(
+                (
+                    np.array(coordinates, dtype=np.float64).reshape(-1, 2),
+                    np.array(pen_down, dtype=bool),
+                    np.array(colors, dtype=np.intp),
+                    np.array(command_index, dtype=np.intp),
+                )
+            )
+
+    def flush(self):
+        """
+        :return: Path: the commands extended since the previous flush, which are then dropped.
+            It starts from the last point flushed before, so no segment is lost between two.
+        """
+        path = self.build()
+        if len(path):
+            self._chunks = [
+                (
+                    path.points[-1:].copy(),
+                    path.pen_down[-1:].copy(),
+                    path.colors[-1:].copy(),
+                    path.command_index[-1:].copy(),
+                )
+            ]
+        return path
+
+    def build(self):
+        """
+        :return: Path: every command extended so far, or since the last flush
+        """
+        if not self._chunks:
+            return Path(
+                points=np.empty((0, 2), dtype=np.float64),
+                pen_down=np.empty(0, dtype=bool),
+                colors=np.empty(0, dtype=np.intp),
+                command_index=np.empty(0, dtype=np.intp),
+                palette=self.palette,
+            )
+        points, pen_down, colors, command_index = (
+            np.concatenate(arrays) for arrays in zip(*self._chunks)
+        )
+        return Path(
+            points=points,
+            pen_down=pen_down,
+            colors=colors,
+            command_index=command_index,
+            palette=self.palette,
+        )
+
+
+def stroke_commands(strokes, colors, palette, current_color=None):
+    """
+    Emit the commands drawing each stroke: a pen up move to its start, then its pen down moves
+
+    :param strokes: [[Point]]: pen down polylines, in drawing order
+    :param colors: [int]: palette index of each stroke
+    :param palette: [Color]
+    :param current_color: int: palette index already in effect, if any
+    :return: [BaseCommand]
+    """
+    # pen commands carry no state of their own, so every stroke can share the same two
+    pen_down = PenCommand(["40", "01"])
+    pen_up = PenCommand(["40", "00"])
+    commands = list()
+    for stroke, color in zip(strokes, colors):
+        if color != current_color:
+            current_color = color
+            commands.append(ColorCommand.from_color(palette[color]))
+        commands.append(MoveCommand(points=stroke[:1]))
+        commands.append(pen_down)
+        commands.append(MoveCommand(points=stroke[1:]))
+        commands.append(pen_up)
+    return commands
+
+
+def clip_segments(segments, canvas):
+    """
+    Liang-Barsky clip every segment against a canvas at once
+
+    :param segments: np.ndarray: (n, 4) array of x0, y0, x1, y1 values
+    :param canvas: Canvas
+    :return: (np.ndarray, np.ndarray, np.ndarray, np.ndarray): clipped segments, visible mask,
+        start clipped mask and finish clipped mask
+    """
+    x0, y0, x1, y1 = segments.T
+    dx = x1 - x0
+    dy = y1 - y0
+    p = np.stack([-dx, dx, -dy, dy])
+    q = np.stack(
+        [x0 - canvas.min_x, canvas.max_x - x0, y0 - canvas.min_y, canvas.max_y - y0]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = q / p
+    t0 = np.max(np.where(p < 0, ratio, 0.0), axis=0, initial=0.0)
+    t1 = np.min(np.where(p > 0, ratio, 1.0), axis=0, initial=1.0)
+    visible = ~np.any((p == 0) & (q < 0), axis=0) & (t0 <= t1)
+
+    clipped = np.column_stack([x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy])
+    return clipped, visible, visible & (t0 > 0), visible & (t1 < 1)
+
+
+class ViewportResult:
+    """
+    Abstraction holding what a pipeline produced for one of its canvases
+    """
+
+    def __init__(self, canvas, segments, colors, palette, commands):
+        """
+        :param canvas: Canvas
+        :param segments: np.ndarray: (n, 4) int array of clipped x0, y0, x1, y1 values
+        :param colors: np.ndarray: (n,) int index into palette for each segment
+        :param palette: [Color]
+        :param commands: [BaseCommand]
+        """
+        self.canvas = canvas
+        self.segments = segments
+        self.colors = colors
+        self.palette = palette
+        self.commands = commands
+        self.result = [command.raw_command for command in commands]
+
+    def draw_lines(self):
+        """
+        :return: [Line]: segments of this viewport in the Drawer's representation
+        """
+        return [
+            Line(Point(x0, y0), Point(x1, y1), self.palette[color])
+            for (x0, y0, x1, y1), color in zip(self.segments.tolist(), self.colors)
+        ]
+
+
+class GeometryPipeline:
+    """
+    Stage that decodes a stream once, applies an affine transform to all of its points and
+    clips the result against several canvases, e.g. one per plotter bed size.
+    """
+
+    def __init__(self, canvases, transform=None):
+        """
+        :param canvases: [Canvas]
+        :param transform: AffineTransform: defaults to the identity
+        """
+        self.canvases = list(canvases)
+        self.transform = transform or AffineTransform.identity()
+
+    def run(self, arg_stream=None, draw_file=None):
+        """
+        :param arg_stream: str: raw un-decoded op codes
+        :param draw_file: str: file name to process a byte stream from
+        :return: [ViewportResult]: one result per canvas, in order
+        """
+        drawer = Drawer(
+            arg_stream=arg_stream, draw_file=draw_file, canvas=UNBOUNDED_CANVAS
+        )
+        drawer.validate_parameters()
+        drawer.parse()
+        return self.run_path(Path.from_drawer(drawer))
+
+    def run_path(self, path):
+        """
+        :param path: Path: untransformed path to run through this pipeline
+        :return: [ViewportResult]
+        """
+        path = path.transformed(self.transform)
+        ends = path.segment_indexes()
+        segments = np.hstack([path.points[ends - 1], path.points[ends]])
+        colors = path.colors[ends]
+        return [
+            self._viewport(canvas, segments, ends, colors, path.palette)
+            for canvas in self.canvases
+        ]
+
+    def _viewport(self, canvas, segments, ends, colors, palette):
+        clipped, visible, start_clipped, finish_clipped = clip_segments(
+            segments, canvas
+        )
+        clipped = np.rint(clipped[visible]).astype(np.int64)
+        ends = ends[visible]
+        colors = colors[visible]
+        start_clipped = start_clipped[visible]
+        finish_clipped = finish_clipped[visible]
+
+        # a segment continues the previous stroke when they share a path point that survived clipping
+        continues = np.zeros(len(clipped), dtype=bool)
+        continues[1:] = (
+            (ends[1:] == ends[:-1] + 1)
+            & ~finish_clipped[:-1]
+            & ~start_clipped[1:]
+            & (colors[1:] == colors[:-1])
+        )
+        stroke_starts = np.flatnonzero(~continues).tolist()
+        stroke_starts.append(len(clipped))
+
+        coordinates = clipped.tolist()
+        strokes = [
+            [Point(*coordinates[start][:2])]
+            + [Point(x1, y1) for _, _, x1, y1 in coordinates[start:stop]]
+            for start, stop in zip(stroke_starts[:-1], stroke_starts[1:])
+        ]
+        commands = [ClearCommand()]
+        commands.extend(
+            stroke_commands(strokes, colors[stroke_starts[:-1]].tolist(), palette)
+        )
+
+        return ViewportResult(
+            canvas=canvas,
+            segments=clipped,
+            colors=colors,
+            palette=palette,
+            commands=commands,
+        )
@@ -0,0 +1,124 @@
+import bisect
+import threading
+from collections import deque
+
+from .drawer import Drawer
+
+
+def common_prefix_length(first, second, chunk_size=4096):
+    """
+    Length of the longest common prefix of two strings, compared a chunk at a time
+
+    :param first: str
+    :param second: str
+    :param chunk_size: int
+    :return: int
+    """
+    limit = min(len(first), len(second))
+    start = 0
+    while start < limit:
+        stop = min(start + chunk_size, limit)
+        if first[start:stop] != second[start:stop]:
+            # binary search the mismatch inside this chunk
+            low, high = start, stop
+            while low < high:
+                middle = (low + high) // 2
+                if first[start : middle + 1] == second[start : middle + 1]:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+        start = stop
+    return limit
+
+
+class ParsedStream:
+    """
+    Abstraction for a parsed stream along with the checkpoints taken while parsing it
+    """
+
+    def __init__(self, stream, drawer, checkpoints):
+        """
+        :param stream: str: raw un-decoded op codes
+        :param drawer: Drawer: the parsed drawer
+        :param checkpoints: [DrawerSnapshot]: ordered by op code pointer
+        """
+        self.stream = stream
+        self.drawer = drawer
+        self.checkpoints = checkpoints
+        self.pointers = [checkpoint.op_code_pointer for checkpoint in checkpoints]
+
+
+class IncrementalParser:
+    """
+    Re-parse engine for streams that are edited and drawn again, e.g. from the web editor.
+
+    The longest common prefix with a recently parsed stream is found, the drawer state
+    checkpointed at the last command boundary inside it is restored and only the changed
+    suffix is decoded, so re-drawing costs time proportional to the edit.
+    """
+
+    def __init__(self, checkpoint_interval=64, history=2, budget=None):
+        """
+        :param checkpoint_interval: int: commands between drawer snapshots
+        :param history: int: number of recently parsed streams kept to share prefixes with
+        :param budget: Budget: resource limits applied to every parse
+        """
+        self.checkpoint_interval = checkpoint_interval
+        self.budget = budget
+        self.history = deque(maxlen=history)
+        # parses run concurrently, only the history is shared between them
+        self._history_lock = threading.Lock()
+        self.reused_op_codes = 0
+
+    def parse(self, stream, cancel_token=None):
+        """
+        :param stream: str: raw un-decoded op codes
+        :param cancel_token: CancellationToken
+        :return: Drawer: parsed drawer with its result set
+        """
+        drawer = Drawer(
+            arg_stream=stream, budget=self.budget, cancel_token=cancel_token
+        )
+        drawer.validate_parameters()
+
+        base, index = self._best_checkpoint(stream)
+        if base is None:
+            drawer.raw_op_codes = list(drawer._get_op_codes(stream))
+            drawer.current_op_code_pointer = 0
+            checkpoints = [drawer.snapshot()]
+        else:
+            drawer.restore(base.checkpoints[index], base.drawer)
+            checkpoints = base.checkpoints[: index + 1]
+        self.reused_op_codes = drawer.current_op_code_pointer
+
+        next_checkpoint = len(drawer.commands) + self.checkpoint_interval
+        while drawer.current_op_code_pointer < len(drawer.raw_op_codes):
+            drawer._handle_next_op_code(drawer.context)
+            if len(drawer.commands) >= next_checkpoint:
+                checkpoints.append(drawer.snapshot())
+                next_checkpoint = len(drawer.commands) + self.checkpoint_interval
+        drawer.result = [command.raw_command for command in drawer.commands]
+
+        with self._history_lock:
+            self.history.appendleft(ParsedStream(stream, drawer, checkpoints))
+        return drawer
+
+    def _best_checkpoint(self, stream):
+        """
+        :param stream: str
+        :return: (ParsedStream, int): where the latest usable checkpoint is, or (None, None)
+        """
+        best = (None, None)
+        best_pointer = 0
+        with self._history_lock:
+            history = list(self.history)
+        for parsed in history:
+            prefix_op_codes = common_prefix_length(parsed.stream, stream) // 2
+            # the op code at a checkpoint's pointer decided where the previous command ended,
+            # so it has to be inside the shared prefix as well
+            index = bisect.bisect_left(parsed.pointers, prefix_op_codes) - 1
+            if index >= 0 and parsed.pointers[index] > best_pointer:
+                best = (parsed, index)
+                best_pointer = parsed.pointers[index]
+        return best
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+
+from .canvas import Point
+
+
+class MoveRun:
+    """
+    Abstraction for a decoded move run relative to wherever it starts, so a motif stamped at
+    many positions is only decoded once
+    """
+
+    __slots__ = ("offsets", "min_x", "max_x", "min_y", "max_y", "_passed")
+
+    def __init__(self, origin, points):
+        """
+        :param origin: Point: current point before the run
+        :param points: [Point]: the run's decoded points
+        """
+        self.offsets = [(point.x - origin.x, point.y - origin.y) for point in points]
+        xs = [offset[0] for offset in self.offsets]
+        ys = [offset[1] for offset in self.offsets]
+        self.min_x, self.max_x = min(xs), max(xs)
+        self.min_y, self.max_y = min(ys), max(ys)
+        # every point but the last, a run that reaches the center on one of them ends early
+        self._passed = set(self.offsets[:-1])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def reaches_center(self, origin):
+        """
+        :param origin: Point
+        :return: bool: whether a point before the last one lands on the center from origin
+        """
+        return (-origin.x, -origin.y) in self._passed
+
+    def inside(self, canvas, origin):
+        """
+        :param canvas: Canvas
+        :param origin: Point
+        :return: bool: whether origin and every point of the run from it are on the canvas
+        """
+        return (
+            canvas.contains_point(origin)
+            and origin.x + self.min_x > canvas.min_x
+            and origin.x + self.max_x < canvas.max_x
+            and origin.y + self.min_y > canvas.min_y
+            and origin.y + self.max_y < canvas.max_y
+        )
+
+    def translate(self, origin):
+        """
+        :param origin: Point
+        :return: [Point]: the run's points from origin
+        """
+        x, y = origin.x, origin.y
+        return [
+            Point(x + offset_x, y + offset_y) for offset_x, offset_y in self.offsets
+        ]
+
+
+class MoveRunCache:
+    """
+    Thread safe least recently used cache of decoded move runs, keyed by their raw parameter
+    op codes. A max_entries of 0 disables it.
+    """
+
+    def __init__(self, max_entries=1024, max_points=256):
+        """
+        :param max_entries: int: runs kept before the least recently used one is evicted
+        :param max_points: int: longest run worth caching, longer ones are rarely repeated
+        """
+        self.max_entries = max_entries
+        self.max_points = max_points
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __repr__(self):
+        return "{} runs cached, {} hits, {} misses, {:.1%} hit rate".format(
+            len(self), self.hits, self.misses, self.hit_rate
+        )
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        """
+        Look a run up without counting it, callers record whether they could use it
+
+        :param key: str: raw parameter op codes of a run
+        :return: MoveRun or None
+        """
+        with self._lock:
+            run = self._runs.get(key)
+            if run is not None:
+                self._runs.move_to_end(key)
+            return run
+
+    def record(self, hit):
+        """
+        :param hit: bool: whether a looked up run was used instead of decoding one
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, run):
+        """
+        :param key: str: raw parameter op codes of a run
+        :param run: MoveRun
+        """
+        with self._lock:
+            self._runs[key] = run
+            self._runs.move_to_end(key)
+            while len(self._runs) > self.max_entries:
+                self._runs.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._runs.clear()
+            self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,564 @@
+import numpy as np
+
+from .canvas import Point
+from .command import BaseCommand, ClearCommand, ColorCommand, MoveCommand
+from .geometry import Path, stroke_commands
+from .stats import DrawingStats
+
+
+class Strokes:
+    """
+    Abstraction for the independent pen down polylines of a Path
+
+    Stroke i draws path.points[first[i]:last[i] + 1] and may be drawn in either direction.
+    """
+
+    def __init__(self, path, first, last, colors, sections):
+        """
+        :param path: Path
+        :param first: np.ndarray: (n,) index of each stroke's first point
+        :param last: np.ndarray: (n,) index of each stroke's last point
+        :param colors: np.ndarray: (n,) palette index of each stroke
+        :param sections: np.ndarray: (n,) number of CLR commands before each stroke
+        """
+        self.path = path
+        self.first = first
+        self.last = last
+        self.colors = colors
+        self.sections = sections
+        self.starts = path.points[first]
+        self.ends = path.points[last]
+
+    def __len__(self):
+        return len(self.first)
+
+    @classmethod
+    def from_path(cls, path, clear_indexes):
+        """
+        :param path: Path
+        :param clear_indexes: [int]: command indexes of the drawing's CLR commands
+        :return: Strokes
+        """
+        ends = path.segment_indexes()
+        if not len(ends):
+            # nothing drawn with the pen down, e.g. only CLR or pen up moves
+            none = np.empty(0, dtype=np.intp)
+            return cls(path=path, first=none, last=none, colors=none, sections=none)
+        colors = path.colors[ends]
+        # a segment continues the previous stroke when it starts where that one ended
+        continues = np.zeros(len(ends), dtype=bool)
+        continues[1:] = (ends[1:] == ends[:-1] + 1) & (colors[1:] == colors[:-1])
+        stroke_starts = np.flatnonzero(~continues)
+        stroke_stops = np.append(stroke_starts[1:], len(ends))
+        first = ends[stroke_starts] - 1
+        return cls(
+            path=path,
+            first=first,
+            last=ends[stroke_stops - 1],
+            colors=colors[stroke_starts],
+            sections=np.searchsorted(
+                clear_indexes, path.command_index[first], side="right"
+            ),
+        )
+
+
+class _EndpointGrid:
+    """
+    Uniform grid bucketing stroke endpoints, for nearest unvisited endpoint queries.
+
+    Endpoints are sorted by cell, so a row of cells is one slice of the sorted array and a query
+    measures every candidate of a block of cells in a few NumPy operations. Endpoints are kept
+    as complex numbers, visited ones moved to infinity, and the grid is rebuilt around the
+    remaining strokes as they thin out.
+    """
+
+    def __init__(self, starts, ends, reversible):
+        """
+        :param starts: np.ndarray: (n, 2)
+        :param ends: np.ndarray: (n, 2)
+        :param reversible: bool: whether strokes may be entered from their end
+        """
+        points = np.vstack([starts, ends]) if reversible else starts
+        self.endpoints = points[:, 0] + 1j * points[:, 1]
+        self.count = len(starts)
+        self.reversible = reversible
+        self.remaining = np.ones(self.count, dtype=bool)
+        self.left = self.count
+        self._build(np.arange(len(self.endpoints)))
+
+    def _build(self, endpoints):
+        """
+        :param endpoints: np.ndarray: indexes into self.endpoints of the endpoints to bucket
+        """
+        points = self.endpoints[endpoints]
+        low = complex(points.real.min(), points.imag.min())
+        span = max(points.real.max() - low.real, points.imag.max() - low.imag)
+        # about one stroke per cell
+        self.cell_size = max(float(span) / max(np.sqrt(len(endpoints)), 1.0), 1.0)
+        self.low_x, self.low_y = low.real, low.imag
+        columns = np.floor((points.real - self.low_x) / self.cell_size).astype(np.int64)
+        rows = np.floor((points.imag - self.low_y) / self.cell_size).astype(np.int64)
+        self.columns = int(columns.max()) + 1
+        self.rows = int(rows.max()) + 1
+        cell_ids = rows * self.columns + columns
+        order = np.argsort(cell_ids, kind="stable")
+        self.sorted_points = points[order]
+        self.sorted_endpoints = endpoints[order]
+        # where each endpoint went, to move it away once its stroke is visited
+        self.positions = np.empty(len(self.endpoints), dtype=np.intp)
+        self.positions[self.sorted_endpoints] = np.arange(len(order))
+        # sorted endpoints of cell c are those from bounds[c] to bounds[c + 1]
+        self.bounds = np.searchsorted(
+            cell_ids[order], np.arange(self.rows * self.columns + 1)
+        ).tolist()
+        self.built_with = self.left
+
+    def remove(self, stroke):
+        self.remaining[stroke] = False
+        self.left -= 1
+        if self.left and self.left * 4 < self.built_with:
+            # mostly visited, bucket what is left more coarsely so queries stay short
+            remaining = np.flatnonzero(self.remaining)
+            if self.reversible:
+                remaining = np.concatenate([remaining, remaining + self.count])
+            self._build(remaining)
+            return
+        self.sorted_points[self.positions[stroke]] = np.inf
+        if self.reversible:
+            self.sorted_points[self.positions[stroke + self.count]] = np.inf
+
+    def nearest(self, x, y):
+        """
+        :param x: float
+        :param y: float
+        :return: (int, bool): closest remaining stroke and whether it is entered from its end
+        """
+        column = int((x - self.low_x) // self.cell_size)
+        row = int((y - self.low_y) // self.cell_size)
+        position = complex(x, y)
+        radius = 1
+        while True:
+            first_column = max(column - radius, 0)
+            last_column = min(column + radius, self.columns - 1)
+            first_row = max(row - radius, 0)
+            last_row = min(row + radius, self.rows - 1)
+            if first_column <= last_column and first_row <= last_row:
+                found = self._closest_in(
+                    first_column, last_column, first_row, last_row, position
+                )
+                if found is not None:
+                    distance, endpoint = found
+                    # anything outside the block is at least as far as its nearest open side
+                    gap = min(
+                        (
+                            x - self.low_x - first_column * self.cell_size
+                            if first_column > 0
+                            else np.inf
+                        ),
+                        (
+                            self.low_x + (last_column + 1) * self.cell_size - x
+                            if last_column < self.columns - 1
+                            else np.inf
+                        ),
+                        (
+                            y - self.low_y - first_row * self.cell_size
+                            if first_row > 0
+                            else np.inf
+                        ),
+                        (
+                            self.low_y + (last_row + 1) * self.cell_size - y
+                            if last_row < self.rows - 1
+                            else np.inf
+                        ),
+                    )
+                    if distance <= gap:
+                        return endpoint % self.count, endpoint >= self.count
+            radius = radius * 2 + 1
+
+    def _closest_in(self, first_column, last_column, first_row, last_row, position):
+        """
+        Measures the one slice of sorted endpoints running from the block's first cell to its
+        last, which also holds the rest of the rows in between. Those are farther than the
+        block's open sides whenever they are the closest, so nearest never accepts them wrongly.
+
+        :param position: complex: where the pen is
+        :return: (float, int): distance and index of the closest remaining endpoint of the
+            slice, None when there is none
+        """
+        start = self.bounds[first_row * self.columns + first_column]
+        stop = self.bounds[last_row * self.columns + last_column + 1]
+        if start == stop:
+            return None
+        distances = np.abs(self.sorted_points[start:stop] - position)
+        best = int(distances.argmin())
+        distance = float(distances[best])
+        if distance == np.inf:
+            return None
+        return distance, int(self.sorted_endpoints[start + best])
+
+
+def _complex(points):
+    """
+    :param points: np.ndarray: (n, 2)
+    :return: np.ndarray: (n,) the points as complex numbers, abs of a difference is a distance
+    """
+    return points[:, 0] + 1j * points[:, 1]
+
+
+def _distances(first, second):
+    return np.abs(first - second)
+
+
+def _encoded_parameters():
+    """
+    :return: np.ndarray: the four op codes of every move parameter, indexed by value + 8192
+    """
+    return np.array(
+        [
+            "".join(BaseCommand.encode_bytes(value))
+            for value in range(-MoveCommand.max_step - 1, MoveCommand.max_step + 1)
+        ],
+        dtype=object,
+    )
+
+
+class TravelPlan:
+    """
+    Abstraction for a drawing re-emitted with its strokes reordered
+    """
+
+    def __init__(self, build_commands, op_stream, strokes, travel_before, travel_after):
+        """
+        :param build_commands: callable: returns the plan's [BaseCommand], only called when
+            commands or result are first read, the op stream is encoded without them
+        :param op_stream: str: raw op codes drawing the same strokes
+        :param strokes: int: number of strokes reordered
+        :param travel_before: float: pen up travel of the original drawing
+        :param travel_after: float: pen up travel of this plan
+        """
+        self._build_commands = build_commands
+        self._commands = None
+        self.op_stream = op_stream
+        self.strokes = strokes
+        self.travel_before = travel_before
+        self.travel_after = travel_after
+
+    @property
+    def commands(self):
+        """
+        :return: [BaseCommand]
+        """
+        if self._commands is None:
+            self._commands = self._build_commands()
+        return self._commands
+
+    @property
+    def result(self):
+        """
+        :return: [str]: raw commands of the plan
+        """
+        return [command.raw_command for command in self.commands]
+
+    def __repr__(self):
+        return "{} strokes, pen up travel {:.1f} -> {:.1f}".format(
+            self.strokes, self.travel_before, self.travel_after
+        )
+
+
+class TravelOptimizer:
+    """
+    Stage reordering a parsed drawing's strokes to cut the plotter's pen up travel.
+
+    Strokes are chained greedily to the nearest remaining stroke endpoint, found through a
+    uniform grid, and the chain is then improved with 2-opt moves reversing runs of at most
+    window strokes. Strokes are only reordered among those sharing a color and CLR section, and
+    colors are drawn in the order they first appeared, so each section changes pens once per color.
+    """
+
+    def __init__(self, reverse=True, window=32, max_passes=3):
+        """
+        :param reverse: bool: allow drawing strokes end to start, 2-opt needs this
+        :param window: int: longest run of strokes a 2-opt move reverses, bounding its cost
+        :param max_passes: int: bound on 2-opt passes over the chain
+        """
+        self.reverse = reverse
+        self.window = window
+        self.max_passes = max_passes
+
+    def optimize(self, drawer):
+        """
+        :param drawer: Drawer: a drawer that has already been parsed
+        :return: TravelPlan
+        """
+        path = Path.from_drawer(drawer)
+        travel_before = DrawingStats(
+            path, len(drawer.commands), drawer.clipped_segments
+        ).pen_up_travel
+        # the Drawer treats its border as off the canvas, keep re-emitted points just inside
+        canvas = drawer.canvas
+        path.points = np.clip(
+            path.points,
+            [canvas.min_x + 1, canvas.min_y + 1],
+            [canvas.max_x - 1, canvas.max_y - 1],
+        )
+        clear_indexes = [
+            index
+            for index, command in enumerate(drawer.commands)
+            if isinstance(command, ClearCommand)
+        ]
+        strokes = Strokes.from_path(path, clear_indexes)
+        center = np.array([canvas.center_point.x, canvas.center_point.y], dtype=float)
+
+        # chain each color of each section in turn, continuing from where the last one ended
+        order = list()
+        flipped = list()
+        groups = list()
+        for section in range(len(clear_indexes) + 1):
+            position = center
+            in_section = np.flatnonzero(strokes.sections == section)
+            _, first_seen = np.unique(strokes.colors[in_section], return_index=True)
+            for color in strokes.colors[in_section[np.sort(first_seen)]]:
+                group = in_section[strokes.colors[in_section] == color]
+                group_order, group_flipped = self._nearest_neighbour(
+                    strokes, group, position
+                )
+                order.append(group_order)
+                flipped.append(group_flipped)
+                groups.append(np.full(len(group), len(groups)))
+                last = group_order[-1]
+                position = (
+                    strokes.starts[last] if group_flipped[-1] else strokes.ends[last]
+                )
+
+        if order:
+            order = np.concatenate(order)
+            flipped = np.concatenate(flipped)
+            groups = np.concatenate(groups)
+        else:
+            order = np.empty(0, dtype=np.intp)
+            flipped = np.empty(0, dtype=bool)
+            groups = np.empty(0, dtype=np.intp)
+        sections = strokes.sections[order]
+        if self.reverse and len(order):
+            self._two_opt(strokes, order, flipped, groups, sections, center)
+        entry, _, previous = self._links(strokes, order, flipped, sections, center)
+
+        return TravelPlan(
+            build_commands=lambda: self._commands(strokes, order, flipped, sections),
+            op_stream=self._op_stream(strokes, order, flipped, sections, center),
+            strokes=len(strokes),
+            travel_before=travel_before,
+            travel_after=float(_distances(previous, entry).sum()),
+        )
+
+    @staticmethod
+    def _links(strokes, order, flipped, sections, center):
+        """
+        :return: (np.ndarray, np.ndarray, np.ndarray): where the pen enters and leaves each
+            stroke of the chain, and where it travels to the stroke from, as complex numbers
+        """
+        starts = _complex(strokes.starts[order])
+        ends = _complex(strokes.ends[order])
+        entry = np.where(flipped, ends, starts)
+        leave = np.where(flipped, starts, ends)
+        previous = np.concatenate([[complex(*center)], leave[:-1]])[: len(leave)]
+        # CLR sends the pen to the center before the first stroke of a section
+        previous[1:][sections[1:] != sections[:-1]] = complex(*center)
+        return entry, leave, previous
+
+    def _commands(self, strokes, order, flipped, sections):
+        """
+        :return: [BaseCommand]: commands drawing the strokes in chain order
+        """
+        points = [
+            Point(x, y)
+            for x, y in np.rint(strokes.path.points).astype(np.int64).tolist()
+        ]
+        first = strokes.first.tolist()
+        last = strokes.last.tolist()
+        colors = strokes.colors[order].tolist()
+        commands = list()
+        color = None
+        section = 0
+        polylines = list()
+        section_colors = list()
+        for position, (stroke, flip, stroke_section) in enumerate(
+            zip(order.tolist(), flipped.tolist(), sections.tolist())
+        ):
+            while section < stroke_section:
+                commands.extend(
+                    stroke_commands(
+                        polylines, section_colors, strokes.path.palette, color
+                    )
+                )
+                color = section_colors[-1] if section_colors else color
+                polylines = list()
+                section_colors = list()
+                commands.append(ClearCommand())
+                section += 1
+            polyline = points[first[stroke] : last[stroke] + 1]
+            polylines.append(polyline[::-1] if flip else polyline)
+            section_colors.append(colors[position])
+        commands.extend(
+            stroke_commands(polylines, section_colors, strokes.path.palette, color)
+        )
+        return commands
+
+    @staticmethod
+    def _op_stream(strokes, order, flipped, sections, center):
+        """
+        Encode the chain straight from the stroke arrays, giving the same op codes as encoding
+        _commands with encode_commands: every stroke is a pen up move run to its first point,
+        PEN DOWN, a move run through the rest and PEN UP, after CLRs and a CO when needed.
+
+        :return: str
+        """
+        if not len(order):
+            return ""
+        points = np.rint(strokes.path.points).astype(np.int64)
+        first = strokes.first[order]
+        last = strokes.last[order]
+        lengths = last - first + 1
+        # point indexes of the whole chain, reversed strokes run from their last point down
+        stroke = np.repeat(np.arange(len(order)), lengths)
+        offset = np.arange(len(stroke)) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        direction = np.where(flipped, -1, 1)
+        targets = points[
+            np.where(flipped, last, first)[stroke] + direction[stroke] * offset
+        ]
+        previous = np.empty_like(targets)
+        previous[1:] = targets[:-1]
+        new_section = np.ones(len(order), dtype=bool)
+        new_section[1:] = sections[1:] != sections[:-1]
+        previous[np.flatnonzero(offset == 0)[new_section]] = np.rint(center)
+
+        # moves longer than max_step are split into evenly spaced steps, as MoveCommand does
+        deltas = targets - previous
+        counts = np.maximum(
+            -(-np.abs(deltas).max(axis=1) // MoveCommand.max_step), 1
+        ).astype(np.int64)
+        point = np.repeat(np.arange(len(targets)), counts)
+        step = np.arange(len(point)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        steps = previous[point] + np.round(
+            deltas[point] * step[:, None] / counts[point][:, None]
+        ).astype(np.int64)
+        step_from = np.where(
+            (step == 1)[:, None], previous[point], np.roll(steps, 1, 0)
+        )
+        step_deltas = steps - step_from
+
+        # op codes written before each step, and after the last step of each stroke
+        prefixes = np.full(len(steps), "", dtype=object)
+        # a Drawer ends a move run on reaching the center, so a new run is started after it
+        prefixes[(step_from == 0).all(axis=1)] = "C0"
+        entries = np.flatnonzero((step == 1) & (offset[point] == 0))
+        prefixes[np.flatnonzero((step == 1) & (offset[point] == 1))] = "804001C0"
+        clears = np.diff(sections, prepend=0).tolist()
+        colors = strokes.colors[order].tolist()
+        palette = strokes.path.palette
+        color_op_codes = dict()
+        color = None
+        for position, entry in enumerate(entries.tolist()):
+            prefix = "F0" * clears[position]
+            if colors[position] != color:
+                color = colors[position]
+                if color not in color_op_codes:
+                    color_op_codes[color] = "".join(
+                        ColorCommand.from_color(palette[color]).op_codes(None)
+                    )
+                prefix += color_op_codes[color]
+            prefixes[entry] = prefix + "C0"
+        suffixes = np.full(len(steps), "", dtype=object)
+        suffixes[np.cumsum(np.bincount(stroke[point], minlength=len(order))) - 1] = (
+            "804000"
+        )
+
+        parameters = _encoded_parameters()
+        step_deltas += MoveCommand.max_step + 1
+        return "".join(
+            prefixes
+            + parameters[step_deltas[:, 0]]
+            + parameters[step_deltas[:, 1]]
+            + suffixes
+        )
+
+    def _nearest_neighbour(self, strokes, group, position):
+        """
+        :param strokes: Strokes
+        :param group: np.ndarray: indexes of the strokes to order
+        :param position: np.ndarray: (2,) where the pen is before the first of them
+        :return: (np.ndarray, np.ndarray): stroke order and whether each is drawn reversed
+        """
+        grid = _EndpointGrid(strokes.starts[group], strokes.ends[group], self.reverse)
+        order = list()
+        flipped = list()
+        x, y = position.tolist()
+        starts = strokes.starts[group].tolist()
+        ends = strokes.ends[group].tolist()
+        for _ in range(len(group)):
+            stroke, flip = grid.nearest(x, y)
+            grid.remove(stroke)
+            order.append(stroke)
+            flipped.append(flip)
+            x, y = starts[stroke] if flip else ends[stroke]
+        return group[np.array(order, dtype=np.intp)], np.array(flipped, dtype=bool)
+
+    def _two_opt(self, strokes, order, flipped, groups, sections, center):
+        """
+        Improve a chain in place by reversing runs of strokes, a run i..j reversed is entered
+        from stroke j's end and left from stroke i's start. Every run length is tried for all
+        positions in one NumPy pass, and non overlapping improving moves are applied together.
+        Runs never cross from one color group into the next.
+        """
+        count = len(order)
+        entry, leave, _ = self._links(strokes, order, flipped, sections, center)
+        # the first stroke of a section travels from the center instead of the stroke before
+        fresh = np.ones(count, dtype=bool)
+        fresh[1:] = sections[1:] != sections[:-1]
+        previous = np.empty_like(leave)
+        center = complex(*center)
+        for _ in range(self.max_passes):
+            improved = False
+            for length in range(min(self.window, count)):
+                first = np.flatnonzero(groups[: count - length] == groups[length:])
+                if not len(first):
+                    continue
+                previous[1:] = leave[:-1]
+                previous[fresh] = center
+                last = first + length
+                following = np.minimum(last + 1, count - 1)
+                # the link out of a run only counts when the next stroke travels from it
+                linked = (last + 1 < count) & ~fresh[following]
+                before = previous[first]
+                change = (
+                    _distances(before, leave[last])
+                    - _distances(before, entry[first])
+                    + np.where(
+                        linked,
+                        _distances(entry[first], entry[following])
+                        - _distances(leave[last], entry[following]),
+                        0.0,
+                    )
+                )
+                candidates = np.flatnonzero(change < -1e-9)
+                if not len(candidates):
+                    continue
+                # moves touching the same links would invalidate each other's change
+                touched = np.zeros(count + 1, dtype=bool)
+                for candidate in candidates[np.argsort(change[candidates])].tolist():
+                    start = first[candidate]
+                    stop = start + length + 1
+                    if touched[start : stop + 1].any():
+                        continue
+                    touched[start : stop + 1] = True
+                    order[start:stop] = order[start:stop][::-1].copy()
+                    flipped[start:stop] = ~flipped[start:stop][::-1]
+                    entry[start:stop], leave[start:stop] = (
+                        leave[start:stop][::-1].copy(),
+                        entry[start:stop][::-1].copy(),
+                    )
+                    improved = True
+            if not improved:
+                break
@@ -16,7 +16,13 @@ class Processor:
         draw_input_stream=None,
         draw_input_file=None,
         display=True,
+        budget=None,
+        cancel_token=None,
     ):
+        """
+        :param budget: Budget: resource limits for drawing
+        :param cancel_token: CancellationToken: lets another party stop drawing
+        """
         self.display = display
         # set byte parsing class
         if number:
@@ -24,13 +30,34 @@ class Processor:
         elif high_byte and low_byte:
             self.parser = Decoder(high_byte=high_byte, low_byte=low_byte)
         elif draw_input_stream:
-            self.parser = Drawer(arg_stream=draw_input_stream)
+            self.parser = Drawer(
+                arg_stream=draw_input_stream, budget=budget, cancel_token=cancel_token
+            )
         elif draw_input_file:
-            self.parser = Drawer(draw_file=draw_input_file)
+            self.parser = Drawer(
+                draw_file=draw_input_file, budget=budget, cancel_token=cancel_token
+            )
         else:
             raise ValueError("ByteProcessor initialized improperly.")
         self.process()
 
+    @staticmethod
+    def draw_streams(streams, max_workers=None, budget=None, canvas=None):
+        """
+        Thread pool mode, draw many streams at once through one shared, reentrant Drawer
+
+        :param streams: [str]: raw un-decoded op codes
+        :param max_workers: int: threads in the pool, defaults to the executor's choice
+        :param budget: Budget: resource limits for each stream
+        :param canvas: Canvas: defaults to the Drawer's default canvas
+        :return: [DrawContext]: parsed state of each stream, in order
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        drawer = Drawer(canvas=canvas, budget=budget)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(drawer.draw, streams))
+
     def process(self):
         """
         Process this self.parser
@@ -0,0 +1,152 @@
+import sys
+import threading
+from collections import Counter
+
+# modules whose functions the top table reports by default
+DRAWING_MODULES = ("byte_drawer.drawer", "byte_drawer.command", "byte_drawer.coders")
+
+
+class SamplingProfiler:
+    """
+    Abstraction for profiling one call by sampling the stack of the thread making it.
+
+    Nothing is hooked into the interpreter, a helper thread reads the calling thread's frame
+    every interval while the call runs, so only the profiled call pays for it and other
+    threads, e.g. concurrent requests, keep running unprofiled.
+
+    The helper needs the GIL to take a sample and interpreter settings are left alone, so
+    while the profiled code keeps the GIL samples come at most every sys.getswitchinterval(),
+    5ms by default, whatever the interval. Use longer calls, or repeat them, for more samples.
+    """
+
+    def __init__(self, interval=0.001, max_samples=100000):
+        """
+        :param interval: float: seconds between samples, see above for the resolution reached
+        :param max_samples: int: sampling stops past this many, bounding memory on long calls
+        """
+        self.interval = interval
+        self.max_samples = max_samples
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = dict()
+        self._thread_id = None
+        self._root = None
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        self.start(sys._getframe(1).f_back)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def run(self, function, *args, **kwargs):
+        """
+        :param function: callable: the call to profile, made from this thread
+        :return: whatever function returns
+        """
+        self.start(sys._getframe(0))
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.stop()
+
+    def start(self, root=None):
+        """
+        :param root: frame: stacks are recorded below this frame, defaults to the one calling
+            the caller, so the caller's own frame is the root of every stack
+        """
+        self._thread_id = threading.get_ident()
+        self._root = root if root is not None else sys._getframe(1).f_back
+        self._stopped.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, name="byte-drawer-profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        self._root = None
+
+    def _label(self, code, module):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = "{}:{}".format(
+                module, getattr(code, "co_qualname", code.co_name)
+            ).replace(";", ",")
+        return label
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = list()
+            while frame is not None and frame is not self._root:
+                if frame.f_globals is globals():
+                    # caught starting or stopping, not in the profiled code
+                    stack = None
+                    break
+                stack.append(
+                    self._label(frame.f_code, frame.f_globals.get("__name__", "?"))
+                )
+                frame = frame.f_back
+            del frame
+            if stack:
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+                self.samples += 1
+                if self.samples >= self.max_samples:
+                    return
+
+    def collapsed(self):
+        """
+        :return: str: one "caller;callee count" line per sampled stack, the input format of
+            flamegraph.pl and speedscope
+        """
+        return "".join(
+            "{} {}\n".format(";".join(stack), count)
+            for stack, count in sorted(self.stacks.items())
+        )
+
+    def write(self, file_name):
+        """
+        :param file_name: str: destination of the collapsed stacks
+        """
+        with open(file_name, "w") as file:
+            file.write(self.collapsed())
+
+    def top(self, count=20, modules=DRAWING_MODULES):
+        """
+        :param count: int: rows to return
+        :param modules: (str): only report functions of these modules, None reports all
+        :return: [(str, int, int)]: function, samples spent in it and samples it was on the
+            stack for, most expensive first
+        """
+        own = Counter()
+        total = Counter()
+        for stack, samples in self.stacks.items():
+            own[stack[-1]] += samples
+            for label in set(stack):
+                total[label] += samples
+        rows = [
+            (label, own[label], samples)
+            for label, samples in total.items()
+            if modules is None or label.split(":", 1)[0] in modules
+        ]
+        rows.sort(key=lambda row: (-row[1], -row[2], row[0]))
+        return rows[:count]
+
+    def table(self, count=20, modules=DRAWING_MODULES):
+        """
+        :return: str: top as a text table of sample percentages
+        """
+        lines = ["{:>7} {:>7}  function".format("self", "total")]
+        for label, own, total in self.top(count, modules):
+            lines.append(
+                "{:>6.1%} {:>6.1%}  {}".format(
+                    own / self.samples, total / self.samples, label
+                )
+            )
+        lines.append("{} samples every {}s".format(self.samples, self.interval))
+        return "\n".join(lines)
@@ -0,0 +1,180 @@
+import asyncio
+import struct
+
+from .budget import Budget
+from .drawer import Drawer
+from .memo import MoveRunCache
+from .streaming import drain
+
+# buffered op codes are shared strings, so each one costs a list slot
+OP_CODE_BYTES = struct.calcsize("P")
+
+# limits on a connection's drawer when serve() is not given a budget, over the connection's
+# whole life as plotters stream for a long while
+SERVE_BUDGET = Budget(max_commands=1000000, max_segments=2000000, max_seconds=3600.0)
+
+
+class DrawServer:
+    """
+    Abstraction for an asyncio TCP server drawing live byte streams, e.g. from plotters.
+
+    Every connection drives a Drawer of its own, fed as data arrives, and gets each decoded
+    command back as one line. A connection is not read from while its commands are waiting
+    to be sent, so a slow reader holds back its own stream rather than filling memory.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        binary=False,
+        canvas=None,
+        budget=None,
+        max_buffer_bytes=1024 * 1024,
+        idle_timeout=30.0,
+        read_size=64 * 1024,
+        write_buffer_bytes=64 * 1024,
+        backlog=4096,
+    ):
+        """
+        :param host: str
+        :param port: int: 0 picks a free port, see port once started
+        :param binary: bool: connections send raw op code bytes rather than hexadecimal text
+        :param canvas: Canvas: canvas every connection draws on
+        :param budget: Budget: resource limits for each connection's drawer
+        :param max_buffer_bytes: int: memory a connection's input may take while it waits on
+            an unfinished command, e.g. a move run that never ends
+        :param idle_timeout: float: seconds a connection may send nothing before it is closed
+        :param read_size: int: most bytes read from a connection at once
+        :param write_buffer_bytes: int: unsent output at which a connection stops being read
+        :param backlog: int: connections the OS queues before they are accepted, plotters tend
+            to reconnect all at once
+        """
+        self.host = host
+        self.port = port
+        self.binary = binary
+        self.canvas = canvas
+        self.budget = budget
+        self.max_buffer_bytes = max_buffer_bytes
+        self.idle_timeout = idle_timeout
+        self.read_size = read_size
+        self.write_buffer_bytes = write_buffer_bytes
+        self.backlog = backlog
+        # motifs repeat across plotters, so every connection shares decoded move runs
+        self.move_cache = MoveRunCache()
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        """
+        :return: asyncio.AbstractServer: listening, port is set to the bound port
+        """
+        self.server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+            limit=self.read_size,
+            backlog=self.backlog,
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    def _decode(self, data):
+        """
+        :param data: bytes: as read from a connection
+        :return: str: raw un-decoded op codes
+        """
+        if self.binary:
+            return data.hex().upper()
+        # hexadecimal text may be broken into lines
+        return "".join(data.decode("latin-1").split())
+
+    def _feed(self, drawer, data):
+        """
+        :param drawer: Drawer: the connection's drawer
+        :param data: bytes: as read from the connection, empty at its end
+        :return: str: a line per command the data completed
+        """
+        drawer.feed(self._decode(data), final=not data)
+        return "".join(command.raw_command + "\n" for command in drain(drawer).commands)
+
+    async def _handle_connection(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_bytes)
+        drawer = Drawer(
+            canvas=self.canvas, budget=self.budget, move_cache=self.move_cache
+        )
+        self.connections += 1
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        reader.read(self.read_size), self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    writer.write(b"ERROR idle timeout\n")
+                    break
+
+                # a long move run takes a while to draw, keep it off the event loop so other
+                # connections are served meanwhile
+                output = await loop.run_in_executor(None, self._feed, drawer, data)
+                if output:
+                    writer.write(output.encode("ascii"))
+                if not data:
+                    break
+                if (
+                    len(drawer.raw_op_codes) * OP_CODE_BYTES
+                    + len(drawer.context.partial_op_code)
+                    > self.max_buffer_bytes
+                ):
+                    writer.write(b"ERROR buffer limit exceeded\n")
+                    break
+                # backpressure, stop reading until the client catches up
+                await writer.drain()
+        except (ValueError, RuntimeError) as err:
+            writer.write("ERROR {}\n".format(err).encode("ascii", "replace"))
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            writer.write(b"ERROR Something unknown went wrong! Were on it!\n")
+        finally:
+            self.connections -= 1
+            try:
+                if not writer.is_closing():
+                    await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+def serve(host="127.0.0.1", port=8765, **kwargs):
+    """
+    Run a DrawServer until interrupted
+
+    :param kwargs: see DrawServer, budget defaults to SERVE_BUDGET
+    """
+    kwargs.setdefault("budget", SERVE_BUDGET)
+    server = DrawServer(host=host, port=port, **kwargs)
+
+    async def main():
+        await server.start()
+        print("drawing streams on {}:{}".format(server.host, server.port), flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,193 @@
+import copy
+
+import numpy as np
+
+from .geometry import Path, PathBuilder
+
+
+class DrawingStats:
+    """
+    Abstraction for the summary statistics of a parsed drawing
+
+    Everything is reduced from a Path's arrays in a handful of NumPy passes, so it stays cheap
+    on drawings with millions of segments.
+    """
+
+    def __init__(self, path, commands, clipped_segments):
+        """
+        :param path: Path: the drawing's visited points
+        :param commands: int: number of commands the drawing was made of
+        :param clipped_segments: int: drawn segments cut short at the canvas border
+        """
+        self.commands = commands
+        self.clipped_segments = clipped_segments
+
+        steps = np.diff(path.points, axis=0)
+        lengths = np.hypot(steps[:, 0], steps[:, 1])
+        drawn = path.pen_down[1:]
+        self.segments = int(np.count_nonzero(drawn))
+        self.pen_up_moves = len(lengths) - self.segments
+        self.pen_down_length = float(lengths[drawn].sum())
+        self.pen_up_travel = float(lengths[~drawn].sum())
+
+        ink = np.bincount(
+            path.colors[1:][drawn], weights=lengths[drawn], minlength=len(path.palette)
+        )
+        self.ink = [
+            (color, float(length))
+            for color, length in zip(path.palette, ink)
+            if length > 0
+        ]
+
+        # frame the ink, or every visited point when nothing was drawn
+        ends = np.flatnonzero(drawn) + 1
+        self._ink_box = self._box(path.points[np.concatenate([ends - 1, ends])])
+        self._visited_box = self._box(path.points)
+        self._frame()
+
+    @staticmethod
+    def _box(points):
+        """
+        :param points: np.ndarray: (n, 2)
+        :return: [int]: min_x, min_y, max_x, max_y or None without points
+        """
+        if not len(points):
+            return None
+        return [int(value) for value in points.min(axis=0).tolist()] + [
+            int(value) for value in points.max(axis=0).tolist()
+        ]
+
+    @staticmethod
+    def _union(box, other):
+        if box is None or other is None:
+            return box or other
+        return [min(box[0], other[0]), min(box[1], other[1])] + [
+            max(box[2], other[2]),
+            max(box[3], other[3]),
+        ]
+
+    def _frame(self):
+        box = self._ink_box if self.segments else self._visited_box
+        if box is None:
+            self.min_x = self.min_y = self.max_x = self.max_y = None
+        else:
+            self.min_x, self.min_y, self.max_x, self.max_y = box
+
+    def __repr__(self):
+        return "\n".join(
+            "{}: {}".format(name, value) for name, value in self.as_dict().items()
+        )
+
+    @classmethod
+    def from_drawer(cls, drawer):
+        """
+        :param drawer: Drawer: a drawer that has already been parsed
+        :return: DrawingStats
+        """
+        return cls(
+            path=Path.from_drawer(drawer),
+            commands=len(drawer.commands),
+            clipped_segments=drawer.clipped_segments,
+        )
+
+    def combined(self, other):
+        """
+        Statistics of a drawing continued by other, e.g. the next batch of a streamed drawing
+
+        :param other: DrawingStats: of a path starting at the last point of this one
+        :return: DrawingStats
+        """
+        combined = copy.copy(self)
+        combined.commands += other.commands
+        combined.clipped_segments += other.clipped_segments
+        combined.segments += other.segments
+        combined.pen_up_moves += other.pen_up_moves
+        combined.pen_down_length += other.pen_down_length
+        combined.pen_up_travel += other.pen_up_travel
+        ink = dict(self.ink)
+        for color, length in other.ink:
+            ink[color] = ink.get(color, 0.0) + length
+        combined.ink = list(ink.items())
+        combined._ink_box = self._union(self._ink_box, other._ink_box)
+        combined._visited_box = self._union(self._visited_box, other._visited_box)
+        combined._frame()
+        return combined
+
+    @property
+    def bounding_box(self):
+        """
+        :return: (int, int, int, int): min_x, min_y, max_x, max_y or None for an empty drawing
+        """
+        if self.min_x is None:
+            return None
+        return self.min_x, self.min_y, self.max_x, self.max_y
+
+    def viewport(self, margin=0.05, minimum_span=20):
+        """
+        A range tightly framing the drawing, for plotting it
+
+        :param margin: float: fraction of the drawing's size left around it
+        :param minimum_span: int: smallest width or height of the range, so lone points
+            and straight lines do not collapse it
+        :return: dict: min_x, max_x, min_y and max_y, or None for an empty drawing
+        """
+        if self.min_x is None:
+            return None
+        viewport = dict()
+        for axis, low, high in [
+            ("x", self.min_x, self.max_x),
+            ("y", self.min_y, self.max_y),
+        ]:
+            padding = max((high - low) * margin, (minimum_span - (high - low)) / 2, 0)
+            viewport["min_" + axis] = low - padding
+            viewport["max_" + axis] = high + padding
+        return viewport
+
+    def as_dict(self):
+        """
+        :return: dict: JSON friendly statistics
+        """
+        return {
+            "bounding_box": self.bounding_box,
+            "pen_down_length": round(self.pen_down_length, 3),
+            "pen_up_travel": round(self.pen_up_travel, 3),
+            "ink": {repr(color): round(length, 3) for color, length in self.ink},
+            "segments": self.segments,
+            "pen_up_moves": self.pen_up_moves,
+            "commands": self.commands,
+            "clipped_segments": self.clipped_segments,
+        }
+
+
+class RunningStats:
+    """
+    Abstraction for the DrawingStats of a drawing fed batch by batch, e.g. as it is drained
+    from a streaming Drawer. Each batch is reduced as it arrives, so only a few numbers
+    are held rather than the drawing's geometry.
+    """
+
+    def __init__(self, canvas):
+        """
+        :param canvas: Canvas: canvas the commands were drawn on
+        """
+        self._builder = PathBuilder(canvas)
+        self._stats = None
+
+    def extend(self, commands):
+        """
+        :param commands: [BaseCommand]: the next commands of the drawing, in order
+        """
+        self._builder.extend(commands)
+        stats = DrawingStats(self._builder.flush(), len(commands), 0)
+        self._stats = stats if self._stats is None else self._stats.combined(stats)
+
+    def stats(self, clipped_segments):
+        """
+        :param clipped_segments: int: drawn segments cut short at the canvas border
+        :return: DrawingStats: of every command extended so far
+        """
+        if self._stats is None:
+            self.extend([])
+        stats = copy.copy(self._stats)
+        stats.clipped_segments = clipped_segments
+        return stats
@@ -0,0 +1,85 @@
+import time
+
+
+class DrawBatch:
+    """
+    Abstraction for the slice of a Drawer's output produced since the previous batch
+    """
+
+    def __init__(self, commands, draw_lines, pen_up_points, pen_down_points):
+        """
+        :param commands: [BaseCommand]
+        :param draw_lines: [Line]
+        :param pen_up_points: [Point]
+        :param pen_down_points: [Point]
+        """
+        self.commands = commands
+        self.draw_lines = draw_lines
+        self.pen_up_points = pen_up_points
+        self.pen_down_points = pen_down_points
+
+    def __len__(self):
+        return (
+            len(self.commands)
+            + len(self.draw_lines)
+            + len(self.pen_up_points)
+            + len(self.pen_down_points)
+        )
+
+
+def _pending(drawer):
+    return (
+        len(drawer.commands)
+        + len(drawer.draw_lines)
+        + len(drawer.pen_up_points)
+        + len(drawer.pen_down_points)
+    )
+
+
+def drain(drawer):
+    """
+    Hand out everything the drawer has produced so far and forget it
+
+    :param drawer: Drawer
+    :return: DrawBatch
+    """
+    batch = DrawBatch(
+        commands=drawer.commands,
+        draw_lines=drawer.draw_lines,
+        pen_up_points=drawer.pen_up_points,
+        pen_down_points=drawer.pen_down_points,
+    )
+    drawer.drained_commands += len(batch.commands)
+    drawer.drained_draw_lines += len(batch.draw_lines)
+    drawer.drained_pen_points += len(batch.pen_up_points) + len(batch.pen_down_points)
+    drawer.commands = list()
+    drawer.draw_lines = list()
+    drawer.pen_up_points = list()
+    drawer.pen_down_points = list()
+    return batch
+
+
+def iter_batches(drawer, batch_size=500, max_latency=0.05):
+    """
+    Run a drawer incrementally and yield its output in bounded batches.
+
+    A batch is handed out once it holds batch_size items or max_latency seconds have passed
+    since the previous one.  The drawer's result lists are drained on every batch so a streaming
+    caller never holds the full result, which also means drawer.result is never set.
+
+    :param drawer: Drawer: a drawer that has not been parsed yet
+    :param batch_size: int: max number of commands, lines and pen points per batch
+    :param max_latency: float: max seconds to sit on produced output
+    :return: generator of DrawBatch
+    """
+    drawer.validate_parameters()
+    last_batch = time.monotonic()
+    for _ in drawer.iter_decode():
+        pending = _pending(drawer)
+        if pending >= batch_size or (
+            pending and time.monotonic() - last_batch >= max_latency
+        ):
+            yield drain(drawer)
+            last_batch = time.monotonic()
+    if _pending(drawer):
+        yield drain(drawer)
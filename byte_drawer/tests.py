@@ -1,8 +1,34 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
-from .canvas import Point, Canvas
+from .animation import PlaybackExporter
+from .archive import ArchiveReader, ArchiveWriter, write_archive
+from .budget import Budget, BudgetExceeded, CancellationToken, DrawCancelled
+from .canvas import Point, Canvas, Color, Line
 from .coders import Encoder, Decoder
+from .command import BaseCommand, MoveCommand, encode_commands
+from .drawer import Drawer
+from .geometry import AffineTransform, GeometryPipeline, PathBuilder, stroke_commands
+from .incremental import IncrementalParser, common_prefix_length
+from .memo import MoveRunCache
+from .optimizer import TravelOptimizer
 from .processor import Processor
+from .server import DrawServer
+from .profiling import DRAWING_MODULES, SamplingProfiler
+from .stats import DrawingStats, RunningStats
+from .streaming import drain, iter_batches
 
 
 class TestCoders(unittest.TestCase):
@@ -54,70 +80,1325 @@ class TestCanvas(unittest.TestCase):
             self.assertEqual(result, case[1])
 
 
+class TestInterning(unittest.TestCase):
+    def test_colors_are_shared_and_immutable(self):
+        stream = "F0A0417F41004000417FC067086708804001A0417F41004000417F804000"
+        processor = Processor(draw_input_stream=stream, display=False)
+        first, second = [
+            command.color
+            for command in processor.parser.commands
+            if command.type == "CO"
+        ]
+        self.assertIs(first, second)
+        self.assertIs(first, Color.intern(255, 128, 0, 255))
+        self.assertEqual(first, Color(255, 128, 0, 255))
+        with self.assertRaises(AttributeError):
+            first.r = 0
+
+    def test_canvas_points_are_shared(self):
+        first = Canvas(-10, 10, -10, 10)
+        second = Canvas(-10, 10, -10, 10)
+        self.assertIs(first.center_point, second.center_point)
+        for first_border, second_border in zip(first.borders, second.borders):
+            self.assertIs(first_border.start_point, second_border.start_point)
+            self.assertIs(first_border.color, second_border.color)
+
+
 class TestDrawer(unittest.TestCase):
+    examples = [
+        # green line
+        (
+            "F0A04000417F4000417FC040004000804001C05F205F20804000",
+            [
+                "CLR;",
+                "CO 0 255 0 255;",
+                "MV (0, 0);",
+                "PEN DOWN;",
+                "MV (4000, 4000);",
+                "PEN UP;",
+            ],
+        ),
+        # blue square
+        (
+            "F0A040004000417F417FC04000400090400047684F5057384000804001C05F204000400001400140400040007E405B2C4000804000",
+            [
+                "CLR;",
+                "CO 0 0 255 255;",
+                "MV (0, 0);",
+                "PEN DOWN;",
+                "MV (4000, 0) (4000, -8000) (-4000, -8000) (-4000, 0) (-500, 0);",
+                "PEN UP;",
+            ],
+        ),
+        # red clipping
+        (
+            "F0A0417F40004000417FC067086708804001C0670840004000187818784000804000",
+            [
+                "CLR;",
+                "CO 255 0 0 255;",
+                "MV (5000, 5000);",
+                "PEN DOWN;",
+                "MV (8191, 5000);",
+                "PEN UP;",
+                "MV (8191, 0);",
+                "PEN DOWN;",
+                "MV (5000, 0);",
+                "PEN UP;",
+            ],
+        ),
+        # orange diagonal clipping #NOTE modified for rounding edge cases
+        (
+            "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000",
+            [
+                "CLR;",
+                "CO 255 128 0 255;",
+                "MV (5000, 5000);",
+                "PEN DOWN;",
+                "MV (8191, 3404);",
+                "PEN UP;",
+                "MV (8191, 1595);",
+                "PEN DOWN;",
+                "MV (5000, 0);",
+                "PEN UP;",
+            ],
+        ),
+    ]
+
     def test_given_examples(self):
-        cases = [
-            # green line
-            (
-                "F0A04000417F4000417FC040004000804001C05F205F20804000",
-                [
-                    "CLR;",
-                    "CO 0 255 0 255;",
-                    "MV (0, 0);",
-                    "PEN DOWN;",
-                    "MV (4000, 4000);",
-                    "PEN UP;",
-                ],
-            ),
-            # blue square
-            (
-                "F0A040004000417F417FC04000400090400047684F5057384000804001C05F204000400001400140400040007E405B2C4000804000",
-                [
-                    "CLR;",
-                    "CO 0 0 255 255;",
-                    "MV (0, 0);",
-                    "PEN DOWN;",
-                    "MV (4000, 0) (4000, -8000) (-4000, -8000) (-4000, 0) (-500, 0);",
-                    "PEN UP;",
-                ],
-            ),
-            # red clipping
+        for case in self.examples:
+            processor = Processor(draw_input_stream=case[0], display=False)
+            self.assertEqual(processor.parser.result, case[1])
+
+
+class TestGeometry(unittest.TestCase):
+    blue_square = "F0A040004000417F417FC04000400090400047684F5057384000804001C05F204000400001400140400040007E405B2C4000804000"
+
+    def test_identity_matches_drawer(self):
+        stream = "F0A0417F40004000417FC067086708804001C0670840004000187818784000804000"
+        results = GeometryPipeline([Drawer.default_canvas]).run(arg_stream=stream)
+        processor = Processor(draw_input_stream=stream, display=False)
+        self.assertEqual(results[0].result, processor.parser.result)
+
+    def test_rotation(self):
+        transform = AffineTransform.rotation(math.pi / 2)
+        results = GeometryPipeline([Drawer.default_canvas], transform).run(
+            arg_stream=self.blue_square
+        )
+        self.assertEqual(
+            results[0].result[4],
+            "MV (0, 4000) (8000, 4000) (8000, -4000) (0, -4000) (0, -500);",
+        )
+
+    def test_multiple_canvases(self):
+        canvases = [Canvas(-100, 100, -100, 100), Canvas(0, 5000, -20000, 10000)]
+        transform = AffineTransform.translation(10, 0) @ AffineTransform.scaling(2)
+        small, tall = GeometryPipeline(canvases, transform).run(
+            arg_stream=self.blue_square
+        )
+        self.assertEqual(
+            small.result,
+            [
+                "CLR;",
+                "CO 0 0 255 255;",
+                "MV (10, 0);",
+                "PEN DOWN;",
+                "MV (100, 0);",
+                "PEN UP;",
+            ],
+        )
+        self.assertEqual(
+            tall.result[2:],
+            [
+                "MV (10, 0);",
+                "PEN DOWN;",
+                "MV (5000, 0);",
+                "PEN UP;",
+                "MV (5000, -16000);",
+                "PEN DOWN;",
+                "MV (0, -16000);",
+                "PEN UP;",
+            ],
+        )
+        self.assertEqual(len(tall.segments), 2)
+
+
+class TestStreaming(unittest.TestCase):
+    def test_batches_match_full_parse(self):
+        stream = "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000" * 20
+        processor = Processor(draw_input_stream=stream, display=False)
+
+        drawer = Drawer(arg_stream=stream)
+        batches = list(iter_batches(drawer, batch_size=8, max_latency=60))
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(
+            [command.raw_command for batch in batches for command in batch.commands],
+            processor.parser.result,
+        )
+        self.assertEqual(
+            sum(len(batch.draw_lines) for batch in batches),
+            len(processor.parser.draw_lines),
+        )
+        # everything handed out is forgotten by the drawer
+        self.assertEqual(drawer.commands, [])
+        self.assertEqual(drawer.draw_lines, [])
+
+    def test_feed_in_pieces(self):
+        stream = "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000" * 5
+        processor = Processor(draw_input_stream=stream + "C0", display=False)
+        for piece_size in [1, 2, 3, 7, 64]:
+            drawer = Drawer()
+            for index in range(0, len(stream), piece_size):
+                drawer.feed(stream[index : index + piece_size])
+            # a move op code ending the stream waits for what follows it
+            drawer.feed("C0")
+            self.assertEqual(drawer.raw_op_codes, ["C0"])
+            drawer.feed("", final=True)
+            self.assertEqual(
+                [command.raw_command for command in drawer.commands],
+                processor.parser.result,
+            )
+
+    def test_feed_resumes_move_run_scan(self):
+        step = BaseCommand.encode_bytes(10) + BaseCommand.encode_bytes(10)
+        back = BaseCommand.encode_bytes(-10) + BaseCommand.encode_bytes(-10)
+        run = "".join(
+            ["F0", "C0"] + step + ["80", "40", "01", "C0"] + (step + back) * 500
+        )
+        expected = Processor(draw_input_stream=run + "804000", display=False).parser
+
+        drawer = Drawer()
+        scanned = 0
+        for index in range(0, len(run), 30):
+            drawer.feed(run[index : index + 30])
+            scan = drawer.context.move_run_scan
+            if scan is not None:
+                # the scan carries on from where the previous piece left it
+                self.assertGreaterEqual(scan[1], scanned)
+                scanned = scan[1]
+        self.assertGreater(scanned, len(run) // 2 - 20)
+        drawer.feed("804000", final=True)
+        self.assertEqual(
+            [command.raw_command for command in drawer.commands], expected.result
+        )
+
+    def test_drain_fed_drawer(self):
+        stream = "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000" * 5
+        processor = Processor(draw_input_stream=stream, display=False)
+        drawer = Drawer()
+        commands = list()
+        for index in range(0, len(stream), 10):
+            drawer.feed(stream[index : index + 10], final=index + 10 >= len(stream))
+            commands.extend(drain(drawer).commands)
+            self.assertEqual(drawer.commands, [])
+        self.assertEqual(
+            [command.raw_command for command in commands], processor.parser.result
+        )
+
+
+class TestIncremental(unittest.TestCase):
+    green = "F0A04000417F4000417FC040004000804001C05F205F20804000"
+    orange = "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000"
+
+    def test_common_prefix_length(self):
+        self.assertEqual(common_prefix_length("abcdef", "abcxef"), 3)
+        self.assertEqual(common_prefix_length("abc", "abcdef"), 3)
+        self.assertEqual(common_prefix_length("a" * 10000, "a" * 9000 + "b", 64), 9000)
+
+    def test_edits_match_full_parse(self):
+        parser = IncrementalParser(checkpoint_interval=4)
+        stream = (self.green + self.orange) * 20
+        edits = [
+            stream,
+            stream + self.green,
+            stream[: -len(self.orange)] + self.green,
+            stream[:200] + self.orange + stream[200:],
+            self.orange + stream,
+        ]
+        for edit in edits:
+            drawer = parser.parse(edit)
+            processor = Processor(draw_input_stream=edit, display=False)
+            self.assertEqual(drawer.result, processor.parser.result)
+            self.assertEqual(
+                [str(line) for line in drawer.draw_lines],
+                [str(line) for line in processor.parser.draw_lines],
+            )
+            self.assertEqual(
+                [str(point) for point in drawer.pen_up_points],
+                [str(point) for point in processor.parser.pen_up_points],
+            )
+
+    def test_only_the_suffix_is_parsed(self):
+        parser = IncrementalParser(checkpoint_interval=4)
+        stream = (self.green + self.orange) * 20
+        parser.parse(stream)
+        parser.parse(stream + self.green)
+        # resumed at most a checkpoint interval worth of commands before the edit
+        self.assertGreater(parser.reused_op_codes, len(stream) // 2 - 4 * 9)
+        parser.parse(self.orange + stream)
+        self.assertEqual(parser.reused_op_codes, 0)
+
+
+class TestBudget(unittest.TestCase):
+    green = TestIncremental.green
+
+    def test_command_budget_reports_progress(self):
+        budget = Budget(max_commands=50, check_interval=8)
+        with self.assertRaises(BudgetExceeded) as raised:
+            Processor(draw_input_stream=self.green * 100, display=False, budget=budget)
+        self.assertEqual(raised.exception.limit, "commands")
+        progress = raised.exception.progress
+        self.assertGreater(progress.commands, 50)
+        self.assertLess(progress.op_code_pointer, progress.op_codes)
+
+    def test_input_bytes_budget(self):
+        budget = Budget(max_input_bytes=len(self.green))
+        Processor(draw_input_stream=self.green, display=False, budget=budget)
+        with self.assertRaises(BudgetExceeded) as raised:
+            Processor(draw_input_stream=self.green * 2, display=False, budget=budget)
+        self.assertEqual(raised.exception.progress.commands, 0)
+
+    def test_deadline_and_segments(self):
+        with self.assertRaises(BudgetExceeded) as raised:
+            Processor(
+                draw_input_stream=self.green * 100,
+                display=False,
+                budget=Budget(max_seconds=-1.0, check_interval=1),
+            )
+        self.assertEqual(raised.exception.limit, "time")
+        with self.assertRaises(BudgetExceeded) as raised:
+            IncrementalParser(budget=Budget(max_segments=20)).parse(self.green * 100)
+        self.assertEqual(raised.exception.limit, "segments")
+
+    def test_cancellation(self):
+        token = CancellationToken()
+        drawer = Drawer(arg_stream=self.green * 1000, cancel_token=token)
+        drawer.validate_parameters()
+        decoding = drawer.iter_decode()
+        next(decoding)
+        token.cancel()
+        with self.assertRaises(DrawCancelled) as raised:
+            for _ in decoding:
+                pass
+        self.assertLess(raised.exception.progress.commands, 1000)
+        # budget errors are runtime errors, existing callers keep catching them
+        self.assertIsInstance(raised.exception, RuntimeError)
+
+    def test_budget_within_move_run(self):
+        # one pen down run zig-zagging over 20000 points, never back at the center
+        step = BaseCommand.encode_bytes(10) + BaseCommand.encode_bytes(10)
+        back = BaseCommand.encode_bytes(-10) + BaseCommand.encode_bytes(-10)
+        stream = "".join(["F0", "C0"] + step + ["80", "40", "01", "C0"])
+        stream += "".join((step + back) * 10000)
+        budget = Budget(max_segments=100, check_interval=64)
+        with self.assertRaises(BudgetExceeded) as raised:
+            Processor(draw_input_stream=stream, display=False, budget=budget)
+        self.assertEqual(raised.exception.limit, "segments")
+        self.assertLessEqual(raised.exception.progress.segments, 100 + 64)
+
+        token = CancellationToken()
+        token.cancel()
+        drawer = Drawer(arg_stream=stream, cancel_token=token)
+        drawer.validate_parameters()
+        decoding = drawer.iter_decode()
+        with self.assertRaises(DrawCancelled) as raised:
+            for _ in decoding:
+                pass
+        self.assertLessEqual(raised.exception.progress.segments, 4)
+
+    def test_budget_counts_drained_results(self):
+        for limit, budget, stream in [
+            ("commands", Budget(max_commands=50, check_interval=8), self.green * 100),
             (
-                "F0A0417F40004000417FC067086708804001C0670840004000187818784000804000",
-                [
-                    "CLR;",
-                    "CO 255 0 0 255;",
-                    "MV (5000, 5000);",
-                    "PEN DOWN;",
-                    "MV (8191, 5000);",
-                    "PEN UP;",
-                    "MV (8191, 0);",
-                    "PEN DOWN;",
-                    "MV (5000, 0);",
-                    "PEN UP;",
-                ],
+                "segments",
+                Budget(max_segments=40, check_interval=8),
+                TestOptimizer._scattered_strokes(100),
             ),
-            # orange diagonal clipping #NOTE modified for rounding edge cases
+        ]:
+            drawer = Drawer(arg_stream=stream, budget=budget)
+            with self.assertRaises(BudgetExceeded) as raised:
+                # every batch is drained, leaving the drawer's own lists short
+                for _ in iter_batches(drawer, batch_size=5, max_latency=60):
+                    pass
+            self.assertEqual(raised.exception.limit, limit)
+            self.assertLess(len(drawer.commands), 10)
+
+    def test_trailing_move_op_code(self):
+        processor = Processor(draw_input_stream=self.green + "C0", display=False)
+        self.assertEqual(processor.parser.result[-1], "PEN UP;")
+
+
+class TestStats(unittest.TestCase):
+    orange = TestIncremental.orange
+
+    def test_clipped_drawing(self):
+        drawer = Processor(draw_input_stream=self.orange, display=False).parser
+        stats = DrawingStats.from_drawer(drawer)
+        self.assertEqual(stats.bounding_box, (5000, 0, 8191, 5000))
+        self.assertEqual(stats.segments, 2)
+        self.assertEqual(stats.clipped_segments, 2)
+        self.assertEqual(stats.commands, len(drawer.commands))
+        self.assertAlmostEqual(
+            stats.pen_down_length, math.hypot(3191, 1596) + math.hypot(3191, 1595)
+        )
+        self.assertAlmostEqual(
+            stats.pen_up_travel, math.hypot(5000, 5000) + (3404 - 1595)
+        )
+        self.assertEqual([color for color, _ in stats.ink], [Color(255, 128, 0, 255)])
+        viewport = stats.viewport()
+        self.assertLess(viewport["min_x"], 5000)
+        self.assertGreater(viewport["max_y"], 5000)
+        self.assertLess(viewport["max_x"] - viewport["min_x"], 4000)
+
+    def test_empty_drawing(self):
+        stats = DrawingStats.from_drawer(
+            Processor(draw_input_stream="F0", display=False).parser
+        )
+        self.assertEqual(stats.segments, 0)
+        self.assertEqual(stats.bounding_box, (0, 0, 0, 0))
+        self.assertEqual(stats.viewport()["max_x"] - stats.viewport()["min_x"], 20)
+
+    def test_batches_match_whole_drawing(self):
+        stream = (TestIncremental.green + self.orange) * 50
+        drawer = Processor(draw_input_stream=stream, display=False).parser
+        builder = PathBuilder(drawer.canvas)
+        for start in range(0, len(drawer.commands), 7):
+            builder.extend(drawer.commands[start : start + 7])
+        batched = DrawingStats(
+            builder.build(), builder.commands, drawer.clipped_segments
+        )
+        self.assertEqual(batched.as_dict(), DrawingStats.from_drawer(drawer).as_dict())
+
+    def test_running_stats_match_whole_drawing(self):
+        for stream in [
+            (TestIncremental.green + self.orange) * 50,
+            self.orange,
+            "F0",
+        ]:
+            drawer = Processor(draw_input_stream=stream, display=False).parser
+            whole = DrawingStats.from_drawer(drawer)
+            for size in [1, 7, len(drawer.commands)]:
+                running = RunningStats(drawer.canvas)
+                for start in range(0, len(drawer.commands), size):
+                    running.extend(drawer.commands[start : start + size])
+                stats = running.stats(drawer.clipped_segments)
+                self.assertEqual(stats.bounding_box, whole.bounding_box)
+                self.assertTrue(
+                    all(isinstance(value, int) for value in stats.bounding_box)
+                )
+                self.assertEqual(
+                    (stats.segments, stats.pen_up_moves, stats.commands),
+                    (whole.segments, whole.pen_up_moves, whole.commands),
+                )
+                self.assertAlmostEqual(stats.pen_down_length, whole.pen_down_length)
+                self.assertAlmostEqual(stats.pen_up_travel, whole.pen_up_travel)
+                self.assertEqual(
+                    [color for color, _ in stats.ink], [color for color, _ in whole.ink]
+                )
+
+
+class TestOptimizer(unittest.TestCase):
+    @staticmethod
+    def _scattered_strokes(count):
+        """
+        Short strokes on a grid, visited in a scrambled order
+        """
+        op_codes = ["F0"]
+        x, y = 0, 0
+        for index in range(count):
+            cell = (index * 37) % count
+            start_x, start_y = (cell % 10) * 500 - 2500, (cell // 10) * 500 - 2500
+            op_codes += ["C0"] + BaseCommand.encode_bytes(start_x - x)
+            op_codes += BaseCommand.encode_bytes(start_y - y)
+            op_codes += ["80", "40", "01", "C0"]
+            op_codes += BaseCommand.encode_bytes(100) + BaseCommand.encode_bytes(50)
+            op_codes += ["80", "40", "00"]
+            x, y = start_x + 100, start_y + 50
+        return "".join(op_codes)
+
+    @staticmethod
+    def _segments(drawer):
+        return sorted(
             (
-                "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000",
-                [
-                    "CLR;",
-                    "CO 255 128 0 255;",
-                    "MV (5000, 5000);",
-                    "PEN DOWN;",
-                    "MV (8191, 3404);",
-                    "PEN UP;",
-                    "MV (8191, 1595);",
-                    "PEN DOWN;",
-                    "MV (5000, 0);",
-                    "PEN UP;",
-                ],
-            ),
+                tuple(sorted([str(line.start_point), str(line.finish_point)])),
+                str(line.color),
+            )
+            for line in drawer.draw_lines
+        )
+
+    def test_encode_commands_round_trip(self):
+        for stream in [TestIncremental.green, self._scattered_strokes(20)]:
+            drawer = Processor(draw_input_stream=stream, display=False).parser
+            self.assertEqual(
+                encode_commands(drawer.commands, Canvas.center_point), stream
+            )
+
+    def test_long_moves_are_split(self):
+        op_codes = MoveCommand([Point(8000, 10), Point(0, 0), Point(5, 5)]).op_codes(
+            Point(-8000, 0)
+        )
+        start = BaseCommand.encode_bytes(-8000) + BaseCommand.encode_bytes(0)
+        drawer = Processor(
+            draw_input_stream="F0C0" + "".join(start) + "804000" + "".join(op_codes),
+            display=False,
+        ).parser
+        self.assertEqual(
+            drawer.result[-2:], ["MV (0, 5) (8000, 10) (0, 0);", "MV (5, 5);"]
+        )
+        commands = [MoveCommand([Point(-8000, 0)]), MoveCommand([Point(8000, 10)])]
+        drawer = Processor(
+            draw_input_stream="F0" + encode_commands(commands, Canvas.center_point),
+            display=False,
+        ).parser
+        self.assertEqual(drawer.result[-1], "MV (-8000, 0) (0, 5) (8000, 10);")
+
+    def test_reordering_cuts_travel(self):
+        stream = self._scattered_strokes(100)
+        drawer = Processor(draw_input_stream=stream, display=False).parser
+        for optimizer in [TravelOptimizer(), TravelOptimizer(reverse=False)]:
+            plan = optimizer.optimize(drawer)
+            self.assertEqual(plan.strokes, 100)
+            self.assertLess(plan.travel_after, plan.travel_before / 2)
+            replayed = Processor(draw_input_stream=plan.op_stream, display=False).parser
+            self.assertEqual(replayed.result, plan.result)
+            self.assertEqual(self._segments(replayed), self._segments(drawer))
+
+    def test_optimize_time_at_scale(self):
+        # parsing this many strokes dwarfs the optimizer, so hand it their commands directly
+        count = 100000
+        polylines = list()
+        for index in range(count):
+            cell = (index * 7919) % count
+            x, y = (cell % 316) * 25 - 4000, (cell // 316) * 25 - 4000
+            polylines.append([Point(x, y), Point(x + 10, y + 5), Point(x + 20, y)])
+        drawer = Drawer()
+        drawer.commands = stroke_commands(
+            polylines, [0] * count, [Canvas.default_color]
+        )
+        started = time.perf_counter()
+        plan = TravelOptimizer().optimize(drawer)
+        self.assertLess(time.perf_counter() - started, 15.0)
+        self.assertEqual(plan.strokes, count)
+        self.assertLess(plan.travel_after, plan.travel_before / 10)
+        self.assertEqual(plan.op_stream.count("804001"), count)
+
+    def test_drawing_without_strokes(self):
+        pen_up = "".join(
+            ["F0", "C0"] + BaseCommand.encode_bytes(100) + BaseCommand.encode_bytes(50)
+        )
+        for stream in ["F0", "F0F0", pen_up]:
+            drawer = Processor(draw_input_stream=stream, display=False).parser
+            for optimizer in [TravelOptimizer(), TravelOptimizer(reverse=False)]:
+                plan = optimizer.optimize(drawer)
+                self.assertEqual(plan.strokes, 0)
+                self.assertEqual(plan.travel_after, 0.0)
+                self.assertEqual(plan.result, [])
+
+
+def _gil_enabled():
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+class TestConcurrency(unittest.TestCase):
+    streams = [
+        TestIncremental.green * 40,
+        TestIncremental.orange * 40,
+        TestOptimizer._scattered_strokes(100),
+        (TestIncremental.green + TestIncremental.orange) * 20,
+    ]
+
+    def test_shared_drawer_matches_sequential(self):
+        expected = [
+            Processor(draw_input_stream=stream, display=False).parser.result
+            for stream in self.streams
         ]
+        contexts = Processor.draw_streams(self.streams * 25, max_workers=8)
+        self.assertEqual([context.result for context in contexts], expected * 25)
+        # every context has its own copy of the shared canvas borders
+        self.assertIsNot(contexts[0].draw_lines, contexts[4].draw_lines)
+        self.assertEqual(
+            [str(line) for line in contexts[0].draw_lines[:4]],
+            [str(line) for line in Drawer.default_canvas.borders],
+        )
 
-        for case in cases:
-            processor = Processor(draw_input_stream=case[0], display=False)
-            self.assertEqual(processor.parser.result, case[1])
+    @staticmethod
+    def _snapshot(drawer):
+        return (
+            drawer.result,
+            [str(line) for line in drawer.draw_lines],
+            [str(point) for point in drawer.pen_down_points],
+            [str(point) for point in drawer.pen_up_points],
+        )
+
+    def test_threads_drawing_at_once(self):
+        # runs on every build, the GIL still hands threads over mid-parse
+        glyph = TestMoveCache._moves(30, 0, 0, 40, -30, 0, 0, -40, 15, 20)
+        streams = list(self.streams)
+        for step in [(300, 200), (-700, 100), (50, -900)]:
+            stamps = "804000" + TestMoveCache._moves(*step) + "804001" + glyph
+            streams.append("F0A04000417F4000417F" + stamps * 12 + "804000")
+        expected = [
+            self._snapshot(Drawer(move_cache=MoveRunCache(max_entries=0)).draw(stream))
+            for stream in streams
+        ]
+
+        # one drawer and move cache shared by every thread, as the web app's DRAWER is
+        drawer = Drawer(budget=Budget(max_commands=500000), move_cache=MoveRunCache())
+        threads_per_stream = 3
+        barrier = threading.Barrier(len(streams) * threads_per_stream)
+        snapshots = [list() for _ in range(len(streams) * threads_per_stream)]
+        errors = list()
+
+        def draw(index):
+            try:
+                barrier.wait()
+                for _ in range(4):
+                    stream = streams[index % len(streams)]
+                    snapshots[index].append(self._snapshot(drawer.draw(stream)))
+            except Exception as err:
+                errors.append(err)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            threads = [
+                threading.Thread(target=draw, args=(index,))
+                for index in range(len(snapshots))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(errors, [])
+        for index, drawn in enumerate(snapshots):
+            self.assertEqual(drawn, [expected[index % len(streams)]] * 4)
+        self.assertGreater(drawer.move_cache.hits, 0)
+
+    def test_shared_incremental_parser(self):
+        parser = IncrementalParser(checkpoint_interval=4)
+        errors = list()
+
+        def edit(offset):
+            try:
+                for index in range(20):
+                    # edits appending to and replacing each other's streams
+                    stream = self.streams[index % len(self.streams)]
+                    stream += self.streams[(offset + index) % len(self.streams)]
+                    expected = Processor(draw_input_stream=stream, display=False)
+                    self.assertEqual(
+                        parser.parse(stream).result, expected.parser.result
+                    )
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=edit, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_shared_state_is_immutable(self):
+        with self.assertRaises(AttributeError):
+            Canvas.center_point.x = 1
+        with self.assertRaises(AttributeError):
+            Drawer.default_canvas.max_x = 0
+
+    @unittest.skipIf(_gil_enabled(), "threads only scale on a free-threaded build")
+    def test_throughput_scales_with_threads(self):
+        streams = self.streams * 50
+
+        def throughput(workers):
+            started = time.perf_counter()
+            Processor.draw_streams(streams, max_workers=workers)
+            return len(streams) / (time.perf_counter() - started)
+
+        self.assertGreater(throughput(4), 1.5 * throughput(1))
+
+
+class TestMoveCache(unittest.TestCase):
+    @staticmethod
+    def _moves(*deltas):
+        return "C0" + "".join(
+            "".join(BaseCommand.encode_bytes(delta)) for delta in deltas
+        )
+
+    def _drawers(self, stream, cache):
+        cached = Drawer(arg_stream=stream, move_cache=cache)
+        cached.parse()
+        plain = Drawer(arg_stream=stream, move_cache=MoveRunCache(max_entries=0))
+        plain.parse()
+        self.assertEqual(cached.result, plain.result)
+        for name in ["draw_lines", "pen_down_points", "pen_up_points"]:
+            self.assertEqual(
+                [str(item) for item in getattr(cached, name)],
+                [str(item) for item in getattr(plain, name)],
+            )
+        return cached
+
+    def test_stamped_motif(self):
+        glyph = self._moves(30, 0, 0, 40, -30, 0, 0, -40, 15, 20)
+        # first decoded with the pen up, the pen down stamps reuse it all the same
+        stream = "F0A04000417F4000417F" + self._moves(-500, -500) + "804000" + glyph
+        for x, y in [(600, 600), (-2000, 300), (4000, -4000), (6040, 0)]:
+            stream += "804000" + self._moves(x, y) + "804001" + glyph
+        cache = MoveRunCache()
+        self._drawers(stream + "804000", cache)
+        # the glyph is decoded once, the last stamp runs off the canvas so the checked path
+        # decodes it again and only the other stamps count as hits
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 7)
+
+    def test_run_reaching_the_center(self):
+        glyph = self._moves(10, 10, -10, -10, 5, 5)
+        stream = "F0" + self._moves(100, 100) + "804000" + glyph + "804000F0" + glyph
+        self._drawers(stream + "804000", MoveRunCache())
+
+    def test_clipping_examples(self):
+        clear_and_stamp = "804000F0" + self._moves(100, 100, 50, 50) + "804000"
+        for stream, _ in TestDrawer.examples:
+            for suffix in ["", clear_and_stamp, clear_and_stamp * 2]:
+                self._drawers(stream + suffix, MoveRunCache())
+        # a clipped stroke leaves the drawer marked out of bounds, even across a clear
+        stream = (
+            "F0"
+            + self._moves(5000, 5000)
+            + "804001"
+            + self._moves(5000, 0)
+            + clear_and_stamp
+            + clear_and_stamp
+        )
+        drawer = self._drawers(stream, MoveRunCache())
+        self.assertNotIn("MV (100, 100) (150, 150);", drawer.result)
+
+    def test_eviction(self):
+        cache = MoveRunCache(max_entries=2)
+        stream = "F0" + "804000".join(
+            self._moves(step, step) for step in [1, 2, 3, 1, 2, 3]
+        )
+        self._drawers(stream, cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(cache.evictions, 4)
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profile_a_drawing(self):
+        stream = TestOptimizer._scattered_strokes(100) * 20
+        switch_interval = sys.getswitchinterval()
+        profiler = SamplingProfiler(interval=0.0005)
+        processor = profiler.run(Processor, draw_input_stream=stream, display=False)
+        # process wide, so profiling leaves it to the other threads as it is
+        self.assertEqual(profiler.run(sys.getswitchinterval), switch_interval)
+        self.assertEqual(sys.getswitchinterval(), switch_interval)
+        self.assertTrue(processor.parser.result)
+        self.assertGreater(profiler.samples, 0)
+
+        lines = profiler.collapsed().splitlines()
+        self.assertEqual(
+            sum(int(line.rsplit(" ", 1)[1]) for line in lines), profiler.samples
+        )
+        # stacks start at the profiled call
+        self.assertTrue(
+            all(line.startswith("byte_drawer.processor:Processor.") for line in lines)
+        )
+        top = profiler.top(5)
+        self.assertTrue(top)
+        for label, own, total in top:
+            self.assertIn(label.split(":")[0], DRAWING_MODULES)
+            self.assertLessEqual(own, total)
+        self.assertIn("samples every", profiler.table())
+
+    def test_context_manager(self):
+        with SamplingProfiler(max_samples=3) as profiler:
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline and profiler.samples < 3:
+                sum(range(1000))
+        self.assertEqual(profiler.samples, 3)
+        self.assertEqual(profiler.top(modules=DRAWING_MODULES), [])
+
+
+class TestServer(unittest.TestCase):
+    stream = (TestIncremental.green + TestIncremental.orange) * 3
+
+    @staticmethod
+    def _max_connections(wanted):
+        try:
+            import resource
+        except ImportError:
+            return wanted
+        # every loopback connection takes a descriptor on both ends
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        return min(wanted, (soft_limit - 64) // 2)
+
+    @staticmethod
+    async def _client(port, data, chunk_size=17):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for index in range(0, len(data), chunk_size):
+            writer.write(data[index : index + chunk_size])
+            await writer.drain()
+        writer.write_eof()
+        response = await reader.read()
+        writer.close()
+        return response.decode("ascii").splitlines()
+
+    def _serve(self, clients, **kwargs):
+        async def main():
+            server = DrawServer(**kwargs)
+            await server.start()
+            try:
+                return await asyncio.gather(
+                    *[client(server.port) for client in clients]
+                )
+            finally:
+                server.close()
+
+        return asyncio.run(main())
+
+    def test_concurrent_streams(self):
+        expected = Processor(draw_input_stream=self.stream, display=False).parser.result
+        count = self._max_connections(1000)
+        responses = self._serve(
+            [lambda port: self._client(port, self.stream.encode("ascii"))] * count
+        )
+        self.assertEqual(len(responses), count)
+        for response in responses:
+            self.assertEqual(response, expected)
+
+        responses = self._serve(
+            [lambda port: self._client(port, bytes.fromhex(self.stream))] * 10,
+            binary=True,
+        )
+        self.assertEqual(responses, [expected] * 10)
+
+    def test_limits(self):
+        async def idle(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"F0A040")
+            response = await reader.read()
+            writer.close()
+            return response.decode("ascii").splitlines()
+
+        unending_run = ("F0C0" + "4000" * 100).encode("ascii")
+        # 68 characters of text, but each buffered op code takes a list slot
+        short_run = ("F0C0" + "40014001" * 8).encode("ascii")
+        responses = self._serve(
+            [
+                idle,
+                lambda port: self._client(port, unending_run, len(unending_run)),
+                lambda port: self._client(port, short_run, len(short_run)),
+            ],
+            idle_timeout=0.2,
+            max_buffer_bytes=256,
+        )
+        self.assertEqual(
+            responses,
+            [
+                ["CLR;", "ERROR idle timeout"],
+                ["CLR;", "ERROR buffer limit exceeded"],
+                ["CLR;", "ERROR buffer limit exceeded"],
+            ],
+        )
+
+    def test_op_codes_are_shared(self):
+        drawer = Drawer()
+        drawer.feed("F0C0" + "40014001" * 10)
+        forties = [op_code for op_code in drawer.raw_op_codes if op_code == "40"]
+        self.assertEqual(len(forties), 20)
+        self.assertTrue(all(op_code is forties[0] for op_code in forties))
+
+
+class TestArchive(unittest.TestCase):
+    streams = [
+        TestIncremental.green,
+        (TestIncremental.green + TestIncremental.orange) * 30,
+        TestOptimizer._scattered_strokes(60),
+        # unknown op codes, lower case, a trailing move and an odd length survive verbatim
+        TestIncremental.green + "ZZc0F0C0",
+        TestIncremental.orange + "7",
+    ]
+
+    def _archive(self, stream, **kwargs):
+        archive = io.BytesIO()
+        write_archive(stream, archive, **kwargs)
+        return ArchiveReader(archive.getvalue())
+
+    def test_round_trip(self):
+        for codec in ["zlib", "lzma"]:
+            for stream in self.streams:
+                reader = self._archive(stream, block_op_codes=32, codec=codec)
+                self.assertEqual(reader.read_stream(), stream)
+                self.assertEqual(reader.read_stream(max_workers=1), stream)
+
+    def test_block_ranges(self):
+        stream = self.streams[1]
+        reader = self._archive(stream, block_op_codes=32)
+        self.assertGreater(len(reader), 4)
+        start, stop = reader.blocks[1], reader.blocks[4]
+        self.assertEqual(
+            reader.read_stream(1, 4),
+            stream[start.op_code_pointer * 2 : stop.op_code_pointer * 2],
+        )
+
+    def test_blocks_draw_on_their_own(self):
+        for stream in self.streams:
+            reader = self._archive(stream, block_op_codes=32)
+            processor = Processor(draw_input_stream=stream, display=False)
+            self.assertEqual(
+                [command.raw_command for command in reader.read_commands()],
+                processor.parser.result,
+            )
+            # the index knows how many commands came before each block
+            for number, entry in enumerate(reader.blocks[1:], 1):
+                self.assertEqual(
+                    [c.raw_command for c in reader.read_commands(number, number + 1)],
+                    processor.parser.result[entry.commands :][
+                        : len(reader.read_block_commands(number))
+                    ],
+                )
+
+    def test_palette_and_file(self):
+        stream = self.streams[1]
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, "drawing.bda")
+            ArchiveWriter(codec="lzma").write(stream, name)
+            with ArchiveReader(name) as reader:
+                self.assertEqual(reader.codec, "lzma")
+                self.assertEqual(len(reader.palette), 2)
+                self.assertEqual(reader.read_stream(), stream)
+
+    def test_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            ArchiveWriter(codec="zip")
+        with self.assertRaises(ValueError):
+            ArchiveReader(b"not an archive at all, not even close to one")
+
+
+class TestAnimation(unittest.TestCase):
+    # blue square followed by the orange clipping example
+    stream = (
+        "F0A040004000417F417FC04000400090400047684F5057384000804001C05F204000400001400140400040007E405B2C4000804000"
+        "F0A0417F41004000417FC067086708804001C067082C3C18782C3C804000"
+    )
+
+    def setUp(self):
+        self.drawer = Processor(draw_input_stream=self.stream, display=False).parser
+
+    def test_frames_are_incremental(self):
+        exporter = PlaybackExporter(self.drawer, width=101, height=101)
+        frames = list(exporter.frames())
+        self.assertEqual(len(frames), len(self.drawer.commands))
+        self.assertEqual(frames[0].pixels.shape, (101, 101))
+        # the blue square is drawn in one command below the canvas center
+        square = frames[4]
+        self.assertEqual((square.left, square.top), (26, 50))
+        self.assertEqual(square.pixels.shape, (50, 49))
+        # the orange line's clipped halves only cover the right edge
+        self.assertEqual((frames[10].left, frames[10].top), (81, 19))
+        self.assertEqual(frames[10].pixels.shape, (11, 20))
+        # commands that draw nothing encode a single pixel
+        self.assertEqual(frames[1].pixels.shape, (1, 1))
+
+    def test_export_formats(self):
+        exporter = PlaybackExporter(
+            self.drawer, width=64, height=48, fps=5, commands_per_frame=4
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            gif = os.path.join(directory, "playback.gif")
+            self.assertEqual(exporter.export(gif), 4)
+            with open(gif, "rb") as file:
+                data = file.read()
+            self.assertEqual(data[:6], b"GIF89a")
+            self.assertEqual(struct.unpack("<HH", data[6:10]), (64, 48))
+            self.assertEqual(data.count(b"\x21\xf9\x04"), 4)
+            self.assertEqual(data[-1:], b"\x3b")
+
+            apng = os.path.join(directory, "playback.png")
+            self.assertEqual(exporter.export(apng), 4)
+            with open(apng, "rb") as file:
+                data = file.read()
+            actl = data.index(b"acTL")
+            self.assertEqual(struct.unpack(">II", data[actl + 4 : actl + 12]), (4, 0))
+            self.assertEqual(data.count(b"fdAT"), 3)
+
+            frames = os.path.join(directory, "frames")
+            self.assertEqual(exporter.export(frames), 4)
+            self.assertEqual(len(os.listdir(frames)), 4)
+
+    def test_quantized_palette(self):
+        stream = "F0"
+        for shade in range(0, 250, 25):
+            stream += "A0"
+            for value in (shade, 0, 255 - shade, 255):
+                stream += "".join(BaseCommand.encode_bytes(value))
+            stream += "C040104010804001C040104010804000"
+        drawer = Processor(draw_input_stream=stream, display=False).parser
+
+        exporter = PlaybackExporter(drawer, max_colors=9)
+        self.assertEqual(len(exporter.palette), 9)
+        self.assertEqual(exporter.palette[exporter.segment_colors[0]], (0, 0, 255))
+        self.assertEqual(exporter.palette[exporter.segment_colors[-1]], (255, 0, 0))
+
+        exporter = PlaybackExporter(drawer)
+        self.assertEqual(len(exporter.palette), 12)
+
+
+class TestApp(unittest.TestCase):
+    """
+    The web app lives beside the package, these run when it and Flask are importable
+    """
+
+    red = "F0A0417F40004000417FC067086708804001C0670840004000187818784000804000"
+
+    @classmethod
+    def setUpClass(cls):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if root not in sys.path:
+            sys.path.insert(0, root)
+        try:
+            import app
+        except ImportError as err:
+            raise unittest.SkipTest("web app unavailable: {}".format(err))
+        cls.app = app
+        cls.client = app.app.test_client()
+
+    def test_draw_not_modified(self):
+        first = self.client.get("/draw", query_string={"bytes": self.red})
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+        self.assertIn("public", first.headers["Cache-Control"])
+        self.assertNotIn("Set-Cookie", first.headers)
+
+        again = self.client.get(
+            "/draw", query_string={"bytes": self.red}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], etag)
+        self.assertEqual(again.data, b"")
+        # caches pick the stored variant from Vary, so a 304 must vary on the same headers
+        self.assertEqual(set(again.vary), set(first.vary))
+        self.assertEqual(set(first.vary), {"Accept-Encoding"})
+
+        other = self.client.get(
+            "/draw",
+            query_string={"bytes": self.red + "F0"},
+            headers={"If-None-Match": etag},
+        )
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other.headers["ETag"], etag)
+
+    def test_etag_tracks_rendering(self):
+        # what the drawings render as under each RENDER_FORMAT, a change here needs a bump
+        # of app.RENDER_FORMAT too or caches keep serving the old rendering
+        rendered = {
+            1: "c80bc7f6ebb802386662ddec6227cf3cb782fd5d623f92ecc9bc8150cf73a240"
+        }
+        digest = hashlib.sha256()
+        with open(
+            os.path.join(self.app.app.root_path, "templates", "index.html"), "rb"
+        ) as file:
+            digest.update(file.read())
+        for stream in [self.red] + [stream for stream, _ in TestDrawer.examples]:
+            drawing = self.app._drawing(stream)
+            digest.update(json.dumps(drawing, sort_keys=True).encode("utf-8"))
+        self.assertEqual(
+            rendered.get(self.app.RENDER_FORMAT),
+            digest.hexdigest(),
+            "rendering changed, bump app.RENDER_FORMAT and pin the new digest",
+        )
+
+        etag = self.app._stream_etag(self.red)
+        render_format = self.app.RENDER_FORMAT
+        self.app.RENDER_FORMAT = render_format + 1
+        try:
+            self.assertNotEqual(self.app._stream_etag(self.red), etag)
+        finally:
+            self.app.RENDER_FORMAT = render_format
+
+    def test_draw_gzip_variant(self):
+        plain = self.client.get("/draw", query_string={"bytes": self.red})
+        compressed = self.client.get(
+            "/draw",
+            query_string={"bytes": self.red},
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(
+            compressed.headers["ETag"],
+            plain.headers["ETag"][:-1] + self.app.GZIP_ETAG_SUFFIX + '"',
+        )
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertEqual(set(compressed.vary), set(plain.vary))
+
+        again = self.client.get(
+            "/draw",
+            query_string={"bytes": self.red},
+            headers={
+                "Accept-Encoding": "gzip",
+                "If-None-Match": compressed.headers["ETag"],
+            },
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], compressed.headers["ETag"])
+        self.assertEqual(set(again.vary), set(compressed.vary))
+
+    def test_draw_error_is_not_cached(self):
+        response = self.client.get("/draw", query_string={"bytes": "80008001C04000"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response.headers)
+        self.assertNotIn("public", response.headers.get("Cache-Control", ""))
+        self.assertIn(b"PEN DOWN before setting an initial point", response.data)
+
+    def _batch_lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        return [json.loads(line) for line in response.get_data().splitlines()]
+
+    def test_batch_ndjson(self):
+        count = self.app.BATCH_WINDOW * 2 + 3
+        # later items draw less, so they tend to finish first and have to wait their turn
+        items = [
+            json.dumps(
+                {"id": "item-{}".format(index), "bytes": self.red * (count - index)}
+            )
+            for index in range(count)
+        ]
+        items += ['"{}"'.format(self.red), "", "[1]", "not json", '"80008001C04000"']
+        response = self.client.post(
+            "/api/draw/batch",
+            data="\n".join(items) + "\n",
+            content_type="application/x-ndjson",
+        )
+        lines = self._batch_lines(response)
+        self.assertEqual([line["index"] for line in lines], list(range(count + 4)))
+        self.assertEqual(
+            [line["id"] for line in lines[:count]],
+            ["item-{}".format(index) for index in range(count)],
+        )
+        expected = self.app.DRAWER.draw(self.red).result
+        self.assertEqual(lines[count - 1]["commands"], expected)
+        self.assertEqual(lines[count]["commands"], expected)
+        self.assertIsNone(lines[count]["id"])
+        self.assertEqual(lines[count]["stats"]["segments"], 2)
+        self.assertIn("bytes string", lines[count + 1]["error"])
+        self.assertEqual(lines[count + 2]["error"], "item is not valid JSON")
+        self.assertIn("PEN DOWN", lines[count + 3]["error"])
+        self.assertNotIn("commands", lines[count + 3])
+
+    def test_batch_upload(self):
+        response = self.client.post(
+            "/api/draw/batch",
+            data={
+                "streams": [
+                    (io.BytesIO(self.red.encode("ascii") + b"\n"), "red.hex"),
+                    (io.BytesIO(b"\xff\xfe"), "binary.bin"),
+                    (io.BytesIO(b"F0"), "clear.hex"),
+                ]
+            },
+            content_type="multipart/form-data",
+        )
+        lines = self._batch_lines(response)
+        self.assertEqual(
+            [line["id"] for line in lines], ["red.hex", "binary.bin", "clear.hex"]
+        )
+        self.assertEqual(lines[0]["commands"], self.app.DRAWER.draw(self.red).result)
+        self.assertEqual(lines[1]["error"], "file is not UTF-8 text")
+        self.assertEqual(lines[2]["commands"], ["CLR;"])
+
+    def test_batch_results_do_not_wait_for_input(self):
+        class StalledBody(io.RawIOBase):
+            """
+            Sends one item then holds the body open, like a client still producing its batch
+            """
+
+            def __init__(self):
+                self.parts = [json.dumps(TestApp.red).encode("ascii") + b"\n"]
+                self.release = threading.Event()
+                self.ended = False
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                if self.parts:
+                    part = self.parts.pop()
+                    buffer[: len(part)] = part
+                    return len(part)
+                self.release.wait(5)
+                self.ended = True
+                return 0
+
+        body = StalledBody()
+        response = self.client.post(
+            "/api/draw/batch",
+            content_type="application/x-ndjson",
+            buffered=False,
+            environ_overrides={
+                "wsgi.input": io.BufferedReader(body),
+                "wsgi.input_terminated": True,
+            },
+        )
+        try:
+            lines = iter(response.response)
+            first = json.loads(next(lines))
+            self.assertFalse(body.ended)
+            self.assertEqual(first["commands"], self.app.DRAWER.draw(self.red).result)
+            body.release.set()
+            self.assertEqual(list(lines), [])
+        finally:
+            body.release.set()
+            response.close()
+
+    def test_line_traces(self):
+        red, blue = Color(255, 0, 0, 255), Color(0, 0, 255, 255)
+        lines = [
+            Line(Point(0, 0), Point(1, 1), red),
+            Line(Point(5, 5), Point(6, 6), blue),
+            Line(Point(1, 1), Point(2, 0), red),
+            Line(Point(9, 9), Point(8, 8), red),
+        ]
+        self.assertEqual(
+            self.app._line_traces(lines),
+            {
+                "rgba(255, 0, 0, 1)": {
+                    "x": [0, 1, 2, None, 9, 8],
+                    "y": [0, 1, 0, None, 9, 8],
+                },
+                "rgba(0, 0, 255, 1)": {"x": [5, 6], "y": [5, 6]},
+            },
+        )
+        self.assertEqual(self.app._line_traces([]), {})
+
+    def _events(self, bytes):
+        response = self.client.post("/stream", data={"bytes": bytes})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        body = response.get_data(as_text=True)
+        # every event is an event and a data line closed by a blank line
+        self.assertTrue(body.endswith("\n\n"))
+        events = list()
+        for frame in body[:-2].split("\n\n"):
+            event, data = frame.split("\n")
+            self.assertTrue(event.startswith("event: "))
+            self.assertTrue(data.startswith("data: "))
+            events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+        return events
+
+    def test_stream_events(self):
+        stream = TestOptimizer._scattered_strokes(100)
+        drawer = self.app.DRAWER.draw(stream)
+        batch_size = self.app.STREAM_BATCH_SIZE
+        self.app.STREAM_BATCH_SIZE = 50
+        try:
+            events = self._events(stream)
+        finally:
+            self.app.STREAM_BATCH_SIZE = batch_size
+
+        names = [name for name, _ in events]
+        self.assertGreater(names.count("batch"), 2)
+        self.assertEqual(names[-2:], ["stats", "done"])
+        self.assertEqual(set(names[:-2]), {"batch"})
+        batches = [data for name, data in events if name == "batch"]
+        self.assertEqual(
+            [command for batch in batches for command in batch["commands"]],
+            drawer.result,
+        )
+        for batch in batches:
+            self.assertTrue(batch["commands"] or batch["lines"])
+            for points in [batch["pen_up_points"], batch["pen_down_points"]]:
+                self.assertEqual(len(points["x"]), len(points["y"]))
+        # lines split across batches come back together as the whole drawing's
+        segments = 0
+        for batch in batches:
+            for trace in batch["lines"].values():
+                self.assertEqual(len(trace["x"]), len(trace["y"]))
+                segments += sum(
+                    1
+                    for start, end in zip(trace["x"], trace["x"][1:])
+                    if start is not None and end is not None
+                )
+        self.assertEqual(segments, len(drawer.draw_lines))
+
+        stats = events[-2][1]["stats"]
+        expected = json.loads(json.dumps(DrawingStats.from_drawer(drawer).as_dict()))
+        for name in ["bounding_box", "segments", "pen_up_moves", "commands"]:
+            self.assertEqual(stats[name], expected[name])
+        self.assertAlmostEqual(stats["pen_down_length"], expected["pen_down_length"])
+        self.assertIn("min_x", events[-2][1]["canvas_range"])
+        self.assertEqual(events[-1][1], {})
+
+    def test_stream_budget(self):
+        budget, batch_size = self.app.DRAW_BUDGET, self.app.STREAM_BATCH_SIZE
+        self.app.DRAW_BUDGET = Budget(max_commands=50, check_interval=8)
+        # batches smaller than the budget, so it is only hit counting drained commands
+        self.app.STREAM_BATCH_SIZE = 5
+        try:
+            events = self._events(TestIncremental.green * 100)
+        finally:
+            self.app.DRAW_BUDGET, self.app.STREAM_BATCH_SIZE = budget, batch_size
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("commands budget", events[-1][1]["message"])
+        self.assertNotIn("done", [name for name, _ in events])
+
+    def test_stream_error_event(self):
+        events = self._events("80008001C04000")
+        self.assertEqual([name for name, _ in events], ["error"])
+        self.assertIn("PEN DOWN", events[0][1]["message"])
+
+
+class TestImportTime(unittest.TestCase):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def _imported_modules(self, *args):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime"] + list(args),
+            cwd=self.root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        return {
+            line.rsplit("|", 1)[-1].strip()
+            for line in completed.stderr.splitlines()
+            if line.startswith("import time:")
+        }
+
+    def test_package_import_is_lazy(self):
+        modules = self._imported_modules("-c", "import byte_drawer")
+        self.assertIn("byte_drawer", modules)
+        for heavy in ["unittest", "numpy", "byte_drawer.tests", "byte_drawer.geometry"]:
+            self.assertNotIn(heavy, modules)
+
+    def test_cli_encode_skips_argparse(self):
+        modules = self._imported_modules("byte-drawer.py", "--encode", "6111")
+        self.assertIn("byte_drawer.drawer", modules)
+        for heavy in ["argparse", "unittest", "numpy"]:
+            self.assertNotIn(heavy, modules)
+
+
+class TestCli(unittest.TestCase):
+    root = TestImportTime.root
+
+    def test_serve_stdin_survives_errors(self):
+        completed = subprocess.run(
+            [sys.executable, "byte-drawer.py", "--serve-stdin"],
+            cwd=self.root,
+            input="--draw-stream C04000400080\n--draw-file /missing\n--encode 6111\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=60,
+        )
+        self.assertEqual(completed.returncode, 0)
+        answers = completed.stdout.split("\n\n")
+        self.assertEqual(answers[-1], "")
+        self.assertEqual(len(answers), 4)
+        self.assertTrue(answers[0].startswith("AttributeError: "))
+        self.assertTrue(answers[1].startswith("FileNotFoundError: "))
+        self.assertEqual(answers[2], "encoded 6111 -> 0x6f5f")
 
 
 class TestRunner(object):
@@ -125,7 +1406,27 @@ class TestRunner(object):
         loader = unittest.TestLoader()
         tests = [
             loader.loadTestsFromTestCase(test)
-            for test in [TestCoders, TestCanvas, TestDrawer]
+            for test in [
+                TestCoders,
+                TestCanvas,
+                TestInterning,
+                TestDrawer,
+                TestGeometry,
+                TestStreaming,
+                TestIncremental,
+                TestBudget,
+                TestStats,
+                TestOptimizer,
+                TestConcurrency,
+                TestMoveCache,
+                TestProfiling,
+                TestServer,
+                TestArchive,
+                TestAnimation,
+                TestApp,
+                TestImportTime,
+                TestCli,
+            ]
         ]
         suite = unittest.TestSuite(tests)
         runner = unittest.TextTestRunner(verbosity=2)